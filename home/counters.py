@@ -0,0 +1,104 @@
+# home/counters.py
+import hashlib
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Inventory
+from .services import EXPIRY_WARNING_DAYS, expiring_inventory, low_stock_products, inventory_prices
+
+INVENTORY_VERSION_KEY = 'dashboard:inventory_version'
+CATALOG_VERSION_KEY = 'dashboard:catalog_version'
+
+def get_cache():
+    return caches[settings.DASHBOARD_CACHE_ALIAS]
+
+def get_version(key):
+    """
+    Returns the current version token of a set of cached counters, creating it if the cache has lost it.
+
+    Versions are random tokens rather than numbers, so a version that was evicted and recreated
+    never reuses one that older cached counters were stored under.
+    """
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+def bump_version(key):
+    # A fresh token per bump instead of incr, which is a non-atomic read-modify-write on FileBasedCache:
+    # two concurrent bumps may both win, but each leaves a version no stale counter is stored under
+    get_cache().set(key, uuid4().hex, None)
+
+def bump_inventory_version():
+    # Called after any committed Inventory change; invalidates both dashboard counters
+    bump_version(INVENTORY_VERSION_KEY)
+
+def bump_catalog_version():
+    # Called after Product or Category changes (e.g. low_stock_threshold edits); invalidates the low stock counter
+    bump_version(CATALOG_VERSION_KEY)
+
+def get_expiring_count(today):
+    """
+    Returns the number of in-stock inventory items expiring within EXPIRY_WARNING_DAYS of today.
+
+    The counter is cached together with the cutoff date it was computed for. When the date rolls
+    over, only the items whose expiry date entered the window since then are counted and added,
+    instead of recounting the whole window.
+
+    :param today: The reference date
+    """
+    cache = get_cache()
+    key = f"dashboard:expiring:{get_version(INVENTORY_VERSION_KEY)}"
+    cutoff_date = today + timedelta(days=EXPIRY_WARNING_DAYS)
+
+    cached = cache.get(key)
+    if cached and cached['cutoff_date'] == cutoff_date:
+        return cached['count']
+
+    if cached and cached['cutoff_date'] < cutoff_date:
+        count = cached['count'] + Inventory.objects.filter(
+            quantity__gt=0,
+            expiry_date__gt=cached['cutoff_date'],
+            expiry_date__lte=cutoff_date
+        ).count()
+    else:
+        count = expiring_inventory(today).count()
+
+    cache.set(key, {'cutoff_date': cutoff_date, 'count': count}, settings.DASHBOARD_COUNTERS_TIMEOUT)
+    return count
+
+def get_low_stock_count():
+    # Number of products below their category's low stock threshold
+    cache = get_cache()
+    key = f"dashboard:low_stock:{get_version(INVENTORY_VERSION_KEY)}:{get_version(CATALOG_VERSION_KEY)}"
+
+    count = cache.get(key)
+    if count is None:
+        count = low_stock_products().count()
+        cache.set(key, count, settings.DASHBOARD_COUNTERS_TIMEOUT)
+    return count
+
+def get_cached_inventory_prices(inventory_ids, today):
+    """
+    Returns inventory_prices() for a set of inventory items, cached for INVENTORY_PRICES_CACHE_TIMEOUT.
+
+    The key includes the inventory version, so a sale or purchase refreshes the available quantities
+    at once; discount edits are picked up when the short timeout expires.
+
+    :param inventory_ids: Sorted IDs of the inventory items
+    :param today: The date the discounts are resolved for
+    """
+    cache = get_cache()
+    ids_hash = hashlib.md5(",".join(map(str, inventory_ids)).encode()).hexdigest()
+    key = f"inventory_prices:{get_version(INVENTORY_VERSION_KEY)}:{today.isoformat()}:{ids_hash}"
+
+    prices = cache.get(key)
+    if prices is None:
+        prices = inventory_prices(inventory_ids, today)
+        cache.set(key, prices, settings.INVENTORY_PRICES_CACHE_TIMEOUT)
+    return prices
@@ -1,8 +1,17 @@
 # home/decorators.py
+from datetime import timedelta
 from functools import wraps
+from django.conf import settings
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib import messages
+from django.http import HttpResponse
 from django.shortcuts import redirect
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_FIELD = 'idempotency_key'  # Hidden form field rendered by {% idempotency_key_input %}
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'  # Idempotency-Key header, for JSON clients
 
 def superuser_required(view_func):
     '''
@@ -31,4 +40,72 @@ def superuser_required_403(view_func):
             messages.error(request, "You do not have permission to perform this action.")
             return redirect(request.META.get('HTTP_REFERER', 'homepage'))  # fallback to homepage
         return view_func(request, *args, **kwargs)
-    return _wrapped_view
\ No newline at end of file
+    return _wrapped_view
+
+def idempotent(view_func):
+    '''
+    Decorator to make a POST view safe to submit twice.
+    The first request with a given idempotency key (form field or Idempotency-Key header) runs the view and
+    stores its redirect or JSON response. A repeated request replays that response without running the view.
+    While the original request is still in progress, a repeat gets 409 with Retry-After straight away
+    rather than holding a worker until it finishes; after settings.IDEMPOTENCY_KEY_LEASE the original is
+    presumed dead and a repeat takes the key over. Failed requests (error status, or for form views an
+    error message or form re-render) release the key, so the corrected form can be submitted again.
+    '''
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        key = request.POST.get(IDEMPOTENCY_FIELD) or request.META.get(IDEMPOTENCY_HEADER)
+        if request.method != 'POST' or not key:
+            return view_func(request, *args, **kwargs)
+
+        user = request.user if request.user.is_authenticated else None
+        endpoint = request.resolver_match.view_name
+        record, created = IdempotencyKey.objects.get_or_create(key=key[:64], defaults={'user': user, 'endpoint': endpoint})
+
+        if not created:
+            if record.user_id != (user.id if user else None) or record.endpoint != endpoint:
+                return HttpResponse("Idempotency key already used for another request.", status=422)
+            if record.status_code is None:
+                # A key still in progress after its lease belongs to a worker that died mid-request: the
+                # conditional update lets exactly one retry take it over, the others keep getting 409
+                now = timezone.now()
+                taken_over = IdempotencyKey.objects.filter(
+                    pk=record.pk, status_code__isnull=True, created_at__lt=now - timedelta(seconds=settings.IDEMPOTENCY_KEY_LEASE)
+                ).update(created_at=now)
+                if not taken_over:
+                    response = HttpResponse("The original request is still being processed.", status=409)
+                    response['Retry-After'] = '1'
+                    return response
+            elif record.location:
+                messages.info(request, "This submission was already processed.")
+                return redirect(record.location)
+            else:
+                return HttpResponse(record.body, status=record.status_code, content_type=record.content_type)
+
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            record.delete()
+            raise
+
+        content_type = response.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            # JSON endpoints report failure in their status code; the messages (and the session they load) are left alone
+            failed = False
+        else:
+            # Only the messages queued by this request count: an unread error left over from an earlier
+            # request must not mark this one as failed. Reading them does not consume or load anything
+            queued = getattr(messages.get_messages(request), '_queued_messages', [])
+            failed = any(message.level >= messages.ERROR for message in queued)
+
+        if failed or response.status_code >= 400 or not (response.status_code in (301, 302, 303) or content_type.startswith('application/json')):
+            record.delete()
+            return response
+
+        record.status_code = response.status_code
+        record.location = response.get('Location', '')
+        record.content_type = content_type
+        record.body = '' if record.location else response.content.decode(response.charset)
+        record.save(update_fields=['status_code', 'location', 'content_type', 'body'])
+        return response
+    return _wrapped_view
@@ -9,6 +9,7 @@ from .models import (
     Manufacturer, Category, Product, Inventory, PurchaseTransaction, PurchasedProduct, 
     Customer, SaleTransaction, SoldProduct, Discount)
 from .validators import validate_phone_number
+from .services import is_document_number
 
 # User management
 class UserCreationForm(forms.ModelForm):
@@ -155,6 +156,10 @@ class PurchaseTransactionForm(forms.ModelForm):
 
     def clean_invoice_number(self):
         invoice_number = self.cleaned_data.get('invoice_number')
+        if not invoice_number:
+            return invoice_number  # Numbered by the server when saved
+        if is_document_number('purchase', invoice_number) and invoice_number != self.instance.invoice_number:
+            raise forms.ValidationError("This number format is reserved for automatic numbering. Leave the field blank instead.")
         qs = PurchaseTransaction.objects.filter(invoice_number=invoice_number)
         if self.instance.pk:
             qs = qs.exclude(pk=self.instance.pk)
@@ -174,6 +179,8 @@ class PurchaseTransactionForm(forms.ModelForm):
         self.fields['purchase_date'].input_formats = ['%Y-%m-%d']
         if not self.instance.pk:
             self.fields['purchase_date'].initial = timezone.now()
+            self.fields['invoice_number'].required = False
+            self.fields['invoice_number'].widget.attrs['placeholder'] = _("Leave blank to number automatically")
 
 class PurchasedProductForm(forms.ModelForm):
     batch_number = forms.CharField(required=False)  # Batch number is optional
@@ -252,8 +259,27 @@ class SaleTransactionForm(forms.ModelForm):
         self.fields['transaction_date'].input_formats = ['%Y-%m-%d']
         if not self.instance.pk:  # Only for new forms
             self.fields['transaction_date'].initial = timezone.now()
+            self.fields['transaction_number'].required = False
+            self.fields['transaction_number'].widget.attrs['placeholder'] = _("Leave blank to number automatically")
+
+    def clean_transaction_number(self):
+        transaction_number = self.cleaned_data.get('transaction_number')
+        if is_document_number('sale', transaction_number) and transaction_number != self.instance.transaction_number:
+            raise forms.ValidationError("This number format is reserved for automatic numbering. Leave the field blank instead.")
+        return transaction_number
 
 class SoldProductForm(forms.ModelForm):
+    '''
+    A sold line is either a specific inventory item, or a product ("sell by product") whose quantity
+    is allocated across its batches, earliest expiry first.
+    '''
+    product = forms.ModelChoiceField(
+        queryset=Product.objects.all(),
+        required=False,
+        widget=forms.HiddenInput(),
+        label=_("Product")
+    )
+
     class Meta:
         model = SoldProduct
         fields = [
@@ -261,15 +287,26 @@ class SoldProductForm(forms.ModelForm):
             'quantity'
         ]
         widgets = {
+            # Picked through the inventory search, so no choice list is rendered (or queried)
+            'inventory_item': forms.HiddenInput(),
             'quantity': forms.NumberInput(attrs={'min': 1})
         }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['inventory_item'].queryset = Inventory.objects.filter(quantity__gt=0)
-        self.fields['inventory_item'].label_from_instance = lambda obj: f"{obj.product.name} (Exp: {obj.expiry_date}) — {obj.quantity} left"
+        # Only validates the posted ID, with one lookup per filled row
+        self.fields['inventory_item'].queryset = Inventory.objects.filter(quantity__gt=0).select_related('product')
+        self.fields['inventory_item'].required = False
         self.fields['quantity'].widget.attrs.update({'disabled': 'disabled'})
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('DELETE') or not self.has_changed():
+            return cleaned_data
+        if bool(cleaned_data.get('inventory_item')) == bool(cleaned_data.get('product')):
+            raise forms.ValidationError("Select either an inventory item or a product to sell by expiry date.")
+        return cleaned_data
+
 class SaleScanForm(forms.Form):
     json_file = forms.FileField(label="Scan Sale JSON File", required=True)
 
@@ -0,0 +1,32 @@
+# home/management/commands/compute_reorder_suggestions.py
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from home.models import ReorderSuggestion
+from home.reorder import refresh_reorder_suggestions, LEAD_TIME_DAYS, REVIEW_PERIOD_DAYS
+
+class Command(BaseCommand):
+    help = "Recompute the reorder suggestions from recent sales and print the suggested orders per manufacturer. Schedule it nightly."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lead-time-days', type=int, default=LEAD_TIME_DAYS, help="Days between placing an order and receiving it.")
+        parser.add_argument('--review-period-days', type=int, default=REVIEW_PERIOD_DAYS, help="Days of sales an order should cover.")
+
+    def handle(self, *args, **options):
+        # The sales are bucketed by day in the active time zone (TruncDate), so the window ends on the local date
+        count = refresh_reorder_suggestions(
+            timezone.localdate(),
+            lead_time_days=options['lead_time_days'],
+            review_period_days=options['review_period_days']
+        )
+
+        per_manufacturer = (
+            ReorderSuggestion.objects
+            .values('manufacturer__name')
+            .annotate(products=Count('product'), units=Sum('suggested_quantity'))
+            .order_by('manufacturer__name')
+        )
+        for row in per_manufacturer:
+            self.stdout.write(f"{row['manufacturer__name']}: {row['units']} unit(s) across {row['products']} product(s)")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} reorder suggestion(s)."))
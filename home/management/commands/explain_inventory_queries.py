@@ -0,0 +1,116 @@
+# home/management/commands/explain_inventory_queries.py
+import random
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from home.models import Category, Manufacturer, Product, Inventory
+from home.services import expiring_inventory
+
+SEQ_SCAN_MARKER = f"Seq Scan on {Inventory._meta.db_table}"
+
+class Rollback(Exception):
+    # Raised to discard the seeded rows once the plans have been checked
+    pass
+
+class Command(BaseCommand):
+    help = (
+        "Seed a large Inventory dataset inside a transaction, EXPLAIN the hot in-stock inventory queries "
+        "and fail if any of them falls back to a sequential scan of the Inventory table. "
+        "The seeded rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help="Number of products to seed.")
+        parser.add_argument('--batches', type=int, default=50, help="Inventory rows (expiry dates) per product.")
+        parser.add_argument('--in-stock-ratio', type=float, default=0.05, help="Share of seeded rows with a positive quantity.")
+        parser.add_argument('--no-seed', action='store_true', help="EXPLAIN against the existing data only.")
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if connection.vendor != 'postgresql':
+            raise CommandError("This check relies on PostgreSQL query plans.")
+
+        try:
+            with transaction.atomic():
+                if not options['no_seed']:
+                    self.seed(options['products'], options['batches'], options['in_stock_ratio'])
+                failures = self.check_plans()
+                raise Rollback
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError(f"{len(failures)} quer(y/ies) fell back to a sequential scan: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All in-stock inventory queries use an index."))
+
+    def seed(self, product_count, batches, in_stock_ratio):
+        category = Category.objects.create(name="EXPLAIN seed category")
+        manufacturer = Manufacturer.objects.create(name="EXPLAIN seed manufacturer")
+        products = Product.objects.bulk_create(
+            [
+                Product(name=f"EXPLAIN seed product {i}", category=category, manufacturer=manufacturer, sale_price=1)
+                for i in range(product_count)
+            ],
+            batch_size=1000
+        )
+
+        # Mostly zeroed batches, like a long-running pharmacy where sold-out rows are never deleted
+        start = date.today() - timedelta(days=batches * 7 // 2)
+        rows = (
+            Inventory(
+                product=product,
+                quantity=random.randint(1, 100) if random.random() < in_stock_ratio else 0,
+                expiry_date=start + timedelta(days=7 * batch)
+            )
+            for product in products
+            for batch in range(batches)
+        )
+        batch_rows = []
+        for row in rows:
+            batch_rows.append(row)
+            if len(batch_rows) == 5000:
+                Inventory.objects.bulk_create(batch_rows)
+                batch_rows = []
+        Inventory.objects.bulk_create(batch_rows)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Inventory._meta.db_table}")
+            cursor.execute(f"ANALYZE {Product._meta.db_table}")
+
+        self.stdout.write(f"Seeded {product_count} products with {product_count * batches} inventory rows.")
+
+    def hot_queries(self):
+        # Mirrors the in-stock inventory queries issued by the views and forms
+        in_stock = Inventory.objects.filter(quantity__gt=0)
+        product_id = (
+            in_stock.order_by('product_id').values_list('product_id', flat=True).first()
+            or Product.objects.values_list('id', flat=True).first()
+            or 0
+        )
+        return {
+            'inventory_list': in_stock.select_related('product__manufacturer').order_by('-updated_at')[:10],
+            'inventory_search': (
+                in_stock.filter(product__name__istartswith="EXPLAIN seed product 12")
+                .select_related('product', 'product__manufacturer')
+                .order_by('product__name', 'expiry_date', 'id')[:20]
+            ),
+            'sold_product_form_choices': in_stock,
+            'homepage_expiring': expiring_inventory(date.today()).select_related('product').order_by('expiry_date', 'id')[:10],
+            'homepage_expiring_count': expiring_inventory(date.today()).order_by().values('id'),
+            'related_inventory': in_stock.filter(product_id=product_id).order_by('expiry_date')[:10],
+        }
+
+    def check_plans(self):
+        failures = []
+        for name, queryset in self.hot_queries().items():
+            plan = queryset.explain()
+            if SEQ_SCAN_MARKER in plan:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"[SEQ SCAN] {name}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"[INDEX] {name}"))
+            if self.verbosity > 1:
+                self.stdout.write(plan)
+        return failures
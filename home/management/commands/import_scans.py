@@ -0,0 +1,71 @@
+# home/management/commands/import_scans.py
+import csv
+import os
+import zipfile
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from home.scans import SCAN_IMPORT_BATCH_SIZE, iter_scan_files, import_scans
+from home.utils import log_activity
+
+CSV_COLUMNS = ['file', 'kind', 'status', 'number', 'error']
+
+class Command(BaseCommand):
+    help = (
+        "Import scanned purchase and sale JSON documents from directories, ZIP archives or single files. "
+        "Documents are validated in parallel, committed in bulk transactions and reported per file as CSV."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='+', help="Directories, .zip archives or .json files to import.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Number of worker processes validating the documents. 1 runs in-process.")
+        parser.add_argument('--batch-size', type=int, default=SCAN_IMPORT_BATCH_SIZE, help="Number of documents committed per transaction.")
+        parser.add_argument('--output', help="Write the CSV report to this file instead of stdout.")
+        parser.add_argument('--username', help="User the documents are imported under. Defaults to the first superuser.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--workers and --batch-size must be positive.")
+
+        files = []
+        for source in options['sources']:
+            if not Path(source).exists():
+                raise CommandError(f"{source} does not exist.")
+            try:
+                files.extend(iter_scan_files(source))
+            except zipfile.BadZipFile as e:
+                raise CommandError(f"{source} is not a valid ZIP archive: {e}")
+        if not files:
+            self.stderr.write("No JSON documents to import.")
+            return
+
+        user = self.get_user(options['username'])
+        results = import_scans(files, user, workers=options['workers'], batch_size=options['batch_size'])
+
+        self.write_report(results, options['output'])
+        created = sum(result['status'] == 'created' for result in results)
+        log_activity(user, "Imported scans", f"{created} of {len(results)} document(s) imported")
+        self.stderr.write(self.style.SUCCESS(f"Imported {created} of {len(results)} document(s)."))
+
+    def write_report(self, results, output):
+        stream = open(output, 'w', newline='') if output else self.stdout
+        try:
+            writer = csv.DictWriter(stream, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(results)
+        finally:
+            if output:
+                stream.close()
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f"User '{username}' does not exist.")
+            return user
+        user = User.objects.filter(is_superuser=True).order_by('id').first()
+        if user is None:
+            raise CommandError("No superuser to import the documents under. Pass --username.")
+        return user
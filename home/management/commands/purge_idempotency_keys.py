@@ -0,0 +1,16 @@
+# home/management/commands/purge_idempotency_keys.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from home.models import IdempotencyKey
+
+class Command(BaseCommand):
+    help = "Delete idempotency keys older than settings.IDEMPOTENCY_KEY_TTL. Schedule it daily."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        count, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} idempotency key(s)."))
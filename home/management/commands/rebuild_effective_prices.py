@@ -0,0 +1,34 @@
+# home/management/commands/rebuild_effective_prices.py
+from django.core.management.base import BaseCommand, CommandError
+
+from home.models import Product
+from home.services import rebuild_effective_prices, find_effective_price_drift
+
+class Command(BaseCommand):
+    help = "Rebuild the EffectivePrice table from sale prices and discounts, or check it for drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report products whose EffectivePrice rows disagree with their sale price and discounts.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of products recomputed per transaction.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        batches = [product_ids[start:start + batch_size] for start in range(0, len(product_ids), batch_size)]
+
+        if options['check']:
+            drift = [row for batch in batches for row in find_effective_price_drift(batch)]
+            for row in drift:
+                self.stdout.write(
+                    f"Product #{row['product_id']} {row['product']}: "
+                    f"{len(row['recorded_segments'])} price range(s) recorded, {len(row['expected_segments'])} expected"
+                )
+            if drift:
+                raise CommandError(f"{len(drift)} product(s) out of sync. Run rebuild_effective_prices to repair.")
+            self.stdout.write(self.style.SUCCESS("EffectivePrice is consistent with sale prices and discounts."))
+            return
+
+        for batch in batches:
+            rebuild_effective_prices(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt effective prices for {len(product_ids)} product(s)."))
@@ -0,0 +1,33 @@
+# home/management/commands/rebuild_product_stock.py
+from django.core.management.base import BaseCommand, CommandError
+
+from home.models import Product
+from home.services import sync_product_stock, find_product_stock_drift
+
+class Command(BaseCommand):
+    help = "Rebuild the ProductStock table from Inventory, or check it for drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Only report products whose ProductStock row disagrees with Inventory.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of products recomputed per transaction.")
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = find_product_stock_drift()
+            for row in drift:
+                self.stdout.write(
+                    f"Product #{row['product_id']} {row['product']}: "
+                    f"on hand {row['recorded_on_hand']} (expected {row['expected_on_hand']}), "
+                    f"earliest expiry {row['recorded_earliest_expiry']} (expected {row['expected_earliest_expiry']})"
+                )
+            if drift:
+                raise CommandError(f"{len(drift)} product(s) out of sync. Run rebuild_product_stock to repair.")
+            self.stdout.write(self.style.SUCCESS("ProductStock is consistent with Inventory."))
+            return
+
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(product_ids), batch_size):
+            sync_product_stock(product_ids[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stock for {len(product_ids)} product(s)."))
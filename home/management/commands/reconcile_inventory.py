@@ -0,0 +1,90 @@
+# home/management/commands/reconcile_inventory.py
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Min, Max
+
+from home.models import Product
+from home.services import find_inventory_discrepancies, repair_inventory_discrepancies
+from home.utils import log_activity
+
+CSV_COLUMNS = ['inventory_id', 'product_id', 'product', 'expiry_date', 'recorded_quantity', 'expected_quantity', 'difference']
+
+def reconcile_chunk(bounds):
+    # Runs in a worker process, on its own database connection
+    first_product_id, last_product_id = bounds
+    return find_inventory_discrepancies(first_product_id, last_product_id)
+
+class Command(BaseCommand):
+    help = (
+        "Check Inventory quantities against purchases, sales, write-offs and adjustments per (product, expiry date). "
+        "Product ID ranges are checked in parallel and discrepancies are written as CSV; --repair corrects them in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Number of worker processes. 1 runs in-process.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Number of product IDs checked per chunk.")
+        parser.add_argument('--output', help="Write the CSV report to this file instead of stdout.")
+        parser.add_argument('--repair', action='store_true', help="Set every discrepant Inventory row to its expected quantity.")
+        parser.add_argument('--username', help="User the repair is logged under. Defaults to the first superuser.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--workers and --chunk-size must be positive.")
+
+        bounds = Product.objects.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stderr.write("No products to reconcile.")
+            return
+
+        chunk_size = options['chunk_size']
+        chunks = [
+            (start, min(start + chunk_size - 1, bounds['last']))
+            for start in range(bounds['first'], bounds['last'] + 1, chunk_size)
+        ]
+
+        if options['workers'] == 1 or len(chunks) == 1:
+            results = map(reconcile_chunk, chunks)
+            discrepancies = [row for rows in results for row in rows]
+        else:
+            # Forked workers must not share the parent's connection: close it so each process opens its own.
+            # Workers set Django up themselves, so the pool works with any start method, not only fork
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+                discrepancies = [row for rows in executor.map(reconcile_chunk, chunks) for row in rows]
+
+        self.write_report(discrepancies, options['output'])
+        self.stderr.write(f"Checked {len(chunks)} chunk(s): {len(discrepancies)} discrepanc(y/ies) found.")
+
+        if options['repair'] and discrepancies:
+            user = self.get_user(options['username'])
+            repaired = repair_inventory_discrepancies([row['product_id'] for row in discrepancies], user=user)
+            log_activity(user, "Reconciled inventory", f"{repaired} inventory row(s) corrected")
+            self.stderr.write(self.style.SUCCESS(f"Repaired {repaired} inventory row(s)."))
+
+    def write_report(self, discrepancies, output):
+        stream = open(output, 'w', newline='') if output else self.stdout
+        try:
+            writer = csv.DictWriter(stream, fieldnames=CSV_COLUMNS)
+            writer.writeheader()
+            for row in discrepancies:
+                writer.writerow({**row, 'difference': row['recorded_quantity'] - row['expected_quantity']})
+        finally:
+            if output:
+                stream.close()
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f"User '{username}' does not exist.")
+            return user
+        user = User.objects.filter(is_superuser=True).order_by('id').first()
+        if user is None:
+            raise CommandError("No superuser to log the repair under. Pass --username.")
+        return user
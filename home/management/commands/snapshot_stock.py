@@ -0,0 +1,11 @@
+# home/management/commands/snapshot_stock.py
+from django.core.management.base import BaseCommand
+
+from home.services import take_stock_snapshots
+
+class Command(BaseCommand):
+    help = "Write a per-product stock snapshot from the stock movement ledger. Schedule it periodically (e.g. nightly)."
+
+    def handle(self, *args, **options):
+        count = take_stock_snapshots()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} stock snapshot(s)."))
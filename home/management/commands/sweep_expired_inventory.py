@@ -0,0 +1,41 @@
+# home/management/commands/sweep_expired_inventory.py
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from home.services import sweep_expired_inventory
+from home.utils import log_activity
+
+class Command(BaseCommand):
+    help = (
+        "Write off every expired inventory batch that still has stock, valued at its purchase cost, "
+        "and record the run in the activity log. Schedule it nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="User the run is logged under. Defaults to the first superuser.")
+        parser.add_argument('--date', type=date.fromisoformat, help="Write off batches expiring before this date (YYYY-MM-DD). Defaults to today.")
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError(f"User '{options['username']}' does not exist.")
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('id').first()
+            if user is None:
+                raise CommandError("No superuser to log the run under. Pass --username.")
+
+        today = options['date'] or date.today()
+        result = sweep_expired_inventory(today, user=user)
+
+        log_activity(
+            user,
+            "Swept expired inventory",
+            f"{result['batches']} batch(es), {result['quantity']} unit(s) written off "
+            f"for a cost of {result['total_cost']} (expired before {today})"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote off {result['batches']} batch(es), {result['quantity']} unit(s), total cost {result['total_cost']}."
+        ))
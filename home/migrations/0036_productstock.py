@@ -0,0 +1,49 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min, Q, Sum
+from django.utils import timezone
+
+
+def populate_product_stock(apps, schema_editor):
+    Product = apps.get_model('home', 'Product')
+    ProductStock = apps.get_model('home', 'ProductStock')
+    now = timezone.now()
+    totals = Product.objects.annotate(
+        on_hand=Sum('inventory__quantity'),
+        earliest_expiry=Min('inventory__expiry_date', filter=Q(inventory__quantity__gt=0)),
+    ).values('id', 'on_hand', 'earliest_expiry')
+    ProductStock.objects.bulk_create([
+        ProductStock(
+            product_id=row['id'],
+            on_hand=row['on_hand'] or 0,
+            earliest_expiry=row['earliest_expiry'],
+            last_movement_at=now,
+        )
+        for row in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0035_alter_activitylog_options_alter_category_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStock',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_level', serialize=False, to='home.product', verbose_name='Product')),
+                ('on_hand', models.PositiveIntegerField(default=0, verbose_name='On Hand')),
+                ('earliest_expiry', models.DateField(blank=True, null=True, verbose_name='Earliest Expiry')),
+                ('last_movement_at', models.DateTimeField(blank=True, null=True, verbose_name='Last Movement At')),
+            ],
+            options={
+                'verbose_name': 'Product Stock',
+                'verbose_name_plural': 'Product Stocks',
+            },
+        ),
+        migrations.RunPython(populate_product_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:16
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY cannot run inside a transaction, but does not block stock writes
+
+    dependencies = [
+        ('home', '0036_productstock'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['expiry_date'], name='inventory_in_stock_expiry_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='inventory',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['product', 'expiry_date'], name='inventory_in_stock_product_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:19
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_opening_snapshots(apps, schema_editor):
+    # The ledger starts now: record the current stock of every product as its opening snapshot
+    ProductStock = apps.get_model('home', 'ProductStock')
+    StockSnapshot = apps.get_model('home', 'StockSnapshot')
+    now = django.utils.timezone.now()
+    StockSnapshot.objects.bulk_create([
+        StockSnapshot(product_id=product_id, taken_at=now, on_hand=on_hand)
+        for product_id, on_hand in ProductStock.objects.values_list('product_id', 'on_hand')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0037_inventory_in_stock_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='Quantity')),
+                ('reason', models.CharField(choices=[('purchase', 'Purchase'), ('purchase_deleted', 'Purchase Deleted'), ('sale', 'Sale'), ('sale_deleted', 'Sale Deleted'), ('adjustment', 'Adjustment')], max_length=20, verbose_name='Reason')),
+                ('reference', models.CharField(blank=True, max_length=100, verbose_name='Reference')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created At')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Created By')),
+                ('inventory_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='home.inventory', verbose_name='Inventory Item')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_movements', to='home.product', verbose_name='Product')),
+            ],
+            options={
+                'verbose_name': 'Stock Movement',
+                'verbose_name_plural': 'Stock Movements',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['product', 'created_at'], name='stockmovement_product_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(verbose_name='Taken At')),
+                ('on_hand', models.IntegerField(verbose_name='On Hand')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='home.product', verbose_name='Product')),
+            ],
+            options={
+                'verbose_name': 'Stock Snapshot',
+                'verbose_name_plural': 'Stock Snapshots',
+                'ordering': ['-taken_at'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'taken_at'), name='unique_product_snapshot_time')],
+            },
+        ),
+        migrations.RunPython(create_opening_snapshots, migrations.RunPython.noop),
+    ]
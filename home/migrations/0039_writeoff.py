@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:21
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0038_stockmovement_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='reason',
+            field=models.CharField(choices=[('purchase', 'Purchase'), ('purchase_deleted', 'Purchase Deleted'), ('sale', 'Sale'), ('sale_deleted', 'Sale Deleted'), ('adjustment', 'Adjustment'), ('write_off', 'Write-off')], max_length=20, verbose_name='Reason'),
+        ),
+        migrations.CreateModel(
+            name='WriteOff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expiry_date', models.DateField(verbose_name='Expiry Date')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Quantity')),
+                ('unit_cost', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Unit Cost')),
+                ('total_cost', models.DecimalField(decimal_places=2, max_digits=15, verbose_name='Total Cost')),
+                ('written_off_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Written Off At')),
+                ('inventory_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='write_offs', to='home.inventory', verbose_name='Inventory Item')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='write_offs', to='home.product', verbose_name='Product')),
+            ],
+            options={
+                'verbose_name': 'Write-off',
+                'verbose_name_plural': 'Write-offs',
+                'ordering': ['-written_off_at'],
+            },
+        ),
+    ]
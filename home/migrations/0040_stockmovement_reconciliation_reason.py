@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0039_writeoff'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='reason',
+            field=models.CharField(choices=[('purchase', 'Purchase'), ('purchase_deleted', 'Purchase Deleted'), ('sale', 'Sale'), ('sale_deleted', 'Sale Deleted'), ('adjustment', 'Adjustment'), ('write_off', 'Write-off'), ('reconciliation', 'Reconciliation')], max_length=20, verbose_name='Reason'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0040_stockmovement_reconciliation_reason'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reorder_suggestion', serialize=False, to='home.product', verbose_name='Product')),
+                ('on_hand', models.IntegerField(verbose_name='On Hand')),
+                ('daily_velocity', models.FloatField(verbose_name='Daily Velocity')),
+                ('days_of_cover', models.FloatField(blank=True, null=True, verbose_name='Days of Cover')),
+                ('suggested_quantity', models.PositiveIntegerField(verbose_name='Suggested Quantity')),
+                ('computed_at', models.DateTimeField(verbose_name='Computed At')),
+                ('manufacturer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestions', to='home.manufacturer', verbose_name='Manufacturer')),
+            ],
+            options={
+                'verbose_name': 'Reorder Suggestion',
+                'verbose_name_plural': 'Reorder Suggestions',
+                'ordering': ['manufacturer', 'days_of_cover'],
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:30
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def effective_price_segments(sale_price, discounts):
+    # Frozen copy of home.services.effective_price_segments as of this migration
+    boundaries = {date.min}
+    for from_date, to_date, _ in discounts:
+        boundaries.add(from_date)
+        if to_date < date.max:
+            boundaries.add(to_date + timedelta(days=1))
+    boundaries = sorted(boundaries)
+
+    segments = []
+    for index, from_date in enumerate(boundaries):
+        to_date = boundaries[index + 1] - timedelta(days=1) if index + 1 < len(boundaries) else date.max
+        total_percentage = sum(
+            (percentage for start, end, percentage in discounts if start <= from_date <= end),
+            Decimal('0.00')
+        )
+        if total_percentage:
+            total_percentage = min(total_percentage, Decimal('100.00'))
+            price = round(sale_price * (Decimal('1.00') - total_percentage / Decimal('100.00')), 2)
+        else:
+            price = sale_price
+
+        if segments and segments[-1][2] == price:
+            segments[-1] = (segments[-1][0], to_date, price)
+        else:
+            segments.append((from_date, to_date, price))
+    return segments
+
+
+def populate_effective_prices(apps, schema_editor):
+    Product = apps.get_model('home', 'Product')
+    Discount = apps.get_model('home', 'Discount')
+    EffectivePrice = apps.get_model('home', 'EffectivePrice')
+
+    discounts = {}
+    for product_id, from_date, to_date, percentage in Discount.products.through.objects.values_list(
+        'product_id', 'discount__from_date', 'discount__to_date', 'discount__percentage'
+    ):
+        discounts.setdefault(product_id, []).append((from_date, to_date, percentage))
+
+    EffectivePrice.objects.bulk_create([
+        EffectivePrice(product_id=product_id, from_date=from_date, to_date=to_date, price=price)
+        for product_id, sale_price in Product.objects.values_list('id', 'sale_price').iterator()
+        for from_date, to_date, price in effective_price_segments(sale_price, discounts.get(product_id, []))
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0041_reordersuggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectivePrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_date', models.DateField(verbose_name='From Date')),
+                ('to_date', models.DateField(verbose_name='To Date')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Price')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='effective_prices', to='home.product', verbose_name='Product')),
+            ],
+            options={
+                'verbose_name': 'Effective Price',
+                'verbose_name_plural': 'Effective Prices',
+                'constraints': [models.UniqueConstraint(fields=('product', 'from_date'), name='unique_product_price_range')],
+            },
+        ),
+        migrations.RunPython(populate_effective_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.5 on 2026-10-17 22:53
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False  # CREATE INDEX CONCURRENTLY cannot run inside a transaction, but does not block product writes
+
+    dependencies = [
+        ('home', '0044_product_name_prefix_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='product',
+            index=models.Index(fields=['manufacturer', 'name'], name='product_manufacturer_name_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.5 on 2026-10-17 23:02
+
+from datetime import datetime, timezone
+
+from django.db import migrations
+
+OPENING_BALANCE_REFERENCE = "Opening balance"
+LEDGER_START = datetime(1970, 1, 1, tzinfo=timezone.utc)  # Frozen copy of home.services.LEDGER_START
+
+
+def record_opening_balances(apps, schema_editor):
+    # Stock removed by hand before the ledger existed left no movement, so reconcile_inventory would report
+    # it as drift and --repair would restore it. Record the difference between each batch and its history as
+    # an opening adjustment, dated at the product's opening snapshot so stock_on_hand_at does not count it
+    Inventory = apps.get_model('home', 'Inventory')
+    PurchasedProduct = apps.get_model('home', 'PurchasedProduct')
+    SoldProduct = apps.get_model('home', 'SoldProduct')
+    WriteOff = apps.get_model('home', 'WriteOff')
+    StockMovement = apps.get_model('home', 'StockMovement')
+    StockSnapshot = apps.get_model('home', 'StockSnapshot')
+
+    schema_editor.execute(f"""
+        INSERT INTO {StockMovement._meta.db_table} (product_id, inventory_item_id, quantity, reason, reference, created_at)
+        SELECT inventory.product_id, inventory.id, inventory.quantity - COALESCE(history.quantity, 0),
+               'adjustment', %s, COALESCE(opening.taken_at, %s)
+        FROM {Inventory._meta.db_table} AS inventory
+        LEFT JOIN (
+            SELECT product_id, expiry_date, SUM(quantity) AS quantity
+            FROM (
+                SELECT pp.product_id, pp.expiry_date, pp.quantity
+                FROM {PurchasedProduct._meta.db_table} AS pp
+                UNION ALL
+                SELECT batch.product_id, batch.expiry_date, -sp.quantity
+                FROM {SoldProduct._meta.db_table} AS sp
+                JOIN {Inventory._meta.db_table} AS batch ON batch.id = sp.inventory_item_id
+                UNION ALL
+                SELECT wo.product_id, wo.expiry_date, -wo.quantity
+                FROM {WriteOff._meta.db_table} AS wo
+                UNION ALL
+                SELECT batch.product_id, batch.expiry_date, sm.quantity
+                FROM {StockMovement._meta.db_table} AS sm
+                JOIN {Inventory._meta.db_table} AS batch ON batch.id = sm.inventory_item_id
+                WHERE sm.reason = 'adjustment'
+            ) AS movements
+            GROUP BY product_id, expiry_date
+        ) AS history
+            ON history.product_id = inventory.product_id AND history.expiry_date = inventory.expiry_date
+        LEFT JOIN (
+            SELECT product_id, MIN(taken_at) AS taken_at
+            FROM {StockSnapshot._meta.db_table}
+            GROUP BY product_id
+        ) AS opening
+            ON opening.product_id = inventory.product_id
+        WHERE inventory.quantity <> COALESCE(history.quantity, 0)
+    """, (OPENING_BALANCE_REFERENCE, LEDGER_START))
+
+
+def delete_opening_balances(apps, schema_editor):
+    StockMovement = apps.get_model('home', 'StockMovement')
+    StockMovement.objects.filter(reason='adjustment', reference=OPENING_BALANCE_REFERENCE).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0045_product_manufacturer_name_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(record_opening_balances, delete_opening_balances),
+    ]
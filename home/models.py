@@ -1,5 +1,7 @@
 # home/models.py
 from django.db import models
+from django.contrib.postgres.indexes import OpClass
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -67,6 +69,12 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Matches name__istartswith (UPPER(name::text) LIKE 'ABC%'), used by the sale form's inventory search
+            models.Index(OpClass(Upper('name'), name='text_pattern_ops'), name='product_name_prefix_idx'),
+            # Resolves the product names of a scanned purchase (manufacturer=..., name__in=[...]) in one lookup
+            models.Index(fields=['manufacturer', 'name'], name='product_manufacturer_name_idx'),
+        ]
         verbose_name = _("Product")
         verbose_name_plural = _("Products")
 
@@ -86,12 +94,115 @@ class Inventory(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product', 'expiry_date'], name='unique_product_expiry')
         ]
+        indexes = [
+            # Zeroed rows are kept, so the hot "in stock" filters get partial indexes that skip them
+            models.Index(fields=['expiry_date'], condition=models.Q(quantity__gt=0), name='inventory_in_stock_expiry_idx'),
+            models.Index(fields=['product', 'expiry_date'], condition=models.Q(quantity__gt=0), name='inventory_in_stock_product_idx'),
+        ]
         verbose_name = _("Inventory")
         verbose_name_plural = _("Inventories")
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity} units - Expires on {self.expiry_date}"
 
+# Materialized per-product stock, kept in sync with Inventory by home.services.sync_product_stock
+class ProductStock(models.Model):
+    product = models.OneToOneField(Product, verbose_name=_("Product"), on_delete=models.CASCADE, primary_key=True, related_name='stock_level')
+    on_hand = models.PositiveIntegerField(_("On Hand"), default=0)  # Sum of Inventory.quantity over all batches
+    earliest_expiry = models.DateField(_("Earliest Expiry"), blank=True, null=True)  # Earliest expiry among batches still in stock
+    last_movement_at = models.DateTimeField(_("Last Movement At"), blank=True, null=True)  # Time of the last stock change
+
+    class Meta:
+        verbose_name = _("Product Stock")
+        verbose_name_plural = _("Product Stocks")
+
+    def __str__(self):
+        return f"{self.product.name} - {self.on_hand} units on hand"
+
+# Append-only ledger of every stock change
+class StockMovement(models.Model):
+    REASON_CHOICES = [
+        ('purchase', _("Purchase")),
+        ('purchase_deleted', _("Purchase Deleted")),
+        ('sale', _("Sale")),
+        ('sale_deleted', _("Sale Deleted")),
+        ('adjustment', _("Adjustment")),
+        ('write_off', _("Write-off")),
+        ('reconciliation', _("Reconciliation")),  # Correction back to the transaction history, ignored by reconcile_inventory
+    ]
+
+    product = models.ForeignKey(Product, verbose_name=_("Product"), on_delete=models.PROTECT, related_name='stock_movements')
+    inventory_item = models.ForeignKey(Inventory, verbose_name=_("Inventory Item"), on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    quantity = models.IntegerField(_("Quantity"))  # Signed change: positive adds stock, negative removes it
+    reason = models.CharField(_("Reason"), max_length=20, choices=REASON_CHOICES)
+    reference = models.CharField(_("Reference"), max_length=100, blank=True)  # Invoice or transaction number
+    created_by = models.ForeignKey(User, verbose_name=_("Created By"), on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(_("Created At"), default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='stockmovement_product_time_idx'),
+        ]
+        verbose_name = _("Stock Movement")
+        verbose_name_plural = _("Stock Movements")
+
+    def __str__(self):
+        return f"{self.product.name} {self.quantity:+d} ({self.reason}) at {self.created_at}"
+
+# Periodic per-product stock level, the starting point for point-in-time stock queries
+class StockSnapshot(models.Model):
+    product = models.ForeignKey(Product, verbose_name=_("Product"), on_delete=models.CASCADE, related_name='stock_snapshots')
+    taken_at = models.DateTimeField(_("Taken At"))  # Includes every movement created up to this time
+    on_hand = models.IntegerField(_("On Hand"))
+
+    class Meta:
+        ordering = ['-taken_at']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'taken_at'], name='unique_product_snapshot_time')
+        ]
+        verbose_name = _("Stock Snapshot")
+        verbose_name_plural = _("Stock Snapshots")
+
+    def __str__(self):
+        return f"{self.product.name} - {self.on_hand} units at {self.taken_at}"
+
+# Expired stock removed from Inventory by the sweep_expired_inventory command, valued at purchase cost
+class WriteOff(models.Model):
+    product = models.ForeignKey(Product, verbose_name=_("Product"), on_delete=models.PROTECT, related_name='write_offs')
+    inventory_item = models.ForeignKey(Inventory, verbose_name=_("Inventory Item"), on_delete=models.SET_NULL, null=True, blank=True, related_name='write_offs')
+    expiry_date = models.DateField(_("Expiry Date"))  # Expiry date of the written-off batch
+    quantity = models.PositiveIntegerField(_("Quantity"))  # Units removed from stock
+    unit_cost = models.DecimalField(_("Unit Cost"), max_digits=10, decimal_places=2)  # Weighted average purchase price of the batch
+    total_cost = models.DecimalField(_("Total Cost"), max_digits=15, decimal_places=2)  # quantity * unit_cost
+    written_off_at = models.DateTimeField(_("Written Off At"), default=timezone.now)
+
+    class Meta:
+        ordering = ['-written_off_at']
+        verbose_name = _("Write-off")
+        verbose_name_plural = _("Write-offs")
+
+    def __str__(self):
+        return f"{self.product.name} - {self.quantity} units expired {self.expiry_date}"
+
+# Latest output of the reorder engine (home.reorder), one row per product that should be reordered
+class ReorderSuggestion(models.Model):
+    product = models.OneToOneField(Product, verbose_name=_("Product"), on_delete=models.CASCADE, primary_key=True, related_name='reorder_suggestion')
+    manufacturer = models.ForeignKey(Manufacturer, verbose_name=_("Manufacturer"), on_delete=models.CASCADE, related_name='reorder_suggestions')  # Supplier the order goes to
+    on_hand = models.IntegerField(_("On Hand"))  # Stock on hand when the suggestion was computed
+    daily_velocity = models.FloatField(_("Daily Velocity"))  # Units sold per day
+    days_of_cover = models.FloatField(_("Days of Cover"), blank=True, null=True)  # Days until stock-out at the current velocity
+    suggested_quantity = models.PositiveIntegerField(_("Suggested Quantity"))  # Units to order
+    computed_at = models.DateTimeField(_("Computed At"))
+
+    class Meta:
+        ordering = ['manufacturer', 'days_of_cover']
+        verbose_name = _("Reorder Suggestion")
+        verbose_name_plural = _("Reorder Suggestions")
+
+    def __str__(self):
+        return f"{self.product.name} - order {self.suggested_quantity} units"
+
 # Purchase Transaction management
 class PurchaseTransaction(models.Model):
     manufacturer = models.ForeignKey(Manufacturer, verbose_name=_("Manufacturer"), on_delete=models.PROTECT, db_index=True)  # Manufacturer from whom products are purchased
@@ -236,3 +347,38 @@ class Discount(models.Model):
     def is_active(self, date=None):
         date = date or timezone.now().date()
         return self.from_date <= date <= self.to_date
+
+# Final unit price of each product per date range, after stacked discounts; rebuilt by home.services.rebuild_effective_prices
+class EffectivePrice(models.Model):
+    product = models.ForeignKey(Product, verbose_name=_("Product"), on_delete=models.CASCADE, related_name='effective_prices')
+    from_date = models.DateField(_("From Date"))  # First day of the range (date.min when open-ended)
+    to_date = models.DateField(_("To Date"))  # Last day of the range (date.max when open-ended)
+    price = models.DecimalField(_("Price"), max_digits=10, decimal_places=2)  # sale_price after the discounts active in the range
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'from_date'], name='unique_product_price_range')
+        ]
+        verbose_name = _("Effective Price")
+        verbose_name_plural = _("Effective Prices")
+
+    def __str__(self):
+        return f"{self.product.name} - {self.price}€ from {self.from_date} to {self.to_date}"
+
+# Result of a submitted write request, so that a retried submission is answered without running it twice
+class IdempotencyKey(models.Model):
+    key = models.CharField(_("Key"), max_length=64, unique=True)  # Generated by the form (or sent as the Idempotency-Key header)
+    user = models.ForeignKey(User, verbose_name=_("User"), on_delete=models.CASCADE, null=True, blank=True)
+    endpoint = models.CharField(_("Endpoint"), max_length=100)  # URL name of the view the key was used on
+    status_code = models.PositiveSmallIntegerField(_("Status Code"), blank=True, null=True)  # Empty while the request is in progress
+    location = models.CharField(_("Location"), max_length=500, blank=True)  # Redirect target of the original response
+    content_type = models.CharField(_("Content Type"), max_length=100, blank=True)
+    body = models.TextField(_("Body"), blank=True)  # JSON body of the original response
+    created_at = models.DateTimeField(_("Created At"), default=timezone.now, db_index=True)  # Purged after settings.IDEMPOTENCY_KEY_TTL
+
+    class Meta:
+        verbose_name = _("Idempotency Key")
+        verbose_name_plural = _("Idempotency Keys")
+
+    def __str__(self):
+        return f"{self.key} ({self.endpoint})"
@@ -0,0 +1,103 @@
+# home/reorder.py
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import Product, SoldProduct, ReorderSuggestion
+
+SALES_WINDOW_DAYS = 28  # Days of sales history the velocity is computed from
+RECENT_WINDOW_DAYS = 7  # Rolling window that lets a recent surge in sales override the long-run average
+LEAD_TIME_DAYS = 7  # Days between placing an order and receiving it
+REVIEW_PERIOD_DAYS = 14  # Days of sales an order should cover once received
+
+def daily_sales_matrix(product_ids, today, window_days=SALES_WINDOW_DAYS):
+    """
+    Returns the units sold per product per day over the last `window_days` days (today included).
+
+    The history is fetched as a single grouped query and scattered into a (products x days) array.
+
+    :param product_ids: Sorted NumPy array of product IDs, one row each
+    :param today: Last day of the window, a local date (timezone.localdate()) like the TruncDate buckets
+    :param window_days: Number of days in the window
+    """
+    start = today - timedelta(days=window_days - 1)
+    rows = (
+        SoldProduct.objects
+        .filter(sale_transaction__transaction_date__date__gte=start, sale_transaction__transaction_date__date__lte=today)
+        .values_list('inventory_item__product_id', TruncDate('sale_transaction__transaction_date'))
+        .annotate(quantity=Sum('quantity'))
+        .order_by()
+    )
+
+    sales = np.zeros((len(product_ids), window_days))
+    history = list(rows)
+    if history:
+        sold_ids, days, quantities = zip(*history)
+        row_index = np.searchsorted(product_ids, np.array(sold_ids))
+        day_index = np.array([(day - start).days for day in days])
+        np.add.at(sales, (row_index, day_index), np.array(quantities, dtype=float))
+    return sales
+
+def compute_reorder_suggestions(today, lead_time_days=LEAD_TIME_DAYS, review_period_days=REVIEW_PERIOD_DAYS):
+    """
+    Computes sales velocity, days of cover and suggested order quantity for every product at once.
+
+    The velocity is the larger of the full-window and the recent rolling daily average, so a product
+    that started selling faster is not left to run out. A product is suggested for reorder when its
+    stock will not last through the lead time plus the review period; the quantity tops it back up
+    to that many days of sales.
+
+    :param today: Last day of sales history taken into account
+    :param lead_time_days: Days between ordering and receiving
+    :param review_period_days: Days of sales an order should cover
+    :return: List of unsaved ReorderSuggestion instances
+    """
+    products = list(
+        Product.objects
+        .annotate(on_hand=Coalesce('stock_level__on_hand', Value(0)))
+        .order_by('id')
+        .values_list('id', 'manufacturer_id', 'on_hand')
+    )
+    if not products:
+        return []
+
+    product_ids, manufacturer_ids, on_hand = (np.array(column) for column in zip(*products))
+    sales = daily_sales_matrix(product_ids, today)
+
+    velocity = np.maximum(sales.mean(axis=1), sales[:, -RECENT_WINDOW_DAYS:].mean(axis=1))
+    days_of_cover = np.divide(on_hand, velocity, out=np.full(len(product_ids), np.inf), where=velocity > 0)
+
+    horizon = lead_time_days + review_period_days
+    suggested = np.ceil(velocity * horizon - on_hand).clip(min=0).astype(int)
+    reorder = (days_of_cover < horizon) & (suggested > 0)
+
+    computed_at = timezone.now()
+    return [
+        ReorderSuggestion(
+            product_id=int(product_ids[i]),
+            manufacturer_id=int(manufacturer_ids[i]),
+            on_hand=int(on_hand[i]),
+            daily_velocity=round(float(velocity[i]), 3),
+            days_of_cover=round(float(days_of_cover[i]), 1),
+            suggested_quantity=int(suggested[i]),
+            computed_at=computed_at,
+        )
+        for i in np.flatnonzero(reorder)
+    ]
+
+def refresh_reorder_suggestions(today, **kwargs):
+    """
+    Replaces the ReorderSuggestion table with a fresh computation.
+
+    :param today: Last day of sales history taken into account
+    :return: Number of suggestions written
+    """
+    suggestions = compute_reorder_suggestions(today, **kwargs)
+    with transaction.atomic():
+        ReorderSuggestion.objects.all().delete()
+        ReorderSuggestion.objects.bulk_create(suggestions, batch_size=1000)
+    return len(suggestions)
@@ -0,0 +1,643 @@
+# home/scans.py
+import codecs
+import json
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from pathlib import Path
+
+import django
+from django.db import transaction, IntegrityError
+from django.utils.dateparse import parse_date
+
+from .models import Manufacturer, Product, PurchaseTransaction, PurchasedProduct, Customer, SaleTransaction, ActivityLog
+from .services import commit_purchase, commit_purchases, commit_sale, commit_sales, next_document_numbers, is_document_number, InsufficientStockError
+from .utils import make_aware_datetime
+
+PURCHASE_REQUIRED_FIELDS = {"manufacturer", "purchase_date", "total_cost", "products"}  # invoice_number is optional, generated when missing
+PURCHASE_LINE_REQUIRED_FIELDS = {"product", "quantity", "purchase_price", "expiry_date"}
+SALE_REQUIRED_FIELDS = {"transaction_date", "discount", "cash_received", "payment_method", "products"}  # transaction_number is optional, generated when missing
+SALE_LINE_REQUIRED_FIELDS = {"inventory_id", "quantity"}
+
+SCAN_IMPORT_BATCH_SIZE = 100  # Documents committed per transaction by import_scans
+SCAN_STREAM_CHUNK_SIZE = 500  # Products validated and committed together by the streaming import
+SCAN_STREAM_READ_SIZE = 64 * 1024  # Bytes read from the upload at a time by the streaming parser
+SCAN_STREAM_MAX_VALUE_SIZE = 1024 * 1024  # Characters a single field or product entry may take before it is rejected
+PRODUCTS_NOT_LAST_ERROR = "The products must be the last field of the document."
+
+class ScanError(ValueError):
+    # A scanned document that cannot be imported; the message is shown to the user as is
+    pass
+
+def check_products_last(data):
+    # One rule for every document, whatever its size: the streaming import only sees the fields read before
+    # the products, so a field after them is rejected rather than used or ignored depending on the file size
+    if list(data)[-1] != "products":
+        raise ScanError(PRODUCTS_NOT_LAST_ERROR)
+
+def parse_decimal(value, field):
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, TypeError):
+        raise ScanError(f"Invalid {field}: {value}")
+
+def validate_purchase_header(data):
+    # Checks the purchase fields other than products, without touching the database
+    if not isinstance(data, dict) or not (PURCHASE_REQUIRED_FIELDS - {"products"}).issubset(data.keys()):
+        raise ScanError("Missing required fields in JSON.")
+    invoice_number = str(data["invoice_number"]) if data.get("invoice_number") else ''
+    if is_document_number('purchase', invoice_number):
+        raise ScanError(f"Invoice number {invoice_number} has the format reserved for automatic numbering. Leave it out instead.")
+    return {
+        'invoice_number': invoice_number,
+        'manufacturer': str(data["manufacturer"]),
+        'purchase_date': make_aware_datetime(str(data["purchase_date"])),
+        'total_cost': parse_decimal(data["total_cost"], "total cost"),
+        'remarks': data.get("remarks", ""),
+    }
+
+def validate_purchase_line(number, item):
+    # Checks one entry of a purchase's products, without touching the database
+    if not isinstance(item, dict) or not PURCHASE_LINE_REQUIRED_FIELDS.issubset(item.keys()):
+        raise ScanError(f"Missing required fields in product #{number}.")
+    quantity = item["quantity"]
+    if not isinstance(quantity, int) or quantity < 1:
+        raise ScanError(f"Invalid quantity for {item['product']}: {quantity}")
+    expiry_date = parse_date(str(item["expiry_date"]))
+    if expiry_date is None:
+        raise ScanError(f"Invalid expiry date for {item['product']}: {item['expiry_date']}")
+    return {
+        'product': str(item["product"]),
+        'batch_number': item.get("batch_number", ""),
+        'quantity': quantity,
+        'purchase_price': parse_decimal(item["purchase_price"], f"purchase price for {item['product']}"),
+        'expiry_date': expiry_date,
+    }
+
+def validate_purchase_document(data):
+    """
+    Checks the structure and values of a scanned purchase document, without touching the database.
+
+    :param data: The decoded JSON document
+    :return: Dict with the normalized invoice_number, manufacturer, purchase_date, total_cost, remarks and products
+    :raises ScanError: On the first problem found
+    """
+    if not isinstance(data, dict) or not PURCHASE_REQUIRED_FIELDS.issubset(data.keys()):
+        raise ScanError("Missing required fields in JSON.")
+    if not isinstance(data["products"], list) or not data["products"]:
+        raise ScanError("The purchase has no products.")
+    check_products_last(data)
+    document = validate_purchase_header(data)
+    document['products'] = [validate_purchase_line(number, item) for number, item in enumerate(data["products"], start=1)]
+    return document
+
+def build_purchase_transaction(document, user):
+    """
+    Builds the unsaved PurchaseTransaction of a validated purchase document.
+
+    :raises ScanError: If the manufacturer is unknown or the invoice number is taken
+    """
+    manufacturer = Manufacturer.objects.filter(name=document['manufacturer']).first()
+    if not manufacturer:
+        raise ScanError(f"Manufacturer '{document['manufacturer']}' not found.")
+
+    if document['invoice_number'] and PurchaseTransaction.objects.filter(invoice_number=document['invoice_number']).exists():
+        raise ScanError(f"Invoice number {document['invoice_number']} already exists.")
+
+    return PurchaseTransaction(
+        invoice_number=document['invoice_number'],
+        manufacturer=manufacturer,
+        purchase_date=document['purchase_date'],
+        total_cost=document['total_cost'],
+        remarks=document['remarks'],
+        created_by=user if user.is_authenticated else None
+    )
+
+def purchased_products(lines, products):
+    # Builds the unsaved PurchasedProducts of validated lines from a {name: Product} dict, naming every unknown product
+    missing = [line['product'] for line in lines if line['product'] not in products]
+    if missing:
+        raise ScanError(f"Product not found: {', '.join(dict.fromkeys(missing))}")
+
+    return [
+        PurchasedProduct(
+            product=products[line['product']],
+            batch_number=line['batch_number'],
+            quantity=line['quantity'],
+            purchase_price=line['purchase_price'],
+            expiry_date=line['expiry_date']
+        )
+        for line in lines
+    ]
+
+def build_purchased_products(manufacturer, lines):
+    """
+    Resolves the product names of validated purchase lines with one query, whatever their number.
+
+    :return: List of unsaved PurchasedProducts
+    :raises ScanError: If a product is unknown
+    """
+    # Served by product_manufacturer_name_idx; on duplicate names the most recently updated product wins, like .first()
+    products = {}
+    names = {line['product'] for line in lines}
+    for product in Product.objects.filter(manufacturer=manufacturer, name__in=names).order_by('-updated_at'):
+        products.setdefault(product.name, product)
+    return purchased_products(lines, products)
+
+def build_purchases(documents, user):
+    """
+    Resolves the manufacturers, invoice numbers and product names of a batch of validated purchase
+    documents, with one query each whatever the number of documents and lines.
+
+    :param documents: List of dicts returned by validate_purchase_document
+    :param user: The user importing the documents
+    :return: List parallel to documents, holding (unsaved PurchaseTransaction, list of unsaved PurchasedProducts)
+             as taken by commit_purchases, or the error message of a document that cannot be imported
+    """
+    manufacturers = {
+        manufacturer.name: manufacturer
+        for manufacturer in Manufacturer.objects.filter(name__in={document['manufacturer'] for document in documents})
+    }
+
+    numbers = {document['invoice_number'] for document in documents if document['invoice_number']}
+    taken_numbers = set(PurchaseTransaction.objects.filter(invoice_number__in=numbers).values_list('invoice_number', flat=True)) if numbers else set()
+
+    # Served by product_manufacturer_name_idx; on duplicate names the most recently updated product wins, like .first()
+    products = defaultdict(dict)  # Manufacturer ID -> name -> Product
+    names = {line['product'] for document in documents for line in document['products']}
+    for product in Product.objects.filter(manufacturer__in=manufacturers.values(), name__in=names).order_by('-updated_at'):
+        products[product.manufacturer_id].setdefault(product.name, product)
+
+    results = []
+    for document in documents:
+        manufacturer = manufacturers.get(document['manufacturer'])
+        if manufacturer is None:
+            results.append(f"Manufacturer '{document['manufacturer']}' not found.")
+            continue
+        if document['invoice_number'] in taken_numbers:
+            results.append(f"Invoice number {document['invoice_number']} already exists.")
+            continue
+        try:
+            lines = purchased_products(document['products'], products[manufacturer.id])
+        except ScanError as e:
+            results.append(str(e))
+            continue
+        if document['invoice_number']:
+            taken_numbers.add(document['invoice_number'])  # A later document of the batch cannot reuse it
+        results.append((
+            PurchaseTransaction(
+                invoice_number=document['invoice_number'],
+                manufacturer=manufacturer,
+                purchase_date=document['purchase_date'],
+                total_cost=document['total_cost'],
+                remarks=document['remarks'],
+                created_by=user if user.is_authenticated else None
+            ),
+            lines
+        ))
+    return results
+
+def build_purchase(document, user):
+    """
+    Resolves the manufacturer and every product name of a validated purchase document,
+    with one query each whatever the number of lines.
+
+    :param document: Dict returned by validate_purchase_document
+    :param user: The user importing the document
+    :return: (unsaved PurchaseTransaction, list of unsaved PurchasedProducts), as taken by commit_purchase
+    :raises ScanError: If the manufacturer or a product is unknown, or the invoice number is taken
+    """
+    outcome, = build_purchases([document], user)
+    if isinstance(outcome, str):
+        raise ScanError(outcome)
+    return outcome
+
+def validate_sale_header(data):
+    # Checks the sale fields other than products, without touching the database
+    if not isinstance(data, dict) or not (SALE_REQUIRED_FIELDS - {"products"}).issubset(data.keys()):
+        raise ScanError("Missing required fields in JSON.")
+    if data["payment_method"] not in dict(SaleTransaction._meta.get_field('payment_method').choices):
+        raise ScanError(f"Unknown payment method: {data['payment_method']}")
+    transaction_number = str(data["transaction_number"]) if data.get("transaction_number") else ''
+    if is_document_number('sale', transaction_number):
+        raise ScanError(f"Transaction number {transaction_number} has the format reserved for automatic numbering. Leave it out instead.")
+    return {
+        'transaction_number': transaction_number,
+        'transaction_date': make_aware_datetime(str(data["transaction_date"])),
+        'customer': str(data["customer"]).strip() if data.get("customer") else '',
+        'discount': parse_decimal(data["discount"], "discount"),
+        'cash_received': parse_decimal(data["cash_received"], "cash received"),
+        'payment_method': data["payment_method"],
+        'remarks': data.get("remarks", ""),
+    }
+
+def validate_sale_line(number, item):
+    # Checks one entry of a sale's products, without touching the database
+    if not isinstance(item, dict) or not SALE_LINE_REQUIRED_FIELDS.issubset(item.keys()):
+        raise ScanError(f"Missing required fields in product #{number}.")
+    if not isinstance(item["inventory_id"], int) or not isinstance(item["quantity"], int) or item["quantity"] < 1:
+        raise ScanError(f"Invalid inventory item or quantity in product #{number}.")
+    return {
+        'inventory_id': item["inventory_id"],
+        'quantity': item["quantity"],
+        'sale_price': parse_decimal(item["sale_price"], f"sale price in product #{number}") if item.get("sale_price") is not None else None,
+    }
+
+def validate_sale_document(data):
+    """
+    Checks the structure and values of a scanned sale document, without touching the database.
+
+    :param data: The decoded JSON document
+    :return: Dict with the normalized transaction_number, transaction_date, customer, discount, cash_received,
+             payment_method, remarks and products
+    :raises ScanError: On the first problem found
+    """
+    if not isinstance(data, dict) or not SALE_REQUIRED_FIELDS.issubset(data.keys()):
+        raise ScanError("Missing required fields in JSON.")
+    if not isinstance(data["products"], list) or not data["products"]:
+        raise ScanError("The sale has no products.")
+    check_products_last(data)
+    document = validate_sale_header(data)
+    document['products'] = [validate_sale_line(number, item) for number, item in enumerate(data["products"], start=1)]
+    return document
+
+def resolve_scan_customers(names, user):
+    """
+    Returns the customers of scanned sales by full name, creating the unknown ones in bulk.
+
+    :param names: Iterable of customer full names
+    :param user: The user importing the sales, to whom the new customers are logged
+    :return: Dict mapping full name to Customer
+    """
+    names = set(names) - {''}
+    if not names:
+        return {}
+    customers = {}
+    for customer in Customer.objects.filter(full_name__in=names).order_by('id'):
+        customers.setdefault(customer.full_name, customer)
+    created = Customer.objects.bulk_create([Customer(full_name=name) for name in sorted(names - customers.keys())])
+    if created and user.is_authenticated:
+        ActivityLog.objects.bulk_create([
+            ActivityLog(user=user, action="added customer via scan", additional_info=f"Customer '{customer.full_name}' added during scanned sale transaction")
+            for customer in created
+        ])
+    customers.update((customer.full_name, customer) for customer in created)
+    return customers
+
+def build_sale_transaction(document, customers, user):
+    # Builds the unsaved SaleTransaction of a validated sale document
+    return SaleTransaction(
+        transaction_number=document['transaction_number'],
+        customer=customers.get(document['customer']),
+        transaction_date=document['transaction_date'],
+        discount=document['discount'],
+        cash_received=document['cash_received'],
+        payment_method=document['payment_method'],
+        remarks=document['remarks'],
+        created_by=user if user.is_authenticated else None
+    )
+
+def build_sale(document, customers, user):
+    """
+    Builds an unsaved sale from a validated sale document.
+
+    :param document: Dict returned by validate_sale_document
+    :param customers: Dict returned by resolve_scan_customers
+    :param user: The user importing the document
+    :return: (sale_transaction, lines, sale_prices), as taken by commit_sales
+    """
+    lines = [(line['inventory_id'], None, line['quantity']) for line in document['products']]
+    return build_sale_transaction(document, customers, user), lines, [line['sale_price'] for line in document['products']]
+
+class JsonStreamReader:
+    """
+    Pulls complete JSON values out of a binary stream, holding only the unparsed tail of what was read.
+
+    Values are decoded with json.JSONDecoder.raw_decode as soon as they are complete in the buffer;
+    one that does not fit in SCAN_STREAM_MAX_VALUE_SIZE characters is rejected, so memory stays bounded.
+    """
+    decoder = json.JSONDecoder()
+
+    def __init__(self, stream, read_size=SCAN_STREAM_READ_SIZE):
+        self.stream = stream
+        self.read_size = read_size
+        self.text = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        # Drops the parsed part of the buffer and appends the next read; False at the end of the stream
+        if self.eof:
+            return False
+        data = self.stream.read(self.read_size)
+        self.eof = not data
+        self.buffer = self.buffer[self.pos:] + self.text.decode(data, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        # Next significant character, '' at the end of the stream
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ScanError(f"Invalid JSON: expected '{char}'.")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if len(self.buffer) - self.pos > SCAN_STREAM_MAX_VALUE_SIZE:
+                    raise ScanError(f"Invalid JSON or oversized entry: {e.msg}")
+                if not self.fill():
+                    raise ScanError(f"Invalid JSON: {e.msg}")
+                continue
+            # A number or literal ending with the buffer may go on in the next read
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+def iter_json_events(stream, array_key="products", read_size=SCAN_STREAM_READ_SIZE):
+    """
+    Incrementally parses a JSON object from a binary stream, without ever holding the whole document.
+
+    :param stream: File-like object opened in binary mode, e.g. an UploadedFile
+    :param array_key: Top-level field whose array items are yielded one by one
+    :param read_size: Bytes read at a time
+    :return: Generator of ('field', key, value) for the other top-level fields and ('item', value) for each array item
+    :raises ScanError: If the stream is not a JSON object
+    """
+    reader = JsonStreamReader(stream, read_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise ScanError("Invalid JSON: expected a field name.")
+            reader.expect(':')
+            if key == array_key and reader.peek() == '[':
+                reader.pos += 1
+                if reader.peek() == ']':
+                    reader.pos += 1
+                else:
+                    while True:
+                        yield 'item', reader.value()
+                        if reader.peek() == ']':
+                            reader.pos += 1
+                            break
+                        reader.expect(',')
+            else:
+                yield 'field', key, reader.value()
+            if reader.peek() == '}':
+                reader.pos += 1
+                break
+            reader.expect(',')
+    if reader.peek():
+        raise ScanError("Invalid JSON: unexpected data after the document.")
+
+def split_streamed_document(stream):
+    """
+    Reads the fields of a scanned document up to its first product, leaving the products to be streamed.
+
+    :param stream: The uploaded document, in binary mode
+    :return: (dict of the fields before "products", iterator over the product entries)
+    """
+    events = iter_json_events(stream)
+    header = {}
+    for event in events:
+        if event[0] == 'item':
+            first = event[1:]
+            break
+        header[event[1]] = event[2]
+    else:
+        first = ()
+
+    def products():
+        yield from first
+        for event in events:
+            if event[0] == 'field':
+                raise ScanError(PRODUCTS_NOT_LAST_ERROR)  # Too late to be used, and rejected in small files too (see check_products_last)
+            yield event[1]
+
+    return header, products()
+
+def iter_chunks(items, chunk_size):
+    # Yields lists of up to chunk_size consecutive items
+    items = iter(items)
+    while chunk := list(islice(items, chunk_size)):
+        yield chunk
+
+def import_streamed_purchase(header, products, user, chunk_size=SCAN_STREAM_CHUNK_SIZE):
+    """
+    Imports a purchase document whose products are streamed, `chunk_size` entries at a time.
+
+    Each chunk is validated, its product names resolved with one query and committed with commit_purchase,
+    so memory does not grow with the document; the whole purchase is still one transaction.
+
+    :param header: Fields of the document before its products, from split_streamed_document
+    :param products: Iterator over the raw product entries
+    :param user: The user importing the document
+    :param chunk_size: Number of products validated and written together
+    :return: The saved PurchaseTransaction
+    :raises ScanError: On the first problem found; nothing is written then
+    """
+    document = validate_purchase_header(header)
+    with transaction.atomic():
+        purchase_transaction = build_purchase_transaction(document, user)  # Saved, and numbered if needed, by the first commit_purchase
+        count = 0
+        for chunk in iter_chunks(products, chunk_size):
+            lines = [validate_purchase_line(count + number, item) for number, item in enumerate(chunk, start=1)]
+            count += len(chunk)
+            commit_purchase(purchase_transaction, build_purchased_products(purchase_transaction.manufacturer, lines))
+        if not count:
+            raise ScanError("The purchase has no products.")
+    return purchase_transaction
+
+def import_streamed_sale(header, products, user, chunk_size=SCAN_STREAM_CHUNK_SIZE):
+    """
+    Imports a sale document whose products are streamed, `chunk_size` entries at a time.
+
+    Each chunk is validated and committed with commit_sale on the same SaleTransaction, whose price
+    and total are summed over the chunks; the whole sale is still one transaction.
+
+    :param header: Fields of the document before its products, from split_streamed_document
+    :param products: Iterator over the raw product entries
+    :param user: The user importing the document
+    :param chunk_size: Number of products validated and written together
+    :return: The saved SaleTransaction
+    :raises ScanError: On the first problem found, including missing stock; nothing is written then
+    """
+    document = validate_sale_header(header)
+    with transaction.atomic():
+        if document['transaction_number'] and SaleTransaction.objects.filter(transaction_number=document['transaction_number']).exists():
+            raise ScanError(f"Transaction number {document['transaction_number']} already exists.")
+        customers = resolve_scan_customers([document['customer']], user)
+        sale_transaction = build_sale_transaction(document, customers, user)
+        if not sale_transaction.transaction_number:
+            sale_transaction.transaction_number = next_document_numbers('sale', sale_transaction.transaction_date.year)[0]
+        sale_transaction.price = sale_transaction.total = Decimal('0.00')
+        sale_transaction.save()
+
+        sale_date = sale_transaction.transaction_date.date()
+        price = Decimal('0.00')
+        count = 0
+        for chunk in iter_chunks(products, chunk_size):
+            lines = [validate_sale_line(count + number, item) for number, item in enumerate(chunk, start=1)]
+            count += len(chunk)
+            try:
+                commit_sale(sale_transaction, [(line['inventory_id'], None, line['quantity']) for line in lines], sale_date, [line['sale_price'] for line in lines])
+            except InsufficientStockError as e:
+                raise ScanError(str(e))
+            price += sale_transaction.price  # commit_sale prices the current chunk only
+        if not count:
+            raise ScanError("The sale has no products.")
+
+        sale_transaction.price = price
+        sale_transaction.total = price - sale_transaction.discount
+        sale_transaction.save(update_fields=['price', 'total'])
+    return sale_transaction
+
+def import_streamed_scan(stream, user, kind, chunk_size=SCAN_STREAM_CHUNK_SIZE):
+    """
+    Imports one scanned document from its upload stream without loading it whole, for documents too
+    big for json.load. The fields other than products must come before the products array, as in every
+    scanned document (see check_products_last).
+
+    :param stream: The uploaded document, in binary mode (in memory or a temporary file)
+    :param user: The user importing the document
+    :param kind: 'purchase' or 'sale'
+    :param chunk_size: Number of products validated and written together
+    :return: The saved PurchaseTransaction or SaleTransaction
+    :raises ScanError: If the document cannot be imported
+    """
+    header, products = split_streamed_document(stream)
+    if kind == 'purchase':
+        return import_streamed_purchase(header, products, user, chunk_size)
+    return import_streamed_sale(header, products, user, chunk_size)
+
+def iter_scan_files(source):
+    """
+    Yields (name, content) for every JSON document of a scan import source.
+
+    :param source: Path of a directory, a .zip archive or a .json file, or an uploaded .zip or .json file
+    """
+    name = Path(getattr(source, 'name', str(source))).name
+    if isinstance(source, (str, Path)) and Path(source).is_dir():
+        for path in sorted(Path(source).glob('*.json')):
+            yield path.name, path.read_bytes()
+    elif name.lower().endswith('.zip'):
+        with zipfile.ZipFile(source) as archive:
+            for member in sorted(archive.namelist()):
+                if member.lower().endswith('.json') and not member.endswith('/'):
+                    yield f"{name}/{member}", archive.read(member)
+    elif isinstance(source, (str, Path)):
+        yield name, Path(source).read_bytes()
+    else:
+        yield name, source.read()
+
+def read_scan_document(named_content):
+    # Runs in a worker process: decodes and validates one document, without database access
+    name, content = named_content
+    try:
+        data = json.loads(content)
+        if isinstance(data, dict) and "manufacturer" in data:
+            return {'file': name, 'kind': 'purchase', 'document': validate_purchase_document(data)}
+        if isinstance(data, dict) and "transaction_date" in data:
+            return {'file': name, 'kind': 'sale', 'document': validate_sale_document(data)}
+        raise ScanError("Neither a purchase nor a sale document.")
+    except (ScanError, ValueError, KeyError, TypeError) as e:  # Includes malformed JSON and encodings
+        return {'file': name, 'kind': None, 'status': 'error', 'error': str(e)}
+
+def parse_scan_files(files, workers=1):
+    """
+    Decodes and validates scanned documents, in a process pool when workers > 1.
+
+    :param files: List of (name, content) pairs
+    :param workers: Number of worker processes; 1 parses in-process
+    :return: List parallel to files, as returned by read_scan_document
+    """
+    if workers <= 1 or len(files) <= 1:
+        return [read_scan_document(named_content) for named_content in files]
+    # The workers never touch the database, so the parent's connection (and its open transaction) is left alone.
+    # They set Django up themselves, so the pool works with any start method, not only fork
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        return list(executor.map(read_scan_document, files, chunksize=max(1, len(files) // (workers * 4))))
+
+def import_scans(files, user, workers=1, batch_size=SCAN_IMPORT_BATCH_SIZE):
+    """
+    Imports many scanned purchase and sale documents at once.
+
+    Documents are parsed and validated in parallel, then committed in batches of `batch_size` per
+    transaction: purchases through build_purchases and commit_purchases, and sales in transaction
+    date order through commit_sales. Either way a bad document only rejects itself.
+
+    :param files: List of (name, content) pairs, e.g. from iter_scan_files
+    :param user: The user importing the documents
+    :param workers: Number of worker processes for parsing
+    :param batch_size: Number of documents committed per transaction
+    :return: Per-file report: list of dicts with file, kind, status ('created' or 'error') and number or error
+    """
+    results = parse_scan_files(files, workers)
+    created_by = user if user.is_authenticated else None
+
+    purchases = [result for result in results if result['kind'] == 'purchase']
+    for start in range(0, len(purchases), batch_size):
+        chunk = purchases[start:start + batch_size]
+        try:
+            with transaction.atomic():
+                outcomes = build_purchases([result['document'] for result in chunk], user)
+                accepted = [outcome for outcome in outcomes if not isinstance(outcome, str)]
+                commit_purchases(accepted)
+                if created_by:
+                    ActivityLog.objects.bulk_create([
+                        ActivityLog(user=created_by, action="scanned purchase transaction", additional_info=f"Invoice #{purchase_transaction.invoice_number}, Manufacturer: {purchase_transaction.manufacturer.name}")
+                        for purchase_transaction, _ in accepted
+                    ])
+        except IntegrityError as e:
+            # An invoice number taken concurrently: this batch was rolled back
+            outcomes = [f"Batch rolled back: {e}"] * len(chunk)
+        for result, outcome in zip(chunk, outcomes):
+            if isinstance(outcome, str):
+                result.update(status='error', error=outcome)
+            else:
+                result.update(status='created', number=outcome[0].invoice_number)
+
+    sales = sorted((result for result in results if result['kind'] == 'sale'), key=lambda result: result['document']['transaction_date'])
+    for start in range(0, len(sales), batch_size):
+        chunk = sales[start:start + batch_size]
+        try:
+            with transaction.atomic():
+                customers = resolve_scan_customers((result['document']['customer'] for result in chunk), user)
+                outcomes = commit_sales([build_sale(result['document'], customers, user) for result in chunk])
+                if created_by:
+                    ActivityLog.objects.bulk_create([
+                        ActivityLog(user=created_by, action="scanned sale transaction", additional_info=f"Transaction #{outcome.transaction_number}")
+                        for outcome in outcomes if isinstance(outcome, SaleTransaction)
+                    ])
+        except (InsufficientStockError, IntegrityError) as e:
+            # Optimistic stock conflict or a number taken concurrently: this batch was rolled back
+            outcomes = [f"Batch rolled back: {e}"] * len(chunk)
+        for result, outcome in zip(chunk, outcomes):
+            if isinstance(outcome, SaleTransaction):
+                result.update(status='created', number=outcome.transaction_number)
+            else:
+                result.update(status='error', error=outcome)
+
+    for result in results:
+        result.pop('document', None)
+    return results
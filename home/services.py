@@ -0,0 +1,1080 @@
+# home/services.py
+import re
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError, ProgrammingError
+from django.dispatch import Signal
+from django.db.models import Sum, Min, Q, F, Value, DateField, DateTimeField, DurationField, ExpressionWrapper, OuterRef, Subquery
+from django.db.models.functions import Coalesce, ExtractDay
+from django.utils import timezone
+
+from .models import Product, Inventory, ProductStock, StockMovement, StockSnapshot, PurchaseTransaction, PurchasedProduct, SoldProduct, SaleTransaction, WriteOff, Discount, EffectivePrice
+
+EXPIRY_WARNING_DAYS = 30  # Inventory expiring within this many days is shown on the homepage
+
+SNAPSHOT_SETTLE_TIME = timedelta(minutes=5)  # Snapshots stop this far in the past, so no in-flight transaction can still add a movement before them
+
+LEDGER_START = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)  # Lower bound for products that have no snapshot yet
+
+stock_changed = Signal()  # Sent with product_ids once sync_product_stock has been committed
+
+class InsufficientStockError(Exception):
+    pass
+
+def next_document_numbers(kind, year, count=1):
+    """
+    Hands out server-generated sale or purchase numbers, e.g. 'S-2025-000042'.
+
+    Numbers come from one PostgreSQL sequence per kind and year, so numbering restarts every year
+    and concurrent checkouts never get the same number: no pre-check query, no late unique violation.
+    The sequence is created on the first number of the year. Sequences are not transactional, so a
+    rolled back sale leaves a gap in the numbering.
+
+    :param kind: 'sale' or 'purchase', a key of settings.DOCUMENT_NUMBER_PREFIXES
+    :param year: The year of the transaction date
+    :param count: How many numbers to reserve, fetched in one query
+    :return: List of the reserved numbers, in ascending order
+    """
+    prefix = settings.DOCUMENT_NUMBER_PREFIXES[kind]
+    sequence = f"home_{kind}_number_{int(year)}"
+    query = "SELECT nextval(%s::regclass) FROM generate_series(1, %s)"
+    with connection.cursor() as cursor:
+        try:
+            with transaction.atomic():
+                cursor.execute(query, [sequence, count])
+                values = [value for value, in cursor.fetchall()]
+        except ProgrammingError:  # First number of the year
+            try:
+                with transaction.atomic():
+                    cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {sequence}")
+            except IntegrityError:  # Created concurrently by another checkout
+                pass
+            cursor.execute(query, [sequence, count])
+            values = [value for value, in cursor.fetchall()]
+    return [f"{prefix}-{int(year)}-{value:06d}" for value in sorted(values)]
+
+def is_document_number(kind, number):
+    # Whether a hand-typed number has the server-generated format, which is reserved for next_document_numbers
+    return re.fullmatch(rf"{re.escape(settings.DOCUMENT_NUMBER_PREFIXES[kind])}-\d{{4}}-\d{{6,}}", number or '') is not None
+
+def sync_product_stock(product_ids):
+    """
+    Recomputes the ProductStock rows of the given products from their Inventory rows.
+
+    Must be called in the same transaction as the Inventory write it follows. The ProductStock rows
+    are locked (in product_id order) before Inventory is re-aggregated, so two concurrent sales of
+    the same product serialize here and the later one always sees the committed quantities of the other.
+
+    :param product_ids: Iterable of product IDs whose stock changed
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+
+    with transaction.atomic():
+        ProductStock.objects.bulk_create(
+            [ProductStock(product_id=product_id) for product_id in product_ids],
+            ignore_conflicts=True
+        )
+        stock_rows = list(
+            ProductStock.objects.select_for_update()
+            .filter(product_id__in=product_ids)
+            .order_by('product_id')
+        )
+
+        totals = {
+            row['product_id']: row
+            for row in (
+                Inventory.objects
+                .filter(product_id__in=product_ids)
+                .values('product_id')
+                .annotate(
+                    on_hand=Sum('quantity'),
+                    earliest_expiry=Min('expiry_date', filter=Q(quantity__gt=0)),
+                )
+            )
+        }
+
+        now = timezone.now()
+        for stock in stock_rows:
+            total = totals.get(stock.product_id, {})
+            stock.on_hand = total.get('on_hand') or 0
+            stock.earliest_expiry = total.get('earliest_expiry')
+            stock.last_movement_at = now
+
+        ProductStock.objects.bulk_update(stock_rows, ['on_hand', 'earliest_expiry', 'last_movement_at'])
+
+        transaction.on_commit(lambda: stock_changed.send(sender=ProductStock, product_ids=product_ids))
+
+def find_product_stock_drift(product_ids=None):
+    """
+    Compares ProductStock with the live Inventory aggregates and returns the rows that disagree.
+
+    The comparison runs as a single SELECT, so it reads one consistent snapshot even while sales are
+    being committed; a product without a ProductStock row counts as 0 on hand.
+
+    :param product_ids: Optional iterable of product IDs to restrict the check to
+    :return: List of dicts with the recorded and expected values of every drifted product
+    """
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+
+    rows = (
+        products
+        .annotate(
+            expected_on_hand=Sum('inventory__quantity'),
+            expected_earliest_expiry=Min('inventory__expiry_date', filter=Q(inventory__quantity__gt=0)),
+        )
+        .values(
+            'id', 'name',
+            'expected_on_hand', 'expected_earliest_expiry',
+            'stock_level__on_hand', 'stock_level__earliest_expiry',
+        )
+        .order_by('id')
+    )
+
+    drift = []
+    for row in rows.iterator():
+        expected_on_hand = row['expected_on_hand'] or 0
+        recorded_on_hand = row['stock_level__on_hand'] or 0
+        if (expected_on_hand != recorded_on_hand
+                or row['expected_earliest_expiry'] != row['stock_level__earliest_expiry']):
+            drift.append({
+                'product_id': row['id'],
+                'product': row['name'],
+                'recorded_on_hand': recorded_on_hand,
+                'expected_on_hand': expected_on_hand,
+                'recorded_earliest_expiry': row['stock_level__earliest_expiry'],
+                'expected_earliest_expiry': row['expected_earliest_expiry'],
+            })
+    return drift
+
+def low_stock_products():
+    """
+    Returns the products whose stock on hand is below their category's low stock threshold.
+
+    The comparison is a single SQL query (Product LEFT JOIN ProductStock JOIN Category), so it can be
+    counted and sliced by the paginator at the database instead of being filtered in Python.
+    Each product is annotated with total_quantity, and with suggested_quantity and days_of_cover from
+    its ReorderSuggestion (None when the reorder engine has not suggested it).
+    """
+    return (
+        Product.objects
+        .select_related('category')
+        .annotate(
+            total_quantity=Coalesce('stock_level__on_hand', Value(0)),
+            suggested_quantity=F('reorder_suggestion__suggested_quantity'),
+            days_of_cover=F('reorder_suggestion__days_of_cover'),
+        )
+        .filter(total_quantity__lt=F('category__low_stock_threshold'))
+        .order_by('-updated_at', 'id')
+    )
+
+def expiring_inventory(today):
+    """
+    Returns the in-stock inventory items that are expired or expire within EXPIRY_WARNING_DAYS.
+
+    Each item is annotated with days_diff (days until expiry, negative once expired), computed in SQL
+    so that only the rows of the page actually fetched pay for it.
+
+    :param today: The reference date
+    """
+    cutoff_date = today + timedelta(days=EXPIRY_WARNING_DAYS)
+    return (
+        Inventory.objects
+        .filter(expiry_date__lte=cutoff_date, quantity__gt=0)
+        .annotate(days_diff=ExtractDay(ExpressionWrapper(
+            F('expiry_date') - Value(today, output_field=DateField()),
+            output_field=DurationField()
+        )))
+    )
+
+def effective_price_segments(sale_price, discounts):
+    """
+    Splits the timeline into date ranges with a constant price for one product.
+
+    Discounts active on the same day add up, capped at 100%. Adjacent ranges with the same price are merged.
+
+    :param sale_price: The product's list price
+    :param discounts: Iterable of (from_date, to_date, percentage) tuples of the product's discounts
+    :return: List of (from_date, to_date, price) tuples covering date.min to date.max
+    """
+    discounts = list(discounts)
+    boundaries = {date.min}
+    for from_date, to_date, _ in discounts:
+        boundaries.add(from_date)
+        if to_date < date.max:
+            boundaries.add(to_date + timedelta(days=1))
+    boundaries = sorted(boundaries)
+
+    segments = []
+    for index, from_date in enumerate(boundaries):
+        to_date = boundaries[index + 1] - timedelta(days=1) if index + 1 < len(boundaries) else date.max
+        total_percentage = sum(
+            (percentage for start, end, percentage in discounts if start <= from_date <= end),
+            Decimal('0.00')
+        )
+        if total_percentage:
+            total_percentage = min(total_percentage, Decimal('100.00'))
+            price = round(sale_price * (Decimal('1.00') - total_percentage / Decimal('100.00')), 2)
+        else:
+            price = sale_price
+
+        if segments and segments[-1][2] == price:
+            segments[-1] = (segments[-1][0], to_date, price)
+        else:
+            segments.append((from_date, to_date, price))
+    return segments
+
+def product_discounts(product_ids):
+    # (from_date, to_date, percentage) of every discount of the given products, as taken by effective_price_segments
+    discounts = defaultdict(list)
+    for product_id, from_date, to_date, percentage in (
+        Discount.products.through.objects
+        .filter(product_id__in=product_ids)
+        .values_list('product_id', 'discount__from_date', 'discount__to_date', 'discount__percentage')
+    ):
+        discounts[product_id].append((from_date, to_date, percentage))
+    return discounts
+
+def rebuild_effective_prices(product_ids):
+    """
+    Recomputes the EffectivePrice rows of the given products from their sale price and discounts.
+
+    Called whenever a Discount, its products or a Product's sale price change, in the same transaction,
+    and by the rebuild_effective_prices command for changes the signals do not see (bulk_create, .update()).
+
+    :param product_ids: Iterable of product IDs to rebuild
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+
+    discounts = product_discounts(product_ids)
+    with transaction.atomic():
+        EffectivePrice.objects.filter(product_id__in=product_ids).delete()
+        EffectivePrice.objects.bulk_create([
+            EffectivePrice(product_id=product_id, from_date=from_date, to_date=to_date, price=price)
+            for product_id, sale_price in Product.objects.filter(id__in=product_ids).values_list('id', 'sale_price')
+            for from_date, to_date, price in effective_price_segments(sale_price, discounts.get(product_id, []))
+        ], batch_size=1000)
+
+def find_effective_price_drift(product_ids):
+    """
+    Compares the EffectivePrice rows of the given products with the ones their sale price and discounts imply.
+
+    :param product_ids: Iterable of product IDs to check
+    :return: List of dicts with the recorded and expected date ranges of every drifted product
+    """
+    product_ids = sorted(set(product_ids))
+    discounts = product_discounts(product_ids)
+    recorded = defaultdict(list)
+    for product_id, from_date, to_date, price in (
+        EffectivePrice.objects
+        .filter(product_id__in=product_ids)
+        .order_by('product_id', 'from_date')
+        .values_list('product_id', 'from_date', 'to_date', 'price')
+    ):
+        recorded[product_id].append((from_date, to_date, price))
+
+    drift = []
+    for product_id, name, sale_price in Product.objects.filter(id__in=product_ids).order_by('id').values_list('id', 'name', 'sale_price'):
+        expected = effective_price_segments(sale_price, discounts.get(product_id, []))
+        if recorded[product_id] != expected:
+            drift.append({
+                'product_id': product_id,
+                'product': name,
+                'recorded_segments': recorded[product_id],
+                'expected_segments': expected,
+            })
+    return drift
+
+def resolve_sale_prices(products, sale_date):
+    """
+    Returns the unit price of each product on a given date, after its active discounts.
+
+    The prices of the whole cart are read from EffectivePrice in one indexed lookup; a product
+    without an EffectivePrice row (e.g. created by bulk_create) falls back to its list price until
+    the rebuild_effective_prices command is run.
+
+    :param products: Iterable of Products being sold
+    :param sale_date: The date of the sale
+    :return: Dict mapping product ID to unit price
+    """
+    prices = {product.id: product.sale_price for product in products}
+    prices.update(
+        EffectivePrice.objects
+        .filter(product_id__in=prices, from_date__lte=sale_date, to_date__gte=sale_date)
+        .values_list('product_id', 'price')
+    )
+    return prices
+
+def inventory_prices(inventory_ids, sale_date):
+    """
+    Returns the list price, discounted price and available quantity of many inventory items.
+
+    The discounted price is read from EffectivePrice in a correlated subquery, so the whole
+    lookup is a single query whatever the number of items.
+
+    :param inventory_ids: IDs of the inventory items
+    :param sale_date: The date the discounts are resolved for
+    :return: Dict mapping inventory ID to a dict of 'price', 'effective_price' and 'available_quantity'
+    """
+    effective_price = (
+        EffectivePrice.objects
+        .filter(product_id=OuterRef('product_id'), from_date__lte=sale_date, to_date__gte=sale_date)
+        .values('price')[:1]
+    )
+    rows = (
+        Inventory.objects
+        .filter(id__in=inventory_ids)
+        .annotate(effective_price=Coalesce(Subquery(effective_price), F('product__sale_price')))
+        .values_list('id', 'product__sale_price', 'effective_price', 'quantity')
+    )
+    return {
+        inventory_id: {'price': price, 'effective_price': discounted, 'available_quantity': quantity}
+        for inventory_id, price, discounted, quantity in rows
+    }
+
+def decrement_stock(quantities, strategy=None):
+    """
+    Subtracts quantities from Inventory rows with the configured STOCK_DECREMENT_STRATEGY.
+
+    'pessimistic': the rows are already locked and validated by the caller, so a single
+    UPDATE ... FROM (VALUES ...) takes the stock out.
+    'optimistic': the rows were read without locking, so each row is decremented by a guarded
+    UPDATE ... WHERE id = %s AND quantity >= %s, in ID order, and a row that no longer has enough
+    stock (zero rows affected) fails the sale. Must be called inside a transaction, which the
+    caller rolls back on InsufficientStockError. ProductStock is then refreshed after commit
+    (see record_stock_movements), so no other row is locked.
+
+    :param quantities: Dict mapping inventory ID to the quantity to subtract
+    :param strategy: 'pessimistic' or 'optimistic', defaults to settings.STOCK_DECREMENT_STRATEGY
+    :raises InsufficientStockError: If an optimistic decrement finds a row short of stock
+    """
+    if not quantities:
+        return
+    strategy = strategy or settings.STOCK_DECREMENT_STRATEGY
+
+    if strategy == 'optimistic':
+        now = timezone.now()
+        table = Inventory._meta.db_table
+        with connection.cursor() as cursor:
+            for inventory_id, quantity in sorted(quantities.items()):
+                cursor.execute(
+                    f"UPDATE {table} SET quantity = quantity - %s, updated_at = %s WHERE id = %s AND quantity >= %s",
+                    [quantity, now, inventory_id, quantity]
+                )
+                if cursor.rowcount != 1:
+                    raise InsufficientStockError(f"Not enough stock left in inventory item #{inventory_id}, it was sold concurrently")
+        return
+
+    adjust_stock({inventory_id: -quantity for inventory_id, quantity in quantities.items()})
+
+def adjust_stock(deltas):
+    """
+    Adds signed quantities to Inventory rows with a single UPDATE ... FROM (VALUES ...).
+
+    The rows must already be locked and validated by the caller, in the same transaction.
+
+    :param deltas: Dict mapping inventory ID to the quantity to add (negative to take stock out)
+    """
+    if not deltas:
+        return
+    values = ", ".join(["(%s, %s)"] * len(deltas))
+    params = [value for item in sorted(deltas.items()) for value in item]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {Inventory._meta.db_table} AS inventory
+            SET quantity = inventory.quantity + delta.quantity, updated_at = %s
+            FROM (VALUES {values}) AS delta (id, quantity)
+            WHERE inventory.id = delta.id
+            """,
+            [timezone.now(), *params]
+        )
+
+def load_sale_batches(lines, sale_date, strategy):
+    """
+    Reads every inventory row a set of sale lines can draw from, in one SELECT ORDER BY id.
+
+    That is the explicitly chosen batches and the sellable batches (in stock, not expired) of products
+    sold by product. With the pessimistic strategy it is a SELECT ... FOR UPDATE, so concurrent sales
+    always lock in the same order and cannot deadlock.
+
+    :param lines: List of (inventory_item_id, product_id, quantity) tuples
+    :param sale_date: The date of the sale
+    :param strategy: 'pessimistic' or 'optimistic'
+    :return: (batches by ID, sellable batches per product in FEFO order, available quantity by batch ID)
+    """
+    inventory_ids = {inventory_item_id for inventory_item_id, _, _ in lines if inventory_item_id}
+    product_ids = {product_id for _, product_id, _ in lines if product_id}
+
+    batches = (
+        Inventory.objects
+        .select_related('product')
+        .filter(Q(id__in=inventory_ids) | Q(product_id__in=product_ids, quantity__gt=0, expiry_date__gte=sale_date))
+        .order_by('id')
+    )
+    if strategy == 'pessimistic':
+        batches = batches.select_for_update(of=('self',))
+    batches = list(batches)
+
+    by_id = {batch.id: batch for batch in batches}
+    by_product = {}
+    for batch in sorted(batches, key=lambda batch: (batch.expiry_date, batch.id)):
+        if batch.quantity > 0 and batch.expiry_date >= sale_date:
+            by_product.setdefault(batch.product_id, []).append(batch)
+    available = {batch.id: batch.quantity for batch in batches}
+    return by_id, by_product, available
+
+def allocate_sale_lines(lines, sale_prices, by_id, by_product, available, sale_date=None):
+    """
+    Validates the lines of one sale against the available quantities and allocates them to batches.
+
+    Lines sold by product take the earliest expiring batches first, skipping batches expired on
+    sale_date. `available` is only updated when every line of the sale can be fulfilled.
+
+    :param lines: List of (inventory_item_id, product_id, quantity) tuples, with exactly one of the two IDs set
+    :param sale_prices: Optional list of unit prices parallel to lines; None entries use the discounted price
+    :param by_id: Batches by ID, from load_sale_batches
+    :param by_product: Sellable batches per product, from load_sale_batches
+    :param available: Available quantity by batch ID, from load_sale_batches
+    :param sale_date: Optional date of the sale, when later than the one the batches were loaded for
+    :return: List of (batch, quantity, sale_price) tuples
+    :raises InsufficientStockError: If any line cannot be fulfilled
+    """
+    remaining_stock = dict(available)
+    allocations = []
+    for (inventory_item_id, product_id, quantity), sale_price in zip(lines, sale_prices or [None] * len(lines)):
+        if inventory_item_id:
+            batch = by_id.get(inventory_item_id)
+            if batch is None:
+                raise InsufficientStockError(f"Inventory item #{inventory_item_id} does not exist")
+            if remaining_stock[batch.id] < quantity:
+                raise InsufficientStockError(f"Not enough stock for {batch.product.name} (only {remaining_stock[batch.id]} available)")
+            remaining_stock[batch.id] -= quantity
+            allocations.append((batch, quantity, sale_price))
+            continue
+
+        remaining = quantity
+        for batch in by_product.get(product_id, []):
+            if sale_date and batch.expiry_date < sale_date:
+                continue
+            taken = min(remaining_stock[batch.id], remaining)
+            if taken:
+                remaining_stock[batch.id] -= taken
+                allocations.append((batch, taken, sale_price))
+                remaining -= taken
+            if remaining == 0:
+                break
+        if remaining:
+            name = by_product[product_id][0].product.name if by_product.get(product_id) else f"product #{product_id}"
+            raise InsufficientStockError(f"Not enough stock for {name} (only {quantity - remaining} available)")
+
+    available.update(remaining_stock)
+    return allocations
+
+def write_sales(sales, by_id, available, strategy):
+    """
+    Writes a set of allocated sales with a constant number of queries.
+
+    Prices are resolved in one lookup per distinct sale date, unsaved SaleTransactions are created
+    with one bulk_create, their SoldProducts with another, and the stock is taken out by decrement_stock.
+
+    :param sales: List of (sale_transaction, allocations, sale_date) tuples; sale_transaction may be saved or not
+    :param by_id: Batches by ID, from load_sale_batches
+    :param available: Available quantity by batch ID after allocation
+    :param strategy: 'pessimistic' or 'optimistic'
+    :return: List of the created SoldProducts
+    """
+    products_by_date = {}
+    for _, allocations, sale_date in sales:
+        products_by_date.setdefault(sale_date, set()).update(
+            batch.product for batch, _, sale_price in allocations if sale_price is None
+        )
+    prices = {
+        sale_date: resolve_sale_prices(products, sale_date)
+        for sale_date, products in products_by_date.items()
+    }
+
+    sold_products = []
+    for sale_transaction, allocations, sale_date in sales:
+        lines = [
+            SoldProduct(
+                sale_transaction=sale_transaction,
+                inventory_item=batch,
+                quantity=quantity,
+                sale_price=prices[sale_date][batch.product_id] if sale_price is None else sale_price
+            )
+            for batch, quantity, sale_price in allocations
+        ]
+        sale_transaction.price = sum((line.total_price for line in lines), Decimal('0.00'))
+        sale_transaction.total = sale_transaction.price - Decimal(str(sale_transaction.discount or 0))
+        sold_products.extend(lines)
+
+    SaleTransaction.objects.bulk_create([sale_transaction for sale_transaction, _, _ in sales if sale_transaction.pk is None])
+    SoldProduct.objects.bulk_create(sold_products)
+
+    sold_quantities = {batch_id: batch.quantity - available[batch_id] for batch_id, batch in by_id.items()}
+    decrement_stock({batch_id: quantity for batch_id, quantity in sold_quantities.items() if quantity}, strategy)
+    record_stock_movements([
+        StockMovement(
+            product_id=batch.product_id,
+            inventory_item=batch,
+            quantity=-quantity,
+            reason='sale',
+            reference=sale_transaction.transaction_number,
+            created_by=sale_transaction.created_by
+        )
+        for sale_transaction, allocations, _ in sales
+        for batch, quantity, _ in allocations
+    ], defer_sync=strategy == 'optimistic')
+    return sold_products
+
+def commit_sale(sale_transaction, lines, sale_date, sale_prices=None, strategy=None):
+    """
+    Writes the sold products of a saved SaleTransaction and takes them out of stock.
+
+    The inventory rows are read (and with the pessimistic strategy locked) by load_sale_batches, the
+    lines are validated and allocated in memory, and everything is written by write_sales, so the
+    number of queries does not grow with the cart. Must be called inside a transaction;
+    sale_transaction.price and .total are updated but not saved.
+
+    :param sale_transaction: The saved SaleTransaction
+    :param lines: List of (inventory_item_id, product_id, quantity) tuples, with exactly one of the two IDs set
+    :param sale_date: The date of the sale, for discounts and expiry
+    :param sale_prices: Optional list of unit prices parallel to lines; None entries use the discounted price
+    :param strategy: 'pessimistic' or 'optimistic', defaults to settings.STOCK_DECREMENT_STRATEGY
+    :return: List of the created SoldProducts
+    :raises InsufficientStockError: If any line cannot be fulfilled
+    """
+    strategy = strategy or settings.STOCK_DECREMENT_STRATEGY
+    by_id, by_product, available = load_sale_batches(lines, sale_date, strategy)
+    allocations = allocate_sale_lines(lines, sale_prices, by_id, by_product, available)
+    return write_sales([(sale_transaction, allocations, sale_date)], by_id, available, strategy)
+
+def commit_sales(sales, strategy=None):
+    """
+    Validates and writes a batch of new sales with a constant number of queries.
+
+    Sales are applied in list order, each on its own transaction date (for discounts and expiry).
+    Each sale succeeds or fails on its own: a duplicate transaction number or a line that cannot be
+    fulfilled rejects that sale only, and the stock it would have used stays available to the next ones.
+    Accepted sales without a transaction number get one from next_document_numbers.
+    Must be called inside a transaction.
+
+    :param sales: List of (unsaved SaleTransaction, lines, sale_prices) tuples, as taken by commit_sale
+    :param strategy: 'pessimistic' or 'optimistic', defaults to settings.STOCK_DECREMENT_STRATEGY
+    :return: List parallel to sales, holding the saved SaleTransaction or the error message of each sale
+    """
+    if not sales:
+        return []
+    strategy = strategy or settings.STOCK_DECREMENT_STRATEGY
+    numbers = [sale_transaction.transaction_number for sale_transaction, _, _ in sales if sale_transaction.transaction_number]
+    taken_numbers = set(SaleTransaction.objects.filter(transaction_number__in=numbers).values_list('transaction_number', flat=True))
+    earliest_date = min(sale_transaction.transaction_date.date() for sale_transaction, _, _ in sales)
+    by_id, by_product, available = load_sale_batches([line for _, lines, _ in sales for line in lines], earliest_date, strategy)
+
+    results = []
+    accepted = []
+    for sale_transaction, lines, sale_prices in sales:
+        if sale_transaction.transaction_number and sale_transaction.transaction_number in taken_numbers:
+            results.append(f"Transaction number {sale_transaction.transaction_number} already exists.")
+            continue
+        sale_date = sale_transaction.transaction_date.date()
+        try:
+            allocations = allocate_sale_lines(lines, sale_prices, by_id, by_product, available, sale_date)
+        except InsufficientStockError as e:
+            results.append(str(e))
+            continue
+        taken_numbers.add(sale_transaction.transaction_number)
+        accepted.append((sale_transaction, allocations, sale_date))
+        results.append(sale_transaction)
+
+    # Sales without a transaction number are numbered once accepted, one sequence query per year
+    unnumbered = defaultdict(list)
+    for sale_transaction, _, sale_date in accepted:
+        if not sale_transaction.transaction_number:
+            unnumbered[sale_date.year].append(sale_transaction)
+    for year, sale_transactions in unnumbered.items():
+        for sale_transaction, number in zip(sale_transactions, next_document_numbers('sale', year, len(sale_transactions))):
+            sale_transaction.transaction_number = number
+
+    write_sales(accepted, by_id, available, strategy)
+    return results
+
+def record_stock_movements(movements, defer_sync=False):
+    """
+    Appends stock changes to the StockMovement ledger and refreshes ProductStock for the products involved.
+
+    Must be called in the same transaction as the Inventory writes the movements describe.
+
+    :param movements: List of unsaved StockMovement instances
+    :param defer_sync: Refresh ProductStock in its own short transaction once this one commits, instead of
+                       locking its rows until then; used by optimistic sales so checkouts of a popular product
+                       do not queue on its ProductStock row
+    """
+    movements = [movement for movement in movements if movement.quantity]
+    if not movements:
+        return
+    StockMovement.objects.bulk_create(movements)
+    product_ids = {movement.product_id for movement in movements}
+    if defer_sync:
+        # Every refresh re-aggregates the committed Inventory, so whichever runs last is correct;
+        # a refresh that fails leaves drift for find_product_stock_drift, not a failed sale
+        transaction.on_commit(lambda: sync_product_stock(product_ids), robust=True)
+    else:
+        sync_product_stock(product_ids)
+
+def upsert_inventory(quantities):
+    """
+    Adds stock to the Inventory rows of (product, expiry date) pairs, creating the missing ones.
+
+    The existing rows are first locked with one SELECT ... FOR UPDATE ORDER BY id, the order sales lock
+    them in (see load_sale_batches), so a delivery and a sale touching the same batches cannot deadlock.
+    Then one INSERT ... ON CONFLICT (product_id, expiry_date) DO UPDATE against the unique_product_expiry
+    constraint adds the stock, with the new rows in key order so concurrent deliveries create them in the same order.
+
+    :param quantities: Dict mapping (product ID, expiry date) to the quantity to add
+    :return: Dict mapping (product ID, expiry date) to the inventory ID
+    """
+    if not quantities:
+        return {}
+    now = timezone.now()
+    table = Inventory._meta.db_table
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(quantities))
+    params = [
+        value
+        for (product_id, expiry_date), quantity in sorted(quantities.items())
+        for value in (product_id, expiry_date, quantity, now, now)
+    ]
+    keys = sorted(quantities)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT inventory.id FROM {table} AS inventory
+            WHERE (inventory.product_id, inventory.expiry_date) IN (VALUES {", ".join(["(%s, %s::date)"] * len(keys))})
+            ORDER BY inventory.id
+            FOR UPDATE
+            """,
+            [value for key in keys for value in key]
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS inventory (product_id, expiry_date, quantity, created_at, updated_at)
+            VALUES {values}
+            ON CONFLICT (product_id, expiry_date)
+            DO UPDATE SET quantity = inventory.quantity + EXCLUDED.quantity, updated_at = EXCLUDED.updated_at
+            RETURNING id, product_id, expiry_date
+            """,
+            params
+        )
+        return {(product_id, expiry_date): inventory_id for inventory_id, product_id, expiry_date in cursor.fetchall()}
+
+def commit_purchase(purchase_transaction, purchased_products):
+    """
+    Saves a purchase and its lines and puts them into stock, with a constant number of queries.
+
+    The lines are written with one bulk_create and added to Inventory with one upsert, lines of the
+    same product and expiry date being summed first. Must be called inside a transaction.
+
+    :param purchase_transaction: The PurchaseTransaction, saved here if it is not yet and numbered if its invoice number is blank
+    :param purchased_products: List of unsaved PurchasedProducts
+    :return: List of the saved PurchasedProducts
+    """
+    return commit_purchases([(purchase_transaction, purchased_products)])
+
+def commit_purchases(purchases):
+    """
+    Saves a batch of purchases and their lines and puts them into stock, with a constant number of queries.
+
+    The new PurchaseTransactions and all the lines are written with one bulk_create each, and the
+    stock of the whole batch is added to Inventory with a single upsert. Purchases without an
+    invoice number get one from next_document_numbers. Must be called inside a transaction.
+
+    :param purchases: List of (PurchaseTransaction, list of unsaved PurchasedProducts) tuples
+    :return: List of all the saved PurchasedProducts
+    """
+    if not purchases:
+        return []
+
+    # One sequence query per year, like commit_sales
+    unnumbered = defaultdict(list)
+    for purchase_transaction, _ in purchases:
+        if not purchase_transaction.invoice_number:
+            unnumbered[purchase_transaction.purchase_date.year].append(purchase_transaction)
+    for year, purchase_transactions in unnumbered.items():
+        for purchase_transaction, number in zip(purchase_transactions, next_document_numbers('purchase', year, len(purchase_transactions))):
+            purchase_transaction.invoice_number = number
+
+    PurchaseTransaction.objects.bulk_create([purchase_transaction for purchase_transaction, _ in purchases if purchase_transaction.pk is None])
+    for purchase_transaction, purchased_products in purchases:
+        for purchased_product in purchased_products:
+            purchased_product.purchase_transaction = purchase_transaction
+    saved = PurchasedProduct.objects.bulk_create(
+        [purchased_product for _, purchased_products in purchases for purchased_product in purchased_products],
+        batch_size=1000
+    )
+
+    quantities = defaultdict(int)
+    received = defaultdict(int)  # Per purchase, so each movement references its own invoice
+    for purchased_product in saved:
+        key = (purchased_product.product_id, purchased_product.expiry_date)
+        quantities[key] += purchased_product.quantity
+        received[(purchased_product.purchase_transaction, key)] += purchased_product.quantity
+    inventory_ids = upsert_inventory(quantities)
+
+    record_stock_movements([
+        StockMovement(
+            product_id=product_id,
+            inventory_item_id=inventory_ids[(product_id, expiry_date)],
+            quantity=quantity,
+            reason='purchase',
+            reference=purchase_transaction.invoice_number,
+            created_by=purchase_transaction.created_by
+        )
+        for (purchase_transaction, (product_id, expiry_date)), quantity in received.items()
+    ])
+    return saved
+
+def delete_purchase(purchase_transaction, user):
+    """
+    Deletes a purchase and takes its products back out of stock.
+
+    The Inventory rows the purchase went into are locked in one query (in ID order, like sales),
+    checked in memory and decremented by a single UPDATE, so a concurrent sale cannot take the stock
+    between the check and the update. Must be called inside a transaction.
+
+    :param purchase_transaction: The PurchaseTransaction to delete
+    :param user: The user deleting it, recorded on the stock movements
+    :raises InsufficientStockError: If a batch is missing or has less stock left than was purchased
+    """
+    quantities = defaultdict(int)
+    names = {}
+    for product_id, name, expiry_date, quantity in purchase_transaction.purchased_products.values_list('product_id', 'product__name', 'expiry_date', 'quantity'):
+        quantities[(product_id, expiry_date)] += quantity
+        names[product_id] = name
+
+    batches = Q(pk__in=[])
+    for product_id, expiry_date in quantities:
+        batches |= Q(product_id=product_id, expiry_date=expiry_date)
+    locked = {
+        (product_id, expiry_date): (inventory_id, on_hand)
+        for inventory_id, product_id, expiry_date, on_hand in (
+            Inventory.objects.select_for_update().filter(batches).order_by('id').values_list('id', 'product_id', 'expiry_date', 'quantity')
+        )
+    }
+
+    deltas = {}
+    for (product_id, expiry_date), quantity in quantities.items():
+        if (product_id, expiry_date) not in locked:
+            raise InsufficientStockError(f"Matching inventory item not found for {names[product_id]} (exp: {expiry_date}).")
+        inventory_id, on_hand = locked[(product_id, expiry_date)]
+        if on_hand < quantity:
+            raise InsufficientStockError(f"Insufficient inventory for {names[product_id]}.")
+        deltas[inventory_id] = -quantity
+
+    adjust_stock(deltas)
+    record_stock_movements([
+        StockMovement(
+            product_id=product_id,
+            inventory_item_id=locked[(product_id, expiry_date)][0],
+            quantity=-quantity,
+            reason='purchase_deleted',
+            reference=purchase_transaction.invoice_number,
+            created_by=user
+        )
+        for (product_id, expiry_date), quantity in quantities.items()
+    ])
+    purchase_transaction.delete()
+
+def delete_sale(sale_transaction, user):
+    """
+    Deletes a sale and puts its products back into stock.
+
+    The Inventory rows are locked in one query (in ID order, like sales) and restocked by a single
+    UPDATE. Must be called inside a transaction.
+
+    :param sale_transaction: The SaleTransaction to delete
+    :param user: The user deleting it, recorded on the stock movements
+    """
+    quantities = defaultdict(int)
+    for inventory_id, quantity in sale_transaction.sold_products.values_list('inventory_item_id', 'quantity'):
+        quantities[inventory_id] += quantity
+
+    product_ids = dict(
+        Inventory.objects.select_for_update().filter(id__in=quantities).order_by('id').values_list('id', 'product_id')
+    )
+    adjust_stock(quantities)
+    record_stock_movements([
+        StockMovement(
+            product_id=product_ids[inventory_id],
+            inventory_item_id=inventory_id,
+            quantity=quantity,
+            reason='sale_deleted',
+            reference=sale_transaction.transaction_number,
+            created_by=user
+        )
+        for inventory_id, quantity in quantities.items()
+    ])
+    sale_transaction.delete()
+
+def stock_on_hand_at(at, product_ids=None):
+    """
+    Returns the stock on hand of each product at a point in time.
+
+    Starts from each product's latest snapshot taken at or before `at` and adds only the movements
+    recorded after it, so the cost depends on the snapshot interval rather than on the length of the history.
+    Products without a snapshot start from zero.
+
+    :param at: Aware datetime to compute the stock for
+    :param product_ids: Optional iterable of product IDs, defaults to all products
+    :return: Dict mapping product ID to quantity on hand
+    """
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+
+    latest_snapshot = StockSnapshot.objects.filter(product=OuterRef('pk'), taken_at__lte=at).order_by('-taken_at')
+    movements_since_snapshot = (
+        StockMovement.objects
+        .filter(
+            product=OuterRef('pk'),
+            created_at__gt=Coalesce(OuterRef('snapshot_taken_at'), Value(LEDGER_START, output_field=DateTimeField())),
+            created_at__lte=at,
+        )
+        .order_by()
+        .values('product')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+
+    rows = (
+        products
+        .annotate(snapshot_taken_at=Subquery(latest_snapshot.values('taken_at')[:1]))
+        .annotate(
+            on_hand=(
+                Coalesce(Subquery(latest_snapshot.values('on_hand')[:1]), Value(0))
+                + Coalesce(Subquery(movements_since_snapshot), Value(0))
+            )
+        )
+        .order_by()
+        .values_list('id', 'on_hand')
+    )
+    return dict(rows)
+
+def take_stock_snapshots(taken_at=None):
+    """
+    Writes a StockSnapshot for every product, rolled forward from the previous snapshot through the ledger.
+
+    :param taken_at: Time of the snapshot, defaults to SNAPSHOT_SETTLE_TIME ago
+    :return: Number of snapshots written
+    """
+    taken_at = taken_at or timezone.now() - SNAPSHOT_SETTLE_TIME
+    snapshots = [
+        StockSnapshot(product_id=product_id, taken_at=taken_at, on_hand=on_hand)
+        for product_id, on_hand in stock_on_hand_at(taken_at).items()
+    ]
+    StockSnapshot.objects.bulk_create(snapshots, batch_size=1000, ignore_conflicts=True)
+    return len(snapshots)
+
+def sweep_expired_inventory(today, user=None):
+    """
+    Writes off every inventory batch that expired before `today` and still has stock.
+
+    A single statement zeroes the expired batches, inserts one WriteOff per batch valued at the batch's
+    weighted average purchase price (falling back to the product's, then to 0) and appends the matching
+    'write_off' movements to the ledger. ProductStock is refreshed afterwards in the same transaction.
+    The expired batches are locked in id order, like sales and purchases lock them, so a sweep during
+    checkout cannot deadlock against them.
+
+    :param today: Batches expiring before this date are written off
+    :param user: Optional user recorded on the stock movements
+    :return: Dict with the number of batches, units and total cost written off
+    """
+    now = timezone.now()
+    sql = f"""
+        WITH expired AS (
+            SELECT id, product_id, expiry_date, quantity
+            FROM {Inventory._meta.db_table}
+            WHERE expiry_date < %(today)s AND quantity > 0
+            ORDER BY id
+            FOR UPDATE
+        ),
+        swept AS (
+            UPDATE {Inventory._meta.db_table} AS inventory
+            SET quantity = 0, updated_at = %(now)s
+            FROM expired
+            WHERE inventory.id = expired.id
+            RETURNING expired.id, expired.product_id, expired.expiry_date, expired.quantity
+        ),
+        costed AS (
+            SELECT swept.*, COALESCE(
+                (SELECT SUM(pp.purchase_price * pp.quantity) / NULLIF(SUM(pp.quantity), 0)
+                 FROM {PurchasedProduct._meta.db_table} AS pp
+                 WHERE pp.product_id = swept.product_id AND pp.expiry_date = swept.expiry_date),
+                (SELECT SUM(pp.purchase_price * pp.quantity) / NULLIF(SUM(pp.quantity), 0)
+                 FROM {PurchasedProduct._meta.db_table} AS pp
+                 WHERE pp.product_id = swept.product_id),
+                0
+            ) AS unit_cost
+            FROM swept
+        ),
+        write_offs AS (
+            INSERT INTO {WriteOff._meta.db_table}
+                (product_id, inventory_item_id, expiry_date, quantity, unit_cost, total_cost, written_off_at)
+            SELECT product_id, id, expiry_date, quantity, ROUND(unit_cost, 2), ROUND(unit_cost, 2) * quantity, %(now)s
+            FROM costed
+            RETURNING product_id, inventory_item_id, quantity, total_cost
+        ),
+        movements AS (
+            INSERT INTO {StockMovement._meta.db_table}
+                (product_id, inventory_item_id, quantity, reason, reference, created_by_id, created_at)
+            SELECT product_id, inventory_item_id, -quantity, 'write_off', %(reference)s, %(user_id)s, %(now)s
+            FROM write_offs
+        )
+        SELECT product_id, quantity, total_cost FROM write_offs
+    """
+    params = {
+        'today': today,
+        'now': now,
+        'reference': f"Expiry sweep {today.isoformat()}",
+        'user_id': user.id if user else None,
+    }
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        sync_product_stock(product_id for product_id, _, _ in rows)
+
+    return {
+        'batches': len(rows),
+        'quantity': sum(quantity for _, quantity, _ in rows),
+        'total_cost': sum((total_cost for _, _, total_cost in rows), Decimal('0.00')),
+    }
+
+def find_inventory_discrepancies(first_product_id, last_product_id):
+    """
+    Compares Inventory.quantity with the quantity implied by the transaction history, per (product, expiry_date).
+
+    The expected quantity is purchased - sold - written off + manual adjustments, clamped to 0: an
+    oversold history cannot be held in stock, so a batch repaired to 0 is not reported again. Stock
+    changed before the ledger existed is covered by the opening-balance adjustments of migration 0046. Every
+    source is aggregated in SQL for the given product ID range only, so ranges can be checked in parallel.
+
+    :param first_product_id: First product ID of the range (inclusive)
+    :param last_product_id: Last product ID of the range (inclusive)
+    :return: List of dicts describing every (product, expiry_date) whose recorded quantity differs
+    """
+    sql = f"""
+        WITH expected AS (
+            SELECT product_id, expiry_date, SUM(quantity) AS quantity
+            FROM (
+                SELECT pp.product_id, pp.expiry_date, pp.quantity
+                FROM {PurchasedProduct._meta.db_table} AS pp
+                WHERE pp.product_id BETWEEN %(first)s AND %(last)s
+                UNION ALL
+                SELECT inventory.product_id, inventory.expiry_date, -sp.quantity
+                FROM {SoldProduct._meta.db_table} AS sp
+                JOIN {Inventory._meta.db_table} AS inventory ON inventory.id = sp.inventory_item_id
+                WHERE inventory.product_id BETWEEN %(first)s AND %(last)s
+                UNION ALL
+                SELECT wo.product_id, wo.expiry_date, -wo.quantity
+                FROM {WriteOff._meta.db_table} AS wo
+                WHERE wo.product_id BETWEEN %(first)s AND %(last)s
+                UNION ALL
+                SELECT inventory.product_id, inventory.expiry_date, sm.quantity
+                FROM {StockMovement._meta.db_table} AS sm
+                JOIN {Inventory._meta.db_table} AS inventory ON inventory.id = sm.inventory_item_id
+                WHERE sm.reason = 'adjustment' AND inventory.product_id BETWEEN %(first)s AND %(last)s
+            ) AS history
+            GROUP BY product_id, expiry_date
+        ),
+        recorded AS (
+            SELECT id, product_id, expiry_date, quantity
+            FROM {Inventory._meta.db_table}
+            WHERE product_id BETWEEN %(first)s AND %(last)s
+        )
+        SELECT recorded.id,
+               COALESCE(recorded.product_id, expected.product_id) AS product_id,
+               product.name,
+               COALESCE(recorded.expiry_date, expected.expiry_date) AS expiry_date,
+               COALESCE(recorded.quantity, 0) AS recorded_quantity,
+               GREATEST(COALESCE(expected.quantity, 0), 0) AS expected_quantity
+        FROM recorded
+        FULL OUTER JOIN expected
+            ON expected.product_id = recorded.product_id AND expected.expiry_date = recorded.expiry_date
+        JOIN {Product._meta.db_table} AS product
+            ON product.id = COALESCE(recorded.product_id, expected.product_id)
+        WHERE COALESCE(recorded.quantity, 0) <> GREATEST(COALESCE(expected.quantity, 0), 0)
+        ORDER BY 2, 4
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'first': first_product_id, 'last': last_product_id})
+        return [
+            {
+                'inventory_id': inventory_id,
+                'product_id': product_id,
+                'product': name,
+                'expiry_date': expiry_date,
+                'recorded_quantity': recorded_quantity,
+                'expected_quantity': expected_quantity,
+            }
+            for inventory_id, product_id, name, expiry_date, recorded_quantity, expected_quantity in cursor.fetchall()
+        ]
+
+def repair_inventory_discrepancies(product_ids, user=None):
+    """
+    Sets Inventory.quantity to the quantity implied by the transaction history for the given products.
+
+    Runs in one transaction: the products' inventory rows are locked, the discrepancies are recomputed
+    under the lock, and every correction is recorded as a 'reconciliation' movement.
+    Oversold history is repaired to 0, like find_inventory_discrepancies expects.
+
+    :param product_ids: Iterable of product IDs to repair
+    :param user: Optional user recorded on the stock movements
+    :return: Number of inventory rows corrected
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return 0
+
+    with transaction.atomic():
+        list(Inventory.objects.select_for_update().filter(product_id__in=product_ids).order_by('id').values_list('id', flat=True))
+        wanted = set(product_ids)
+        discrepancies = [
+            row for row in find_inventory_discrepancies(product_ids[0], product_ids[-1])
+            if row['product_id'] in wanted
+        ]
+
+        inventory_items = Inventory.objects.in_bulk([row['inventory_id'] for row in discrepancies if row['inventory_id']])
+        to_update, to_create, movements = [], [], []
+        for row in discrepancies:
+            quantity = row['expected_quantity']
+            item = inventory_items.get(row['inventory_id'])
+            if item is None:
+                item = Inventory(product_id=row['product_id'], expiry_date=row['expiry_date'], quantity=quantity)
+                to_create.append(item)
+            else:
+                item.quantity = quantity
+                to_update.append(item)
+            movements.append(StockMovement(
+                product_id=row['product_id'],
+                inventory_item=item,
+                quantity=quantity - row['recorded_quantity'],
+                reason='reconciliation',
+                reference="reconcile_inventory",
+                created_by=user
+            ))
+
+        Inventory.objects.bulk_update(to_update, ['quantity'])
+        Inventory.objects.bulk_create(to_create)
+        record_stock_movements(movements)
+
+    return len(discrepancies)
@@ -0,0 +1,70 @@
+# home/signals.py
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Category, Product, Inventory, Discount
+from .services import stock_changed, rebuild_effective_prices
+from .counters import bump_inventory_version, bump_catalog_version
+
+# Dashboard counters are invalidated once the change is committed, so a concurrent reader
+# cannot cache a count computed from the old data under the new version.
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+def invalidate_inventory_counters(sender, **kwargs):
+    transaction.on_commit(bump_inventory_version)
+
+@receiver(stock_changed)
+def invalidate_counters_on_stock_change(sender, **kwargs):
+    # Covers bulk and raw SQL Inventory updates, which do not send post_save
+    bump_inventory_version()
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)  # Includes low_stock_threshold edits
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_counters(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+# Effective prices are rebuilt inside the writing transaction, so a sale never reads a stale price
+@receiver(pre_save, sender=Product)
+def detect_sale_price_change(sender, instance, update_fields=None, **kwargs):
+    # Name, description or category edits leave the prices alone; one primary key lookup instead of a rebuild
+    if instance.pk is None:
+        instance._sale_price_changed = True
+    elif update_fields is not None and 'sale_price' not in update_fields:
+        instance._sale_price_changed = False
+    else:
+        stored_price = sender.objects.filter(pk=instance.pk).values_list('sale_price', flat=True).first()
+        instance._sale_price_changed = stored_price is None or stored_price != instance.sale_price
+
+@receiver(post_save, sender=Product)
+def rebuild_product_prices(sender, instance, raw=False, **kwargs):
+    if raw or getattr(instance, '_sale_price_changed', True):
+        rebuild_effective_prices([instance.id])
+
+@receiver(post_save, sender=Discount)
+def rebuild_discount_prices(sender, instance, **kwargs):
+    # Date or percentage edits; product changes are handled by m2m_changed
+    rebuild_effective_prices(instance.products.values_list('id', flat=True))
+
+@receiver(pre_delete, sender=Discount)
+def remember_discount_products(sender, instance, **kwargs):
+    # The M2M rows are gone by post_delete
+    instance._price_product_ids = list(instance.products.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Discount)
+def rebuild_deleted_discount_prices(sender, instance, **kwargs):
+    rebuild_effective_prices(getattr(instance, '_price_product_ids', []))
+
+@receiver(m2m_changed, sender=Discount.products.through)
+def rebuild_discount_product_prices(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # pk_set is not provided for clear, so remember the affected products before the rows go
+        instance._price_product_ids = (
+            [instance.id] if reverse else list(instance.products.values_list('id', flat=True))
+        )
+    elif action == 'post_clear':
+        rebuild_effective_prices(instance._price_product_ids)
+    elif action in ('post_add', 'post_remove'):
+        rebuild_effective_prices([instance.id] if reverse else pk_set)
@@ -0,0 +1,13 @@
+# home/templatetags/idempotency.py
+import uuid
+from django import template
+from django.utils.html import format_html
+
+from home.decorators import IDEMPOTENCY_FIELD
+
+register = template.Library()
+
+@register.simple_tag
+def idempotency_key_input():
+    # Hidden input with a fresh key per rendered form, read by the @idempotent decorator
+    return format_html('<input type="hidden" name="{}" value="{}">', IDEMPOTENCY_FIELD, uuid.uuid4().hex)
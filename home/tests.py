@@ -1,8 +1,22 @@
 # home/tests.py
+import csv
+import json
+import os
+import tempfile
+import time
+import zipfile
+import statistics
 from threading import Thread
-from datetime import date
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from importlib import import_module
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
 
-from django.test import TransactionTestCase, TestCase, Client
+from django.test import TransactionTestCase, TestCase, Client, tag
+from django.test.utils import CaptureQueriesContext
 """
 Django's regular TestCase wraps every test method inside a single atomic transaction and rolls it back after the test. 
 This makes tests fast but prevents us from observing real commit-related behavior. So, if we want to test:
@@ -11,15 +25,53 @@ This makes tests fast but prevents us from observing real commit-related behavio
     - How locking (e.g., select_for_update) works
 We need TransactionTestCase.
 """
+from django.apps import apps as django_apps
+from django.db import connection, transaction
+from django.db.models import Sum
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.messages import get_messages
+from django.core.management import call_command, CommandError
+from django.shortcuts import get_object_or_404
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.forms import modelformset_factory
 
 from home.models import (
-    Product, Inventory, Category, Manufacturer,
+    Product, Inventory, ProductStock, Category, Manufacturer,
     Customer, SaleTransaction, SoldProduct,
-    ActivityLog
+    ActivityLog, StockMovement, StockSnapshot,
+    PurchaseTransaction, PurchasedProduct, WriteOff, ReorderSuggestion, Discount, EffectivePrice, IdempotencyKey
 )
+from home.services import find_product_stock_drift, find_inventory_discrepancies, repair_inventory_discrepancies, stock_on_hand_at, take_stock_snapshots, commit_sale, commit_purchase, resolve_sale_prices, next_document_numbers, InsufficientStockError
+from home.scans import iter_json_events, import_streamed_scan, import_scans, ScanError
+from home.counters import get_expiring_count, get_low_stock_count, get_cache, get_version, bump_inventory_version, INVENTORY_VERSION_KEY
+from home.forms import SoldProductForm
+
+RUN_BENCHMARKS = bool(os.environ.get('RUN_BENCHMARKS'))  # Benchmarks are slow and only print timings, so they are opt-in
+
+class CatalogFixtureMixin:
+    """
+    Shared setUp helpers:
+        - log_in: a staff user logged in on self.client.
+        - create_catalog: a category and a manufacturer (self.category, self.manufacturer) for the test's products.
+        - create_products: products under them.
+    """
+    def log_in(self, username, **extra_fields):
+        user = User.objects.create_user(username=username, password='pass', is_staff=True, **extra_fields)
+        self.client = Client()
+        self.client.login(username=username, password='pass')
+        return user
+
+    def create_catalog(self, category_name, manufacturer_name, low_stock_threshold=1):
+        self.category = Category.objects.create(name=category_name, low_stock_threshold=low_stock_threshold)
+        self.manufacturer = Manufacturer.objects.create(name=manufacturer_name)
+
+    def create_products(self, names, sale_price=1, **fields):
+        return [
+            Product.objects.create(name=name, category=self.category, manufacturer=self.manufacturer, sale_price=sale_price, **fields)
+            for name in names
+        ]
 
 class BlackBoxTests(TestCase):
     """
@@ -50,24 +102,20 @@ class BlackBoxTests(TestCase):
         )
         print("✅ test_add_manufacturer_exact_match passed")
 
-class ConcurrentSaleTests(TransactionTestCase):
+class ConcurrentSaleTests(CatalogFixtureMixin, TransactionTestCase):
     """
     Test scenario:
         - There is only 1 unit of a product in Inventory.
         - Multiple users attempt to purchase this product concurrently.
         - Only one sale should succeed, the rest should fail due to insufficient quantity.
+        - This holds for both STOCK_DECREMENT_STRATEGY values ('pessimistic' and 'optimistic').
+    Benchmark (tagged 'benchmark', runs only with RUN_BENCHMARKS=1):
+        - Many threads sell a popular product, each from its own batch, with each strategy; throughput and
+          p99 latency are printed. The batches do not collide, so only the shared ProductStock row can serialize them.
     """
     def setUp(self):
-        self.client = Client()
-        self.category = Category.objects.create(name="Test Category", low_stock_threshold=1)
-        self.manufacturer = Manufacturer.objects.create(name="Test Manufacturer")
-        self.product = Product.objects.create(
-            name="Limited Product",
-            category=self.category,
-            manufacturer=self.manufacturer,
-            sale_price=10.00,
-            description="Only 1 in stock"
-        )
+        self.create_catalog("Test Category", "Test Manufacturer")
+        self.product, = self.create_products(["Limited Product"], sale_price=10.00, description="Only 1 in stock")
         self.inventory = Inventory.objects.create(
             product=self.product,
             quantity=1,
@@ -81,12 +129,8 @@ class ConcurrentSaleTests(TransactionTestCase):
             address="123 Test St"
         )
 
-    def simulate_sale(self, transaction_number, results, index):
-        user = User.objects.create_user(username=f'user{index}', password='pass', is_staff=True)
-        c = Client()
-        c.login(username=f'user{index}', password='pass')
-
-        response = c.post('/sale_transactions/add/', {
+    def post_sale(self, client, transaction_number, follow=False, inventory=None):
+        return client.post(reverse('add_sale_transaction'), {
             'transaction_number': transaction_number,
             'transaction_date': '2025-06-17',
             'customer': self.customer.id,
@@ -96,9 +140,20 @@ class ConcurrentSaleTests(TransactionTestCase):
             'remarks': '',
             'products-TOTAL_FORMS': '1',
             'products-INITIAL_FORMS': '0',
-            'products-0-inventory_item': self.inventory.id,
+            'products-0-inventory_item': (inventory or self.inventory).id,
             'products-0-quantity': '1',
-        }, follow=True)
+        }, follow=follow)
+
+    def log_in_clients(self, usernames):
+        # One logged-in client per thread, created up front since log_in replaces self.client
+        clients = []
+        for username in usernames:
+            self.log_in(username)
+            clients.append(self.client)
+        return clients
+
+    def simulate_sale(self, client, transaction_number, results, index):
+        response = self.post_sale(client, transaction_number, follow=True)
         if response.status_code == 200 and SaleTransaction.objects.filter(transaction_number=transaction_number).exists():
             results[index] = f"✅ Success: Thread {index}, TXN {transaction_number}"
         else:
@@ -115,15 +170,17 @@ class ConcurrentSaleTests(TransactionTestCase):
                 print("Formset errors:", formset.errors)
         else:
             print("No response context (likely a redirect or raw response)")
+        connection.close()  # Each thread has its own connection, close it so the test database can be dropped
 
-    def test_concurrent_sales_for_limited_inventory(self):
+    def run_concurrent_sales(self):
         thread_count = 10
         threads = []
         results = [None] * thread_count
+        clients = self.log_in_clients(f'user{i}' for i in range(thread_count))
 
         for i in range(thread_count):
             txn_number = f'TXN-{i}'
-            t = Thread(target=self.simulate_sale, args=(txn_number, results, i))
+            t = Thread(target=self.simulate_sale, args=(clients[i], txn_number, results, i))
             threads.append(t)
 
         for t in threads:
@@ -146,6 +203,62 @@ class ConcurrentSaleTests(TransactionTestCase):
         self.assertEqual(sold_count, 1)
         self.assertEqual(final_quantity, 0)
 
+    def test_concurrent_sales_for_limited_inventory(self):
+        self.run_concurrent_sales()
+
+    def test_concurrent_sales_for_limited_inventory_optimistic(self):
+        with self.settings(STOCK_DECREMENT_STRATEGY='optimistic'):
+            self.run_concurrent_sales()
+
+    def test_optimistic_sale_leaves_product_stock_unlocked(self):
+        sale_transaction = SaleTransaction.objects.create(transaction_number='OPT-1', transaction_date=timezone.now(), discount=0, cash_received=10, payment_method='Cash')
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                commit_sale(sale_transaction, [(self.inventory.id, None, 1)], date.today(), strategy='optimistic')
+        self.assertFalse([q for q in queries.captured_queries if 'home_productstock' in q['sql']])
+        self.assertEqual(ProductStock.objects.get(product=self.product).on_hand, 0)  # Refreshed after commit
+        print("✅ Optimistic sale refreshes ProductStock after commit, without locking it")
+
+    def benchmark_strategy(self, strategy, batches, sales_per_thread=10):
+        latencies = []
+        clients = self.log_in_clients(f'{strategy}{index}' for index in range(len(batches)))
+
+        def sell(index):
+            for sale in range(sales_per_thread):
+                started = time.perf_counter()
+                self.post_sale(clients[index], f'{strategy}-{index}-{sale}', inventory=batches[index])
+                latencies.append(time.perf_counter() - started)
+            connection.close()
+
+        threads = [Thread(target=sell, args=(index,)) for index in range(len(batches))]
+        with self.settings(STOCK_DECREMENT_STRATEGY=strategy):
+            started = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - started
+
+        p99 = statistics.quantiles(latencies, n=100)[98]
+        print(f"⏱ {strategy}: {len(latencies) / elapsed:.1f} sales/s, p99 latency {p99 * 1000:.0f} ms over {len(latencies)} sales")
+        return SaleTransaction.objects.filter(transaction_number__startswith=f'{strategy}-').count()
+
+    @tag('benchmark')
+    @skipUnless(RUN_BENCHMARKS, "Set RUN_BENCHMARKS=1 to run the benchmark")
+    def test_decrement_strategy_benchmark(self):
+        batches = [
+            Inventory.objects.create(product=self.product, quantity=100, expiry_date=date(2026, 1, 1) + timedelta(days=index))
+            for index in range(8)
+        ]
+
+        sold = sum(self.benchmark_strategy(strategy, batches) for strategy in ('pessimistic', 'optimistic'))
+
+        self.assertEqual(sold, 160)
+        self.assertEqual(Inventory.objects.filter(pk__in=[batch.pk for batch in batches]).aggregate(total=Sum('quantity'))['total'], 800 - sold)
+        self.assertEqual(SoldProduct.objects.count(), sold)
+        self.assertEqual(ProductStock.objects.get(product=self.product).on_hand, 1 + 800 - sold)
+        print("✅ Both strategies sell without overselling")
+
 class FunctionalViewTests(TestCase):
     """    
     Test the Django views in views.py. Simulate how a real user uses forms on website to perform these actions:
@@ -341,3 +454,1212 @@ class FunctionalViewTests(TestCase):
         self.assertMessagePresent(response, f"The customer '{name}' deleted.")
         self.assertRedirects(response, reverse('customer_list'))
         print("✅ Delete Customer passed")
+
+class ProductStockTests(CatalogFixtureMixin, TestCase):
+    """
+    Test that the materialized ProductStock table follows every Inventory write:
+        - Purchase adds stock and sets the earliest expiry.
+        - Zeroing an inventory item removes its stock and expiry.
+        - The consistency checker finds no drift afterwards, and finds it once the table is tampered with.
+    """
+    def setUp(self):
+        self.user = self.log_in('stock')
+        self.create_catalog('Vitamins', 'Stock Co', low_stock_threshold=5)
+        self.product, = self.create_products(['Vitamin C'], sale_price=3.50)
+
+    def test_stock_follows_purchase_and_delete_inventory(self):
+        self.client.post(reverse('add_purchase_transaction'), {
+            'invoice_number': 'INV-STOCK-1',
+            'manufacturer': self.manufacturer.id,
+            'purchase_date': '2025-06-01',
+            'remarks': '',
+            'products-TOTAL_FORMS': '2',
+            'products-INITIAL_FORMS': '0',
+            'products-0-product': self.product.id,
+            'products-0-quantity': '4',
+            'products-0-purchase_price': '1.00',
+            'products-0-expiry_date': '2030-01-31',
+            'products-1-product': self.product.id,
+            'products-1-quantity': '6',
+            'products-1-purchase_price': '1.00',
+            'products-1-expiry_date': '2029-06-30',
+        })
+
+        stock = ProductStock.objects.get(product=self.product)
+        self.assertEqual(stock.on_hand, 10)
+        self.assertEqual(str(stock.earliest_expiry), '2029-06-30')
+
+        inventory = Inventory.objects.get(product=self.product, expiry_date='2029-06-30')
+        self.client.post(reverse('delete_inventory', args=[inventory.id]))
+
+        stock.refresh_from_db()
+        self.assertEqual(stock.on_hand, 4)
+        self.assertEqual(str(stock.earliest_expiry), '2030-01-31')
+        self.assertEqual(find_product_stock_drift(), [])
+
+        ProductStock.objects.filter(product=self.product).update(on_hand=99)
+        self.assertEqual(len(find_product_stock_drift()), 1)
+        call_command('rebuild_product_stock', stdout=StringIO())
+        self.assertEqual(find_product_stock_drift(), [])
+        print("✅ ProductStock follows purchases and inventory deletion")
+
+class DashboardCounterTests(CatalogFixtureMixin, TransactionTestCase):
+    """
+    Test the cached homepage counters:
+        - The expiring window rolls over to a new day without recounting the items already counted.
+        - Editing a category's low stock threshold invalidates the low stock counter.
+        - Every version bump leaves a new version, with no read-modify-write on the cache.
+    TransactionTestCase is needed because the counters are invalidated on commit.
+    """
+    def setUp(self):
+        self.create_catalog('Counters', 'Counter Co', low_stock_threshold=5)
+        self.product, = self.create_products(['Counted'])
+        self.today = date.today()
+
+    def test_expiring_count_rolls_over(self):
+        Inventory.objects.create(product=self.product, quantity=3, expiry_date=self.today + timedelta(days=10))
+        Inventory.objects.create(product=self.product, quantity=3, expiry_date=self.today + timedelta(days=31))
+        self.assertEqual(get_expiring_count(self.today), 1)
+        # The next day, the item expiring in 31 days enters the window
+        self.assertEqual(get_expiring_count(self.today + timedelta(days=1)), 2)
+        print("✅ Expiring counter rolls over")
+
+    def test_low_stock_count_follows_threshold(self):
+        Inventory.objects.create(product=self.product, quantity=3, expiry_date=self.today + timedelta(days=100))
+        ProductStock.objects.create(product=self.product, on_hand=3)
+        self.assertEqual(get_low_stock_count(), 1)
+        self.category.low_stock_threshold = 2
+        self.category.save()
+        self.assertEqual(get_low_stock_count(), 0)
+        print("✅ Low stock counter follows threshold edits")
+
+    def test_bump_sets_fresh_version(self):
+        versions = {get_version(INVENTORY_VERSION_KEY)}
+        with patch.object(type(get_cache()), 'incr', side_effect=AssertionError("incr is not atomic on every backend")):
+            for _ in range(5):
+                bump_inventory_version()
+                versions.add(get_version(INVENTORY_VERSION_KEY))
+        self.assertEqual(len(versions), 6)
+        get_cache().delete(INVENTORY_VERSION_KEY)
+        self.assertNotIn(get_version(INVENTORY_VERSION_KEY), versions)
+        print("✅ Version bumps set fresh tokens")
+
+class HomepageQueryTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the lazy homepage tabs:
+        - Each tab costs a count and a page query (after the session and user), whatever the number of rows.
+        - The other tab is not queried.
+        - dashboard_counts returns both badge counts and serves them from the cache afterwards.
+    """
+    def setUp(self):
+        get_cache().clear()
+        self.log_in('pharmacist')
+        self.create_catalog('Homepage', 'Homepage Co', low_stock_threshold=10)
+        self.add_products(5)
+
+    def add_products(self, count):
+        for product in self.create_products(['Running Low'] * count):
+            Inventory.objects.create(product=product, quantity=2, expiry_date=date.today() + timedelta(days=10))
+            ProductStock.objects.create(product=product, on_hand=2)
+
+    def assert_tab_queries(self, tab, other_table):
+        with self.assertNumQueries(4):  # Session, user, count, page
+            response = self.client.get(reverse('homepage'), {'tab': tab})
+        self.assertEqual(response.status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('homepage'), {'tab': tab})
+        self.assertFalse([q for q in queries.captured_queries if f'FROM "{other_table}"' in q['sql']])
+
+        self.add_products(20)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('homepage'), {'tab': tab})
+        self.assertContains(response, 'Running Low', count=10)  # One page
+
+    def test_low_stock_tab_queries(self):
+        self.assert_tab_queries('lowstock', 'home_inventory')
+        print("✅ Low stock tab is a constant number of queries")
+
+    def test_expiring_tab_queries(self):
+        self.assert_tab_queries('expiring', 'home_product')
+        print("✅ Expiring tab is a constant number of queries")
+
+    def test_dashboard_counts(self):
+        response = self.client.get(reverse('dashboard_counts'))
+        self.assertEqual(response.json(), {'expiring_count': 5, 'low_stock_count': 5})
+        with self.assertNumQueries(2):  # Session and user; both counts come from the cache
+            self.assertEqual(self.client.get(reverse('dashboard_counts')).json(), {'expiring_count': 5, 'low_stock_count': 5})
+        print("✅ Dashboard counts are returned as JSON and cached")
+
+class ExplainInventoryQueriesTests(TestCase):
+    """
+    Test the explain_inventory_queries command:
+        - On its seeded fixture, every hot in-stock query is reported as an index scan.
+        - The seeded rows are rolled back afterwards.
+    """
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command('explain_inventory_queries', products=400, batches=25, stdout=out)
+
+        report = out.getvalue()
+        for name in ('inventory_list', 'inventory_search', 'sold_product_form_choices', 'homepage_expiring', 'homepage_expiring_count', 'related_inventory'):
+            self.assertIn(f"[INDEX] {name}", report)
+        self.assertNotIn("[SEQ SCAN]", report)
+        self.assertFalse(Inventory.objects.exists())
+        print("✅ explain_inventory_queries reports an index scan for every hot query")
+
+
+class FefoSaleTests(CatalogFixtureMixin, TestCase):
+    """
+    Test selling by product:
+        - The quantity is taken from the earliest expiring batches first, skipping expired ones.
+        - One SoldProduct is written per batch consumed.
+    """
+    def setUp(self):
+        self.user = self.log_in('cashier')
+        self.create_catalog('FEFO', 'FEFO Co')
+        self.product, = self.create_products(['Aspirin'], sale_price=2)
+        today = date.today()
+        self.expired = Inventory.objects.create(product=self.product, quantity=10, expiry_date=today - timedelta(days=1))
+        self.first = Inventory.objects.create(product=self.product, quantity=3, expiry_date=today + timedelta(days=10))
+        self.second = Inventory.objects.create(product=self.product, quantity=10, expiry_date=today + timedelta(days=100))
+
+    def test_sell_by_product_uses_earliest_expiry_first(self):
+        self.client.post(reverse('add_sale_transaction'), {
+            'transaction_number': 'FEFO-1',
+            'transaction_date': date.today().isoformat(),
+            'discount': 0,
+            'cash_received': 10,
+            'payment_method': 'Cash',
+            'products-TOTAL_FORMS': '1',
+            'products-INITIAL_FORMS': '0',
+            'products-0-product': self.product.id,
+            'products-0-quantity': '5',
+        })
+
+        sale = SaleTransaction.objects.get(transaction_number='FEFO-1')
+        self.assertEqual(
+            sorted(sale.sold_products.values_list('inventory_item_id', 'quantity')),
+            sorted([(self.first.id, 3), (self.second.id, 2)])
+        )
+        self.assertEqual(sale.price, 10)
+        self.assertEqual(Inventory.objects.get(pk=self.expired.pk).quantity, 10)
+        self.assertEqual(Inventory.objects.get(pk=self.first.pk).quantity, 0)
+        self.assertEqual(Inventory.objects.get(pk=self.second.pk).quantity, 8)
+        print("✅ Sell by product allocates FEFO")
+
+
+class StockLedgerTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the stock movement ledger:
+        - Sales and deletions append signed movements instead of rewriting history.
+        - Deleting an inventory item records the quantity it held when locked, not a stale read.
+        - Stock on hand at a past time is the latest snapshot plus the movements recorded after it.
+    """
+    def setUp(self):
+        self.user = self.log_in('ledger')
+        self.create_catalog('Ledger', 'Ledger Co')
+        self.product, = self.create_products(['Ibuprofen'])
+        self.inventory = Inventory.objects.create(product=self.product, quantity=10, expiry_date=date.today() + timedelta(days=60))
+
+    def sell(self, number, quantity):
+        self.client.post(reverse('add_sale_transaction'), {
+            'transaction_number': number,
+            'transaction_date': date.today().isoformat(),
+            'discount': 0,
+            'cash_received': 100,
+            'payment_method': 'Cash',
+            'products-TOTAL_FORMS': '1',
+            'products-INITIAL_FORMS': '0',
+            'products-0-inventory_item': self.inventory.id,
+            'products-0-quantity': str(quantity),
+        })
+
+    def test_sale_and_delete_are_recorded(self):
+        self.sell('LEDGER-1', 4)
+        sale = SaleTransaction.objects.get(transaction_number='LEDGER-1')
+        self.client.post(reverse('delete_sale_transaction', args=[sale.id]))
+
+        movements = list(
+            StockMovement.objects.filter(product=self.product)
+            .order_by('created_at', 'id')
+            .values_list('reason', 'quantity', 'reference')
+        )
+        self.assertEqual(movements, [('sale', -4, 'LEDGER-1'), ('sale_deleted', 4, 'LEDGER-1')])
+        print("✅ Sale and its deletion appear in the ledger")
+
+    def test_inventory_delete_records_locked_quantity(self):
+        def sell_meanwhile(*args, **kwargs):
+            # A sale commits between the view's first read and its lock
+            inventory = get_object_or_404(*args, **kwargs)
+            Inventory.objects.filter(pk=self.inventory.pk).update(quantity=6)
+            return inventory
+
+        with patch('home.views.get_object_or_404', side_effect=sell_meanwhile):
+            self.client.post(reverse('delete_inventory', args=[self.inventory.id]))
+
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 0)
+        movement = StockMovement.objects.get(product=self.product)
+        self.assertEqual((movement.reason, movement.quantity), ('adjustment', -6))
+        print("✅ Deleting an inventory item records the quantity it held under lock")
+
+    def test_stock_on_hand_at_rolls_forward_from_snapshot(self):
+        StockSnapshot.objects.create(product=self.product, taken_at=timezone.now() - timedelta(hours=1), on_hand=10)
+        self.sell('LEDGER-2', 3)
+        before_second_sale = timezone.now()
+        self.sell('LEDGER-3', 2)
+
+        self.assertEqual(stock_on_hand_at(before_second_sale, [self.product.id]), {self.product.id: 7})
+        self.assertEqual(stock_on_hand_at(timezone.now(), [self.product.id]), {self.product.id: 5})
+
+        take_stock_snapshots(timezone.now())
+        latest = StockSnapshot.objects.filter(product=self.product).first()
+        self.assertEqual(latest.on_hand, 5)
+        print("✅ Stock on hand is rebuilt from snapshots and movements")
+
+
+class ExpirySweepTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the nightly expiry sweep:
+        - Expired batches with stock are zeroed and written off at their purchase cost.
+        - Sellable batches are left alone and the run is recorded in the activity log.
+        - Expired batches are locked in id order, like sales and purchases lock them.
+    """
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', password='pass')
+        self.create_catalog('Sweep', 'Sweep Co')
+        self.product, = self.create_products(['Cough Syrup'], sale_price=5)
+        today = date.today()
+        self.expired = Inventory.objects.create(product=self.product, quantity=4, expiry_date=today - timedelta(days=2))
+        self.sellable = Inventory.objects.create(product=self.product, quantity=6, expiry_date=today + timedelta(days=30))
+
+        purchase = PurchaseTransaction.objects.create(manufacturer=self.manufacturer, invoice_number='SWEEP-1', total_cost=0)
+        PurchasedProduct.objects.create(purchase_transaction=purchase, product=self.product, quantity=2, purchase_price=3, expiry_date=self.expired.expiry_date)
+        PurchasedProduct.objects.create(purchase_transaction=purchase, product=self.product, quantity=2, purchase_price=5, expiry_date=self.expired.expiry_date)
+
+    def test_sweep_writes_off_expired_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            call_command('sweep_expired_inventory', stdout=StringIO())
+        sweep = next(q['sql'] for q in queries.captured_queries if 'FOR UPDATE' in q['sql'])
+        self.assertRegex(sweep, r'ORDER BY id\s+FOR UPDATE')  # Same lock order as sales and purchases
+
+        write_off = WriteOff.objects.get()
+        self.assertEqual((write_off.inventory_item_id, write_off.quantity), (self.expired.id, 4))
+        self.assertEqual(write_off.unit_cost, 4)
+        self.assertEqual(write_off.total_cost, 16)
+        self.assertEqual(Inventory.objects.get(pk=self.expired.pk).quantity, 0)
+        self.assertEqual(Inventory.objects.get(pk=self.sellable.pk).quantity, 6)
+        self.assertEqual(ProductStock.objects.get(product=self.product).on_hand, 6)
+        self.assertTrue(StockMovement.objects.filter(product=self.product, reason='write_off', quantity=-4).exists())
+        self.assertTrue(ActivityLog.objects.filter(user=self.admin, action="Swept expired inventory").exists())
+
+        call_command('sweep_expired_inventory', stdout=StringIO())
+        self.assertEqual(WriteOff.objects.count(), 1)
+        print("✅ Expired batches are written off once")
+
+
+class ReconcileInventoryTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the inventory reconciliation command:
+        - Inventory rows that disagree with purchases minus sales are reported as CSV.
+        - --repair corrects them and records the correction, so a second check is clean.
+        - A batch zeroed before the ledger existed is baselined by the opening balances, not restored.
+    """
+    def setUp(self):
+        User.objects.create_superuser(username='admin', password='pass')
+        self.create_catalog('Reconcile', 'Reconcile Co')
+        self.product, = self.create_products(['Vitamin C'])
+        expiry_date = date.today() + timedelta(days=90)
+        purchase = PurchaseTransaction.objects.create(manufacturer=self.manufacturer, invoice_number='REC-1', total_cost=0)
+        PurchasedProduct.objects.create(purchase_transaction=purchase, product=self.product, quantity=10, purchase_price=1, expiry_date=expiry_date)
+        self.inventory = Inventory.objects.create(product=self.product, quantity=10, expiry_date=expiry_date)
+        sale = SaleTransaction.objects.create(transaction_number='REC-S1')
+        SoldProduct.objects.create(sale_transaction=sale, inventory_item=self.inventory, quantity=3, sale_price=1)
+        # The sale was recorded but the inventory decrement was lost
+
+    def test_reconcile_reports_and_repairs(self):
+        out = StringIO()
+        call_command('reconcile_inventory', workers=1, stdout=out, stderr=StringIO())
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn(f"{self.inventory.id},{self.product.id},Vitamin C", lines[1])
+        self.assertTrue(lines[1].endswith(",10,7,3"))
+
+        call_command('reconcile_inventory', workers=1, repair=True, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 7)
+        self.assertEqual(ProductStock.objects.get(product=self.product).on_hand, 7)
+
+        out = StringIO()
+        call_command('reconcile_inventory', workers=1, stdout=out, stderr=StringIO())
+        self.assertEqual(len(out.getvalue().splitlines()), 1)
+        print("✅ Inventory discrepancies are reported and repaired")
+
+    def test_oversold_history_repaired_once(self):
+        # Sold more than was ever purchased: the history implies -5, which is repaired to 0 for good
+        sale = SaleTransaction.objects.create(transaction_number='REC-S2')
+        SoldProduct.objects.create(sale_transaction=sale, inventory_item=self.inventory, quantity=12, sale_price=1)
+
+        self.assertEqual(repair_inventory_discrepancies([self.product.id]), 1)
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 0)
+        self.assertEqual(repair_inventory_discrepancies([self.product.id]), 0)
+        self.assertEqual(find_inventory_discrepancies(self.product.id, self.product.id), [])
+        print("✅ Oversold inventory is repaired once and not reported again")
+
+    def test_batch_zeroed_before_ledger_is_kept(self):
+        # Zeroed through delete_inventory before deletions were recorded: 8 purchased, 0 left, no movement
+        product, = self.create_products(['Zinc'])
+        expiry_date = date.today() + timedelta(days=120)
+        purchase = PurchaseTransaction.objects.create(manufacturer=self.manufacturer, invoice_number='REC-2', total_cost=0)
+        PurchasedProduct.objects.create(purchase_transaction=purchase, product=product, quantity=8, purchase_price=1, expiry_date=expiry_date)
+        inventory = Inventory.objects.create(product=product, quantity=0, expiry_date=expiry_date)
+        StockSnapshot.objects.create(product=product, taken_at=timezone.now() - timedelta(hours=1), on_hand=0)
+        self.assertEqual(len(find_inventory_discrepancies(product.id, product.id)), 1)
+
+        opening_balances = import_module('home.migrations.0046_stockmovement_opening_balances')
+        with connection.schema_editor() as schema_editor:
+            opening_balances.record_opening_balances(django_apps, schema_editor)
+
+        self.assertEqual(find_inventory_discrepancies(product.id, product.id), [])
+        self.assertEqual(repair_inventory_discrepancies([product.id]), 0)
+        self.assertEqual(Inventory.objects.get(pk=inventory.pk).quantity, 0)
+        self.assertEqual(StockMovement.objects.get(inventory_item=inventory).quantity, -8)
+        self.assertEqual(stock_on_hand_at(timezone.now(), [product.id]), {product.id: 0})
+        print("✅ Stock removed before the ledger existed is baselined, not restored")
+
+
+class ReorderSuggestionTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the reorder engine:
+        - A product selling faster than its stock can cover gets a suggested order quantity.
+        - A product with no recent sales is not suggested, whatever its category threshold.
+    """
+    def setUp(self):
+        self.create_catalog('Reorder', 'Reorder Co')
+        self.fast, self.idle = self.create_products(['Paracetamol', 'Rare Ointment'])
+        expiry_date = date.today() + timedelta(days=365)
+        fast_inventory = Inventory.objects.create(product=self.fast, quantity=20, expiry_date=expiry_date)
+        Inventory.objects.create(product=self.idle, quantity=2, expiry_date=expiry_date)
+        ProductStock.objects.bulk_create([ProductStock(product=self.fast, on_hand=20), ProductStock(product=self.idle, on_hand=2)])
+
+        # 5 units a day over the last 28 days
+        for day in range(28):
+            sale = SaleTransaction.objects.create(
+                transaction_number=f"REORDER-{day}",
+                transaction_date=timezone.now() - timedelta(days=day)
+            )
+            SoldProduct.objects.create(sale_transaction=sale, inventory_item=fast_inventory, quantity=5, sale_price=1)
+
+    def test_suggestions_follow_sales_velocity(self):
+        call_command('compute_reorder_suggestions', stdout=StringIO())
+
+        suggestion = ReorderSuggestion.objects.get()
+        self.assertEqual(suggestion.product, self.fast)
+        self.assertEqual(suggestion.manufacturer, self.manufacturer)
+        self.assertAlmostEqual(suggestion.daily_velocity, 5)
+        self.assertAlmostEqual(suggestion.days_of_cover, 4)
+        self.assertEqual(suggestion.suggested_quantity, 5 * 21 - 20)
+        print("✅ Reorder suggestions follow sales velocity")
+
+    def test_window_follows_local_date(self):
+        # 23:30 UTC is already the next day in Europe/Berlin, where the sales are bucketed
+        now = datetime(2026, 3, 10, 23, 30, tzinfo=dt_timezone.utc)
+        late = Product.objects.create(name='Night Sale', category=self.category, manufacturer=self.manufacturer, sale_price=1)
+        inventory = Inventory.objects.create(product=late, quantity=1, expiry_date=date(2027, 1, 1))
+        sale = SaleTransaction.objects.create(transaction_number='REORDER-LATE', transaction_date=now)
+        SoldProduct.objects.create(sale_transaction=sale, inventory_item=inventory, quantity=28, sale_price=1)
+
+        with patch('django.utils.timezone.now', return_value=now):
+            call_command('compute_reorder_suggestions', stdout=StringIO())
+        self.assertTrue(ReorderSuggestion.objects.filter(product=late).exists())
+        print("✅ Reorder window ends on the local date")
+
+
+class BulkSaleCommitTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the bulk sale commit path:
+        - The number of queries per sale stays constant as the cart grows.
+        - A line that cannot be fulfilled rolls back the whole sale.
+    """
+    def setUp(self):
+        self.create_catalog('Bulk', 'Bulk Co')
+        expiry_date = date.today() + timedelta(days=200)
+        products = Product.objects.bulk_create([
+            Product(name=f"Bulk product {i}", category=self.category, manufacturer=self.manufacturer, sale_price=2)
+            for i in range(30)
+        ])
+        self.inventory = Inventory.objects.bulk_create([
+            Inventory(product=product, quantity=100, expiry_date=expiry_date) for product in products
+        ])
+
+    def queries_for_cart(self, size):
+        sale = SaleTransaction.objects.create(transaction_number=f"BULK-{size}", discount=0)
+        lines = [(item.id, None, 1) for item in reversed(self.inventory[:size])]
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                commit_sale(sale, lines, date.today())
+        return len(queries)
+
+    def test_queries_per_sale_are_constant(self):
+        counts = {size: self.queries_for_cart(size) for size in (1, 10, 30)}
+        print(f"Queries per sale by cart size: {counts}")
+        self.assertEqual(len(set(counts.values())), 1)
+        self.assertEqual(Inventory.objects.get(pk=self.inventory[0].pk).quantity, 97)
+        print("✅ Queries per sale stay constant as the cart grows")
+
+    def test_insufficient_line_rolls_back(self):
+        sale = SaleTransaction.objects.create(transaction_number="BULK-FAIL", discount=0)
+        lines = [(self.inventory[0].id, None, 5), (self.inventory[1].id, None, 101)]
+        with self.assertRaises(InsufficientStockError):
+            with transaction.atomic():
+                commit_sale(sale, lines, date.today())
+        self.assertEqual(Inventory.objects.get(pk=self.inventory[0].pk).quantity, 100)
+        self.assertFalse(SoldProduct.objects.filter(sale_transaction=sale).exists())
+        print("✅ An unfulfillable line rolls back the whole sale")
+
+
+class EffectivePriceTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the precomputed effective prices:
+        - Adding, editing and deleting discounts and changing the sale price keep EffectivePrice up to date.
+        - The prices of a whole cart are resolved in one query.
+        - The rebuild_effective_prices command reports and repairs changes made behind the signals.
+    """
+    def setUp(self):
+        self.create_catalog('Pricing', 'Pricing Co')
+        self.product, = self.create_products(['Allergy Relief'], sale_price=Decimal('20.00'))
+        self.other, = self.create_products(['Nasal Spray'], sale_price=Decimal('8.00'))
+        self.today = date.today()
+
+    def prices(self, day=None):
+        return resolve_sale_prices([self.product, self.other], day or self.today)
+
+    def test_prices_follow_discounts_and_sale_price(self):
+        summer = Discount.objects.create(name='Summer', percentage=10, from_date=self.today, to_date=self.today + timedelta(days=5))
+        summer.products.add(self.product)
+        stacked = Discount.objects.create(name='Stacked', percentage=15, from_date=self.today + timedelta(days=3), to_date=self.today + timedelta(days=9))
+        self.other.discounts.add(stacked)
+        stacked.products.add(self.product)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.prices(), {self.product.id: Decimal('18.00'), self.other.id: Decimal('8.00')})
+        self.assertEqual(self.prices(self.today + timedelta(days=4)), {self.product.id: Decimal('15.00'), self.other.id: Decimal('6.80')})
+        self.assertEqual(self.prices(self.today + timedelta(days=10)), {self.product.id: Decimal('20.00'), self.other.id: Decimal('8.00')})
+
+        self.product.sale_price = Decimal('30.00')
+        self.product.save()
+        summer.percentage = 50
+        summer.save()
+        self.assertEqual(self.prices()[self.product.id], Decimal('15.00'))
+
+        summer.delete()
+        stacked.products.clear()
+        self.assertEqual(self.prices(self.today + timedelta(days=4)), {self.product.id: Decimal('30.00'), self.other.id: Decimal('8.00')})
+        print("✅ Effective prices follow discount and sale price changes")
+
+    def test_other_product_edits_skip_rebuild(self):
+        def price_queries(**changes):
+            for field, value in changes.items():
+                setattr(self.product, field, value)
+            with CaptureQueriesContext(connection) as queries:
+                self.product.save()
+            return [q for q in queries.captured_queries if 'home_effectiveprice' in q['sql']]
+
+        self.assertFalse(price_queries(name='Allergy Relief Forte', description='Renamed'))
+        self.assertTrue(price_queries(sale_price=Decimal('25.00')))
+        self.assertEqual(self.prices()[self.product.id], Decimal('25.00'))
+        self.product.save(update_fields=['name'])
+        self.assertEqual(EffectivePrice.objects.filter(product=self.product).count(), 1)
+        print("✅ Product edits that keep the sale price do not rebuild effective prices")
+
+    def test_rebuild_command_repairs_bulk_changes(self):
+        # Queryset updates and bulk_create bypass the signals
+        Product.objects.filter(pk=self.product.pk).update(sale_price=Decimal('40.00'))
+        bulk, = Product.objects.bulk_create([Product(name='Bulk Balm', category=self.category, manufacturer=self.manufacturer, sale_price=Decimal('2.00'))])
+
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '2 product(s) out of sync'):
+            call_command('rebuild_effective_prices', check=True, stdout=out)
+        self.assertIn('Allergy Relief', out.getvalue())
+
+        call_command('rebuild_effective_prices', batch_size=2, stdout=StringIO())
+        call_command('rebuild_effective_prices', check=True, stdout=StringIO())
+        self.assertEqual(self.prices()[self.product.id], Decimal('40.00'))
+        self.assertTrue(EffectivePrice.objects.filter(product=bulk, price=Decimal('2.00')).exists())
+        print("✅ rebuild_effective_prices finds and repairs prices changed behind the signals")
+
+
+class PosSalesApiTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the batched POS sales endpoint:
+        - Several sales are created by one JSON request, each succeeding or failing on its own.
+        - The number of queries does not grow with the number of sales.
+        - A repeated call with the same Idempotency-Key is replayed without touching the messages framework.
+    """
+    def setUp(self):
+        self.log_in('pos')
+        self.create_catalog('POS', 'POS Co')
+        self.product, = self.create_products(['Throat Lozenges'], sale_price=Decimal('3.00'))
+        self.inventory = Inventory.objects.create(product=self.product, quantity=10, expiry_date=date.today() + timedelta(days=100))
+
+    def post(self, sales):
+        return self.client.post(reverse('pos_sales'), data=json.dumps({'sales': sales}), content_type='application/json')
+
+    def test_batch_of_sales(self):
+        response = self.post([
+            {'transaction_number': 'POS-1', 'products': [{'inventory_id': self.inventory.id, 'quantity': 4}]},
+            {'transaction_number': 'POS-2', 'products': [{'inventory_id': self.inventory.id, 'quantity': 7}]},
+            {'transaction_number': 'POS-3', 'discount': 1, 'products': [{'product_id': self.product.id, 'quantity': 6}]},
+            {'transaction_number': 'POS-1', 'products': [{'inventory_id': self.inventory.id, 'quantity': 1}]},
+            {'transaction_number': 'POS-5', 'products': []},
+        ])
+
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'created', 'error', 'error'])
+        self.assertEqual(results[2]['total'], '17.00')
+        self.assertIn('Not enough stock', results[1]['error'])
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 0)
+        self.assertEqual(ProductStock.objects.get(product=self.product).on_hand, 0)
+        self.assertEqual(ActivityLog.objects.filter(action="added sale transaction via POS").count(), 2)
+        print("✅ POS batch creates each valid sale")
+
+    def test_queries_do_not_grow_with_batch(self):
+        Inventory.objects.filter(pk=self.inventory.pk).update(quantity=1000)
+
+        def queries_for(count, prefix):
+            sales = [
+                {'transaction_number': f'{prefix}-{i}', 'products': [{'inventory_id': self.inventory.id, 'quantity': 1}]}
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = self.post(sales)
+                elapsed = time.perf_counter() - started
+            self.assertEqual(response.status_code, 201)
+            print(f"POS request with {count} sale(s): {len(queries)} queries, {elapsed * 1000:.1f} ms")
+            return len(queries)
+
+        self.assertEqual(queries_for(1, 'ONE'), queries_for(50, 'MANY'))
+        print("✅ POS queries are constant per request")
+
+    def test_idempotent_pos_call_skips_messages(self):
+        sale = {'transaction_number': 'POS-IDEM', 'products': [{'inventory_id': self.inventory.id, 'quantity': 1}]}
+        with patch('django.contrib.messages.get_messages', side_effect=AssertionError("messages read by a JSON endpoint")):
+            first = self.client.post(reverse('pos_sales'), data=json.dumps(sale), content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-key')
+            second = self.client.post(reverse('pos_sales'), data=json.dumps(sale), content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-key')
+
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 9)
+        print("✅ Idempotent POS calls are decided from the response, without the messages framework")
+
+
+class IdempotencyKeyTests(CatalogFixtureMixin, TestCase):
+    """
+    Test idempotent submissions:
+        - Submitting the same sale form twice creates one sale and takes the stock once.
+        - A failed submission releases its key so the corrected form can be sent again.
+        - A repeat of a request still in progress gets 409 at once instead of waiting for it, until its lease runs out.
+        - An unread error message left by an earlier request does not release the key of a successful one.
+        - Old keys are purged.
+    """
+    def setUp(self):
+        self.user = self.log_in('cashier')
+        self.create_catalog('Idempotent', 'Idempotent Co')
+        product, = self.create_products(['Eye Drops'], sale_price=4)
+        self.inventory = Inventory.objects.create(product=product, quantity=5, expiry_date=date.today() + timedelta(days=100))
+
+    def submit(self, quantity, key='same-key'):
+        return self.client.post(reverse('add_sale_transaction'), {
+            'idempotency_key': key,
+            'transaction_number': 'IDEM-1',
+            'transaction_date': date.today().isoformat(),
+            'discount': 0,
+            'cash_received': 20,
+            'payment_method': 'Cash',
+            'products-TOTAL_FORMS': '1',
+            'products-INITIAL_FORMS': '0',
+            'products-0-inventory_item': self.inventory.id,
+            'products-0-quantity': str(quantity),
+        })
+
+    def test_double_submit_runs_once(self):
+        first = self.submit(2)
+        second = self.submit(2)
+
+        self.assertEqual(first.status_code, 302)
+        self.assertRedirects(second, first['Location'], fetch_redirect_response=False)
+        self.assertIn("This submission was already processed.", [str(m) for m in get_messages(second.wsgi_request)])
+        self.assertEqual(SaleTransaction.objects.filter(transaction_number='IDEM-1').count(), 1)
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 3)
+        print("✅ Double-submitted sale is processed once")
+
+    def test_failed_submit_releases_key(self):
+        self.submit(50)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.submit(1)
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 4)
+        print("✅ A failed submission can be retried with its key")
+
+    def test_in_progress_repeat_gets_409(self):
+        IdempotencyKey.objects.create(key='busy-key', user=self.user, endpoint='add_sale_transaction')
+        started = time.monotonic()
+        response = self.submit(1, key='busy-key')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(SaleTransaction.objects.exists())
+        print("✅ A repeat of an in-progress submission is answered with 409 at once")
+
+    def test_stale_in_progress_key_taken_over(self):
+        # Left behind by a worker that crashed mid-request
+        IdempotencyKey.objects.create(key='crashed-key', user=self.user, endpoint='add_sale_transaction', created_at=timezone.now() - timedelta(minutes=5))
+        response = self.submit(1, key='crashed-key')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(IdempotencyKey.objects.get(key='crashed-key').status_code, 302)
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 4)
+        print("✅ A retry takes over the key of a crashed request once its lease has run out")
+
+    def test_earlier_unread_error_does_not_fail_request(self):
+        # Leaves an error message unread in the message storage
+        self.client.post(reverse('add_user'))
+        self.submit(1)
+        self.assertEqual(IdempotencyKey.objects.get(key='same-key').status_code, 302)
+
+        self.submit(1)
+        self.assertEqual(SaleTransaction.objects.count(), 1)
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 4)
+        print("✅ Only the messages of the request itself decide whether it failed")
+
+    def test_purge_old_keys(self):
+        IdempotencyKey.objects.create(key='old', endpoint='add_sale_transaction', created_at=timezone.now() - timedelta(days=2))
+        IdempotencyKey.objects.create(key='new', endpoint='add_sale_transaction')
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+        print("✅ Expired idempotency keys are purged")
+
+
+class PosSyncTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the offline POS sync endpoint:
+        - Queued sales are applied in chronological order, not in queue order, across several chunks.
+        - Insufficient stock, duplicate numbers and malformed lines are reported per line.
+        - A queue over POS_SYNC_MAX_LINES is rejected as a whole, before anything is applied.
+    """
+    def setUp(self):
+        self.log_in('counter')
+        self.create_catalog('Offline', 'Offline Co')
+        product, = self.create_products(['Antacid'], sale_price=Decimal('2.50'))
+        self.inventory = Inventory.objects.create(product=product, quantity=5, expiry_date=date.today() + timedelta(days=100))
+
+    def test_sync_applies_sales_in_time_order(self):
+        now = timezone.now()
+        queue = [
+            {'transaction_number': 'OFF-3', 'transaction_date': (now - timedelta(minutes=10)).isoformat(), 'products': [{'inventory_id': self.inventory.id, 'quantity': 3}]},
+            {'transaction_number': 'OFF-1', 'transaction_date': (now - timedelta(minutes=30)).isoformat(), 'products': [{'inventory_id': self.inventory.id, 'quantity': 2}]},
+            {'transaction_number': 'OFF-2', 'transaction_date': (now - timedelta(minutes=20)).isoformat(), 'products': [{'inventory_id': self.inventory.id, 'quantity': 2}]},
+            {'transaction_number': 'OFF-1', 'transaction_date': (now - timedelta(minutes=5)).isoformat(), 'products': [{'inventory_id': self.inventory.id, 'quantity': 1}]},
+        ]
+        body = "\n".join(json.dumps(sale) for sale in queue) + "\nnot json\n"
+
+        with patch('home.views.POS_SYNC_CHUNK_SIZE', 2):
+            response = self.client.post(reverse('pos_sync'), data=body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual((payload['created'], payload['failed']), (2, 3))
+        statuses = {result['line']: result['status'] for result in payload['results']}
+        self.assertEqual(statuses, {1: 'conflict', 2: 'created', 3: 'created', 4: 'conflict', 5: 'error'})
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 1)
+        self.assertEqual(
+            list(SaleTransaction.objects.order_by('transaction_date').values_list('transaction_number', flat=True)),
+            ['OFF-1', 'OFF-2']
+        )
+        print("✅ Offline sales sync in chronological order with per-line conflicts")
+
+    def test_sync_rejects_oversized_queue(self):
+        sale = {'transaction_date': timezone.now().isoformat(), 'products': [{'inventory_id': self.inventory.id, 'quantity': 1}]}
+        body = "\n".join(json.dumps({**sale, 'transaction_number': f'BIG-{i}'}) for i in range(3))
+
+        with patch('home.views.POS_SYNC_MAX_LINES', 2):
+            response = self.client.post(reverse('pos_sync'), data=body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SaleTransaction.objects.exists())
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 5)
+        print("✅ An offline queue over the line limit is rejected before any sale is applied")
+
+class InventorySearchTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the sale form's inventory typeahead:
+        - Only in-stock rows whose product name starts with the query are returned, case-insensitively.
+        - Rows come back by product name, earliest expiry first, capped by the limit.
+        - The query count does not grow with the number of rows returned.
+    """
+    def setUp(self):
+        self.log_in('clerk')
+        self.create_catalog('Search', 'Search Co')
+        expiry = date.today() + timedelta(days=100)
+        for product in self.create_products(['Paracetamol', 'Paroxetine', 'Ibuprofen'], sale_price=Decimal('2.00')):
+            for offset, quantity in enumerate([5, 0, 3]):
+                Inventory.objects.create(product=product, quantity=quantity, expiry_date=expiry + timedelta(days=30 * (2 - offset)))
+
+    def test_prefix_search(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('search_inventory'), {'q': 'par'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([row['product'] for row in results], ['Paracetamol', 'Paracetamol', 'Paroxetine', 'Paroxetine'])
+        self.assertTrue(all(row['quantity'] > 0 for row in results))
+        self.assertLess(results[0]['expiry_date'], results[1]['expiry_date'])
+        self.assertLessEqual(len([q for q in queries.captured_queries if 'home_inventory' in q['sql'] or 'home_effectiveprice' in q['sql']]), 2)
+
+        response = self.client.get(reverse('search_inventory'), {'q': 'PAR', 'limit': 1})
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertEqual(self.client.get(reverse('search_inventory'), {'limit': 'x'}).status_code, 400)
+        print("✅ Inventory typeahead matches in-stock rows by name prefix")
+
+class SoldProductFormTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the inventory field of the sale formset:
+        - Rendering any number of rows does not query the inventory; items are picked through the search.
+        - A posted item is validated against the in-stock inventory only.
+    """
+    def setUp(self):
+        self.create_catalog('Choices', 'Choices Co')
+        self.items = [
+            Inventory.objects.create(product=product, quantity=i, expiry_date=date.today() + timedelta(days=100))
+            for i, product in enumerate(self.create_products([f'Choice {i}' for i in range(5)]))
+        ]
+        self.formset_class = modelformset_factory(SoldProduct, form=SoldProductForm, extra=10)
+
+    def test_rows_render_without_inventory_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            formset = self.formset_class(queryset=SoldProduct.objects.none(), prefix='products')
+            rendered = [str(form['inventory_item']) for form in formset] + [str(formset.empty_form['inventory_item'])]
+        self.assertFalse([q for q in queries.captured_queries if 'home_inventory' in q['sql']])
+        self.assertIn('type="hidden"', rendered[0])
+
+        data = {'products-TOTAL_FORMS': '2', 'products-INITIAL_FORMS': '0',
+                'products-0-inventory_item': self.items[4].id, 'products-0-quantity': '1',
+                'products-1-inventory_item': self.items[0].id, 'products-1-quantity': '1'}
+        formset = self.formset_class(data, queryset=SoldProduct.objects.none(), prefix='products')
+        self.assertFalse(formset.is_valid())
+        self.assertFalse(formset.forms[0].errors)
+        self.assertIn('inventory_item', formset.forms[1].errors)  # Out of stock
+        print("✅ Sale formset renders without querying the inventory and validates posted items")
+
+class InventoryPricesApiTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the batched price and availability lookup of the sale form:
+        - A whole cart is priced, with its active discounts, by one query.
+        - Unknown items are reported as missing.
+        - A repeated request with the returned ETag is answered with 304.
+    """
+    def setUp(self):
+        get_cache().clear()
+        self.log_in('clerk')
+        self.create_catalog('Prices', 'Prices Co')
+        expiry = date.today() + timedelta(days=100)
+        discount = Discount.objects.create(name='Winter', percentage=25, from_date=date.today(), to_date=expiry)
+        self.items = []
+        for i, product in enumerate(self.create_products([f'Priced {i}' for i in range(20)], sale_price=Decimal('4.00'))):
+            if i % 2:
+                discount.products.add(product)
+            self.items.append(Inventory.objects.create(product=product, quantity=i + 1, expiry_date=expiry))
+
+    def test_batched_prices(self):
+        ids = ",".join(str(item.id) for item in self.items) + ",999999"
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('get_inventory_prices'), {'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([q for q in queries.captured_queries if 'home_inventory' in q['sql']]), 1)
+
+        payload = response.json()
+        self.assertEqual(payload['missing'], [999999])
+        self.assertEqual(payload['items'][str(self.items[0].id)], {'price': '4.00', 'effective_price': '4.00', 'available_quantity': 1})
+        self.assertEqual(payload['items'][str(self.items[1].id)], {'price': '4.00', 'effective_price': '3.00', 'available_quantity': 2})
+
+        response = self.client.get(reverse('get_inventory_prices'), {'ids': ids}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(reverse('get_inventory_prices'), {'ids': 'a,b'}).status_code, 400)
+        print("✅ Cart prices and availability fetched in one round trip")
+
+class DocumentNumberTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the server-generated sale and purchase numbers:
+        - Numbers come from a sequence per kind and year, so each year restarts at 1.
+        - A sale submitted without a number, from the form or the POS API, is numbered by the server.
+        - A purchase without an invoice number, typed or scanned, is numbered once, by commit_purchase.
+        - Hand-typed numbers in the reserved format are rejected, from the forms, the POS endpoints and scanned documents.
+    """
+    def setUp(self):
+        self.user = self.log_in('numbering')
+        self.create_catalog('Numbering', 'Numbering Co')
+        product, = self.create_products(['Vitamin C'], sale_price=Decimal('5.00'))
+        self.inventory = Inventory.objects.create(product=product, quantity=10, expiry_date=date.today() + timedelta(days=100))
+
+    def add_sale(self, transaction_number):
+        return self.client.post(reverse('add_sale_transaction'), {
+            'transaction_number': transaction_number,
+            'transaction_date': date.today().isoformat(),
+            'discount': 0,
+            'cash_received': 10,
+            'payment_method': 'Cash',
+            'products-TOTAL_FORMS': '1',
+            'products-INITIAL_FORMS': '0',
+            'products-0-inventory_item': self.inventory.id,
+            'products-0-quantity': '1',
+        })
+
+    def test_numbers_per_year(self):
+        self.assertEqual(next_document_numbers('sale', 2031, 3), ['S-2031-000001', 'S-2031-000002', 'S-2031-000003'])
+        self.assertEqual(next_document_numbers('sale', 2032), ['S-2032-000001'])
+        self.assertEqual(next_document_numbers('purchase', 2031), ['P-2031-000001'])
+        self.assertEqual(next_document_numbers('sale', 2031), ['S-2031-000004'])
+        print("✅ Document numbers restart every year")
+
+    def test_sales_numbered_by_server(self):
+        self.add_sale('')
+        self.add_sale(f'S-{timezone.localdate().year}-999999')  # Reserved format
+        response = self.client.post(reverse('pos_sales'), data=json.dumps({'sales': [
+            {'products': [{'inventory_id': self.inventory.id, 'quantity': 1}]},
+            {'products': [{'inventory_id': self.inventory.id, 'quantity': 1}]},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        numbers = list(SaleTransaction.objects.order_by('id').values_list('transaction_number', flat=True))
+        self.assertEqual(len(numbers), 3)
+        self.assertEqual(len(set(numbers)), 3)
+        self.assertTrue(all(number.startswith(f'S-{timezone.localdate().year}-') for number in numbers))
+        self.assertEqual([result['transaction_number'] for result in response.json()['results']], numbers[1:])
+        print("✅ Sales without a number are numbered by the server")
+
+    def test_purchases_numbered_once_by_the_service(self):
+        expiry = (date.today() + timedelta(days=100)).isoformat()
+        self.client.post(reverse('add_purchase_transaction'), {
+            'invoice_number': '',
+            'manufacturer': self.manufacturer.id,
+            'purchase_date': '2034-06-01',
+            'remarks': '',
+            'products-TOTAL_FORMS': '1',
+            'products-INITIAL_FORMS': '0',
+            'products-0-product': self.inventory.product_id,
+            'products-0-quantity': '2',
+            'products-0-purchase_price': '1.00',
+            'products-0-expiry_date': expiry,
+        })
+        upload = SimpleUploadedFile('purchase.json', json.dumps({
+            'manufacturer': 'Numbering Co', 'purchase_date': '2034-06-02', 'total_cost': 1,
+            'products': [{'product': 'Vitamin C', 'quantity': 1, 'purchase_price': 1, 'expiry_date': expiry}],
+        }).encode(), content_type='application/json')
+        self.client.post(reverse('scan_purchase_transaction'), {'json_file': upload})
+
+        numbers = list(PurchaseTransaction.objects.order_by('id').values_list('invoice_number', flat=True))
+        self.assertEqual(numbers, ['P-2034-000001', 'P-2034-000002'])
+        self.assertEqual(next_document_numbers('purchase', 2034), ['P-2034-000003'])
+        print("✅ Purchases without an invoice number take one sequence value each")
+
+    def test_reserved_numbers_rejected_from_pos_and_scans(self):
+        year = timezone.localdate().year
+        sale = {'transaction_number': f'S-{year}-000001', 'products': [{'inventory_id': self.inventory.id, 'quantity': 1}]}
+        response = self.client.post(reverse('pos_sales'), data=json.dumps({'sales': [sale]}), content_type='application/json')
+        self.assertIn('reserved', response.json()['results'][0]['error'])
+        response = self.client.post(reverse('pos_sync'), data=json.dumps({**sale, 'transaction_date': timezone.now().isoformat()}), content_type='application/x-ndjson')
+        self.assertIn('reserved', response.json()['results'][0]['error'])
+
+        purchase = {
+            'invoice_number': f'P-{year}-000001', 'manufacturer': 'Numbering Co', 'purchase_date': date.today().isoformat(), 'total_cost': 5,
+            'products': [{'product': 'Vitamin C', 'quantity': 1, 'purchase_price': 5, 'expiry_date': (date.today() + timedelta(days=100)).isoformat()}],
+        }
+        scanned_sale = {'transaction_date': date.today().isoformat(), 'discount': 0, 'cash_received': 5, 'payment_method': 'Cash', **sale}
+        results = import_scans([('purchase.json', json.dumps(purchase)), ('sale.json', json.dumps(scanned_sale))], self.user)
+        self.assertEqual([result['status'] for result in results], ['error', 'error'])
+        self.assertTrue(all('reserved' in result['error'] for result in results))
+        with self.assertRaisesMessage(ScanError, 'reserved'):
+            import_streamed_scan(BytesIO(json.dumps(purchase).encode()), self.user, 'purchase')
+
+        self.assertFalse(SaleTransaction.objects.exists())
+        self.assertFalse(PurchaseTransaction.objects.exists())
+        print("✅ POS and scanned documents cannot use the reserved number format")
+
+class PurchaseCommitTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the bulk purchase commit:
+        - Lines are added to existing Inventory rows or create new ones, same-batch lines being summed.
+        - A large delivery costs a constant number of queries.
+        - Existing Inventory rows are locked in ID order, like sales lock them, before the upsert.
+    """
+    def setUp(self):
+        self.create_catalog('Delivery', 'Delivery Co')
+        self.products = self.create_products([f'Delivered {i}' for i in range(50)])
+        self.expiry = date.today() + timedelta(days=200)
+        self.existing = Inventory.objects.create(product=self.products[0], quantity=7, expiry_date=self.expiry)
+
+    def test_large_delivery(self):
+        purchase = PurchaseTransaction(invoice_number='DEL-1', manufacturer=self.manufacturer, total_cost=0)
+        lines = [
+            PurchasedProduct(product=self.products[i % 50], quantity=2, purchase_price=Decimal('1.50'), expiry_date=self.expiry + timedelta(days=i // 100))
+            for i in range(200)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                commit_purchase(purchase, lines)
+        self.assertLess(len(queries), 15)
+        statements = [q['sql'] for q in queries.captured_queries]
+        lock = next(i for i, sql in enumerate(statements) if 'FOR UPDATE' in sql and 'home_inventory' in sql)
+        upsert = next(i for i, sql in enumerate(statements) if 'ON CONFLICT' in sql)
+        self.assertLess(lock, upsert)
+        self.assertIn('ORDER BY inventory.id', statements[lock])
+
+        self.assertEqual(PurchasedProduct.objects.filter(purchase_transaction=purchase).count(), 200)
+        self.assertEqual(Inventory.objects.get(pk=self.existing.pk).quantity, 7 + 4)
+        self.assertEqual(Inventory.objects.count(), 100)
+        self.assertEqual(ProductStock.objects.get(product=self.products[0]).on_hand, 7 + 8)
+        self.assertEqual(StockMovement.objects.filter(reference='DEL-1').aggregate(total=Sum('quantity'))['total'], 400)
+        print("✅ 200-line delivery committed with a constant number of queries")
+
+class TransactionDeletionTests(CatalogFixtureMixin, TestCase):
+    """
+    Test deleting purchases and sales:
+        - A purchase whose stock was partly sold cannot be deleted, and nothing changes.
+        - Deleting a large purchase or sale adjusts the stock with a constant number of queries.
+    """
+    def setUp(self):
+        self.log_in('manager')
+        self.create_catalog('Deletion', 'Deletion Co')
+        self.products = self.create_products([f'Deleted {i}' for i in range(30)])
+        self.expiry = date.today() + timedelta(days=200)
+        with transaction.atomic():
+            self.purchase = PurchaseTransaction(invoice_number='DEL-INV', manufacturer=self.manufacturer, total_cost=0)
+            commit_purchase(self.purchase, [
+                PurchasedProduct(product=product, quantity=5, purchase_price=1, expiry_date=self.expiry)
+                for product in self.products
+            ])
+
+    def test_purchase_deletion_checks_stock(self):
+        inventory = Inventory.objects.get(product=self.products[0])
+        inventory.quantity = 4  # One unit already sold
+        inventory.save()
+
+        self.client.post(reverse('delete_purchase_transaction', args=[self.purchase.id]))
+        self.assertTrue(PurchaseTransaction.objects.filter(pk=self.purchase.pk).exists())
+        self.assertEqual(Inventory.objects.filter(quantity=5).count(), 29)
+
+        inventory.quantity = 5
+        inventory.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('delete_purchase_transaction', args=[self.purchase.id]))
+        self.assertLess(len(queries), 25)
+        self.assertFalse(PurchaseTransaction.objects.filter(pk=self.purchase.pk).exists())
+        self.assertFalse(Inventory.objects.filter(quantity__gt=0).exists())
+        self.assertFalse(ProductStock.objects.filter(on_hand__gt=0).exists())
+        print("✅ Purchase deletion locks, checks and adjusts stock in bulk")
+
+    def test_sale_deletion_restocks(self):
+        sale = SaleTransaction.objects.create(transaction_number='DEL-SALE', transaction_date=timezone.now(), price=0, total=0)
+        commit_sale(sale, [(None, product.id, 2) for product in self.products], date.today())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('delete_sale_transaction', args=[sale.id]))
+        self.assertLess(len(queries), 25)
+        self.assertFalse(SaleTransaction.objects.filter(pk=sale.pk).exists())
+        self.assertEqual(Inventory.objects.filter(quantity=5).count(), 30)
+        self.assertEqual(StockMovement.objects.filter(reason='sale_deleted').aggregate(total=Sum('quantity'))['total'], 60)
+        print("✅ Sale deletion restocks in bulk")
+
+class PurchaseScanTests(CatalogFixtureMixin, TestCase):
+    """
+    Test importing scanned purchase documents:
+        - Every product name is resolved up front, so the query count does not grow with the number of lines.
+        - A document with an unknown product is rejected before anything is written.
+    """
+    def setUp(self):
+        self.log_in('receiver')
+        self.create_catalog('Scanned', 'Scan Pharma')
+        self.create_products([f'Scanned {i}' for i in range(100)])
+
+    def scan(self, invoice_number, names):
+        document = {
+            'invoice_number': invoice_number,
+            'manufacturer': 'Scan Pharma',
+            'purchase_date': date.today().isoformat(),
+            'total_cost': 10 * len(names),
+            'products': [
+                {'product': name, 'quantity': 10, 'purchase_price': 1.0, 'expiry_date': (date.today() + timedelta(days=365)).isoformat()}
+                for name in names
+            ],
+        }
+        upload = SimpleUploadedFile(f'{invoice_number}.json', json.dumps(document).encode(), content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('scan_purchase_transaction'), {'json_file': upload})
+        return len(queries)
+
+    def test_scan_query_count_is_constant(self):
+        small = self.scan('SCAN-1', [f'Scanned {i}' for i in range(5)])
+        large = self.scan('SCAN-2', [f'Scanned {i}' for i in range(100)])
+        self.assertEqual(small, large)
+        self.assertEqual(PurchasedProduct.objects.filter(purchase_transaction__invoice_number='SCAN-2').count(), 100)
+
+        self.scan('SCAN-3', [f'Scanned {i}' for i in range(50)] + ['Unknown'])
+        self.assertFalse(PurchaseTransaction.objects.filter(invoice_number='SCAN-3').exists())
+        print("✅ Purchase scans resolve all product names in one query")
+
+class ScanImportTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the batch scan import:
+        - A ZIP of purchase and sale documents is imported in one request, with a result per file.
+        - A bad document only fails itself.
+        - The import_scans command validates documents in a process pool and imports a directory.
+    """
+    def setUp(self):
+        self.user = self.log_in('importer', is_superuser=True)
+        self.create_catalog('Imported', 'Import Pharma')
+        self.product, = self.create_products(['Imported Syrup'], sale_price=Decimal('6.00'))
+        self.inventory = Inventory.objects.create(product=self.product, quantity=10, expiry_date=date.today() + timedelta(days=300))
+
+    def documents(self):
+        expiry = (date.today() + timedelta(days=300)).isoformat()
+        purchase = lambda number: json.dumps({
+            'invoice_number': number, 'manufacturer': 'Import Pharma', 'purchase_date': date.today().isoformat(), 'total_cost': 20,
+            'products': [{'product': 'Imported Syrup', 'quantity': 5, 'purchase_price': 2.0, 'expiry_date': expiry}],
+        })
+        sale = json.dumps({
+            'transaction_number': 'IMP-S1', 'transaction_date': date.today().isoformat(), 'discount': 0, 'cash_received': 20,
+            'payment_method': 'Cash', 'customer': 'Jane Import', 'products': [{'inventory_id': self.inventory.id, 'quantity': 3}],
+        })
+        return {'purchase_1.json': purchase('IMP-P1'), 'purchase_2.json': purchase('IMP-P2'), 'sale_1.json': sale, 'broken.json': '{"products": ['}
+
+    def test_zip_upload(self):
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            for name, content in self.documents().items():
+                zip_file.writestr(name, content)
+        upload = SimpleUploadedFile('week.zip', archive.getvalue(), content_type='application/zip')
+
+        response = self.client.post(reverse('scan_import'), {'files': [upload]})
+        self.assertEqual(response.status_code, 201)
+        statuses = {result['file']: result['status'] for result in response.json()['results']}
+        self.assertEqual(statuses, {
+            'week.zip/broken.json': 'error', 'week.zip/purchase_1.json': 'created',
+            'week.zip/purchase_2.json': 'created', 'week.zip/sale_1.json': 'created',
+        })
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 10 + 5 + 5 - 3)
+        self.assertEqual(SaleTransaction.objects.get(transaction_number='IMP-S1').customer.full_name, 'Jane Import')
+        print("✅ ZIP of scans imported with a per-file report")
+
+    def test_purchase_batch_committed_in_bulk(self):
+        purchase = json.loads(self.documents()['purchase_1.json'])
+
+        def import_batch(count):
+            files = [(f'bulk_{i}.json', json.dumps({**purchase, 'invoice_number': f'BULK-{count}-{i}'})) for i in range(count)]
+            files.append(('duplicate.json', files[0][1]))
+            with CaptureQueriesContext(connection) as queries:
+                results = import_scans(files, self.user)
+            self.assertEqual([result['status'] for result in results], ['created'] * count + ['error'])
+            return len(queries)
+
+        self.assertEqual(import_batch(2), import_batch(8))
+        self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).quantity, 10 + 5 * 10)
+        print("✅ A batch of scanned purchases is committed with a constant number of queries")
+
+    def test_import_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name, content in self.documents().items():
+                Path(directory, name).write_text(content)
+            Path(directory, 'purchase_3.json').write_text(self.documents()['purchase_1.json'])  # Duplicate invoice number
+            out = StringIO()
+            call_command('import_scans', directory, '--workers', '2', '--username', 'importer', stdout=out, stderr=StringIO())
+
+        report = {row['file']: row for row in csv.DictReader(StringIO(out.getvalue()))}
+        self.assertEqual(report['purchase_1.json']['status'], 'created')
+        self.assertEqual(report['purchase_3.json']['status'], 'error')
+        self.assertIn('already exists', report['purchase_3.json']['error'])
+        self.assertEqual(report['sale_1.json']['number'], 'IMP-S1')
+        self.assertEqual(PurchaseTransaction.objects.filter(invoice_number__startswith='IMP-P').count(), 2)
+        print("✅ import_scans imports a directory with a worker pool")
+
+class StreamingScanTests(CatalogFixtureMixin, TestCase):
+    """
+    Test the streaming import of large scan documents:
+        - The incremental parser yields the same fields and products as json.loads, whatever the read size.
+        - A purchase is committed chunk by chunk with a query count that grows with the chunks, not the lines.
+        - A bad product late in the document rolls the whole purchase back.
+        - A field after the products is rejected whether the document is streamed or not.
+        - Uploads over SCAN_STREAMING_THRESHOLD, spooled to a temporary file, are streamed by the scan views.
+    """
+    def setUp(self):
+        self.user = self.log_in('streamer')
+        self.create_catalog('Streamed', 'Stream Pharma')
+        self.create_products([f'Streamed {i}' for i in range(20)], sale_price=Decimal('2.00'))
+
+    def purchase(self, invoice_number, names, **trailing_fields):
+        return json.dumps({
+            'invoice_number': invoice_number, 'manufacturer': 'Stream Pharma', 'purchase_date': date.today().isoformat(), 'total_cost': 10 * len(names),
+            'remarks': 'Streamed delivery',
+            'products': [
+                {'product': name, 'quantity': 10, 'purchase_price': 1.25, 'expiry_date': (date.today() + timedelta(days=365)).isoformat()}
+                for name in names
+            ],
+            **trailing_fields,
+        }, indent=1).encode()
+
+    def test_parser_matches_json_loads(self):
+        content = self.purchase('STR-0', [f'Streamed {i}' for i in range(20)], note='Trailing field').replace(b'Streamed 3', 'Streamed \u00e9'.encode())
+        expected = json.loads(content)
+        for read_size in (1, 7, 4096):
+            events = list(iter_json_events(BytesIO(content), read_size=read_size))
+            self.assertEqual([event[1] for event in events if event[0] == 'item'], expected['products'])
+            self.assertEqual({event[1]: event[2] for event in events if event[0] == 'field'}, {key: value for key, value in expected.items() if key != 'products'})
+        with self.assertRaises(ScanError):
+            list(iter_json_events(BytesIO(b'{"products": [{"product": 1}')))
+        print("✅ Streaming parser matches json.loads at any read size")
+
+    def test_purchase_streamed_in_chunks(self):
+        def import_purchase(invoice_number, count):
+            with CaptureQueriesContext(connection) as queries:
+                import_streamed_scan(BytesIO(self.purchase(invoice_number, [f'Streamed {i}' for i in range(count)])), self.user, 'purchase', chunk_size=5)
+            return len(queries)
+
+        # Two and four lines fit in one chunk, eight and sixteen lines take two and four
+        self.assertEqual(import_purchase('STR-1', 2), import_purchase('STR-2', 4))
+        one_chunk, two_chunks, four_chunks = import_purchase('STR-3', 5), import_purchase('STR-4', 10), import_purchase('STR-5', 20)
+        self.assertEqual(four_chunks - two_chunks, 2 * (two_chunks - one_chunk))
+        self.assertEqual(PurchasedProduct.objects.filter(purchase_transaction__invoice_number='STR-5').count(), 20)
+
+        names = [f'Streamed {i}' for i in range(12)] + ['Unknown']
+        with self.assertRaises(ScanError):
+            import_streamed_scan(BytesIO(self.purchase('STR-6', names)), self.user, 'purchase', chunk_size=5)
+        self.assertFalse(PurchaseTransaction.objects.filter(invoice_number='STR-6').exists())
+        print("✅ Streamed purchase committed in chunks and rolled back as a whole")
+
+    def test_field_order_rule_is_the_same_for_every_size(self):
+        trailing = self.purchase('STR-8', ['Streamed 1'], note='Trailing field')
+        results = import_scans([('small.json', trailing)], self.user)
+        self.assertEqual(results[0]['error'], 'The products must be the last field of the document.')
+        with self.assertRaisesMessage(ScanError, 'The products must be the last field of the document.'):
+            import_streamed_scan(BytesIO(trailing), self.user, 'purchase')
+        self.assertFalse(PurchaseTransaction.objects.exists())
+
+        self.assertEqual(import_scans([('small.json', self.purchase('STR-9', ['Streamed 1']))], self.user)[0]['status'], 'created')
+        self.assertEqual(import_streamed_scan(BytesIO(self.purchase('STR-10', ['Streamed 1'])), self.user, 'purchase').invoice_number, 'STR-10')
+        print("✅ Small and streamed documents follow the same field order rule")
+
+    def test_views_stream_large_uploads(self):
+        with self.settings(SCAN_STREAMING_THRESHOLD=0, FILE_UPLOAD_MAX_MEMORY_SIZE=0):
+            upload = SimpleUploadedFile('large.json', self.purchase('STR-7', ['Streamed 1', 'Streamed 2']), content_type='application/json')
+            self.client.post(reverse('scan_purchase_transaction'), {'json_file': upload})
+            inventory = Inventory.objects.get(product__name='Streamed 1')
+
+            sale = json.dumps({
+                'transaction_date': date.today().isoformat(), 'discount': 1, 'cash_received': 50, 'payment_method': 'Cash',
+                'products': [{'inventory_id': inventory.id, 'quantity': 2}, {'inventory_id': inventory.id, 'quantity': 3, 'sale_price': '1.50'}],
+            }).encode()
+            self.client.post(reverse('scan_sale_transaction'), {'json_file': SimpleUploadedFile('large_sale.json', sale, content_type='application/json')})
+
+        self.assertTrue(PurchaseTransaction.objects.filter(invoice_number='STR-7').exists())
+        sale_transaction = SaleTransaction.objects.get(created_by=self.user)
+        self.assertEqual(sale_transaction.price, Decimal('8.50'))
+        self.assertEqual(sale_transaction.total, Decimal('7.50'))
+        self.assertEqual(Inventory.objects.get(pk=inventory.pk).quantity, 5)
+        print("✅ Scan views stream uploads over the threshold")
@@ -8,6 +8,7 @@ import os
 
 urlpatterns = [
     path('', views.homepage, name='homepage'),
+    path('dashboard-counts/', views.dashboard_counts, name='dashboard_counts'),
 
     path('login/', LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(), name='logout'),
@@ -36,6 +37,7 @@ urlpatterns = [
 
     path('inventory/', views.inventory_list, name='inventory_list'),
     path('inventories/delete/<int:inventory_id>/', views.delete_inventory, name='delete_inventory'),
+    path('inventory/search/', views.search_inventory, name='search_inventory'),
 
     path('purchase-transactions/', views.purchase_transaction_list, name='purchase_transaction_list'),
     path('purchase-transactions/add/', views.add_purchase_transaction, name='add_purchase_transaction'),
@@ -53,8 +55,12 @@ urlpatterns = [
     path('sale-transactions/add/', views.add_sale_transaction, name='add_sale_transaction'),
     path('sale-transactions/delete/<int:transaction_id>/', views.delete_sale_transaction, name='delete_sale_transaction'),
     path("sale-transactions/scan/", views.scan_sale_transaction, name="scan_sale_transaction"),
+    path('scans/import/', views.scan_import, name='scan_import'),
+    path('pos/sales/', views.pos_sales, name='pos_sales'),
+    path('pos/sync/', views.pos_sync, name='pos_sync'),
 
     path('get-inventory-price/<int:inventory_id>/', views.get_inventory_price, name='get_inventory_price'),
+    path('get-inventory-prices/', views.get_inventory_prices, name='get_inventory_prices'),
 
     path('reports/', views.report, name='report'),
     path('reports/pdf/', views.export_to_pdf, name='export_to_pdf'),
@@ -1,6 +1,8 @@
 # home/views.py
+import hashlib
 import json
-from datetime import date, timedelta
+import zipfile
+from datetime import date
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from io import BytesIO
@@ -16,24 +18,26 @@ from django.contrib.auth.models import User
 from django.contrib import messages
 from django.conf import settings
 from django.views.decorators.http import require_POST
-from django.db import transaction
+from django.db import transaction, IntegrityError
 from django.db.models import Sum, F, Value, ExpressionWrapper, DecimalField, ForeignKey, DateTimeField, DateField, ManyToManyField, Count
 from django.db.models.functions import Coalesce, TruncMonth
 from django.http import JsonResponse, HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.forms import modelformset_factory
 from django.urls import reverse
-from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.timezone import now
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext as _
 from django.utils import translation, timezone
-from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.http import url_has_allowed_host_and_scheme, quote_etag
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 from .models import (
     ActivityLog, Customer, 
-    Manufacturer, Category, Product, Inventory, 
+    Manufacturer, Category, Product, Inventory,
     PurchaseTransaction, PurchasedProduct, SaleTransaction, SoldProduct,
-    Discount
+    Discount, StockMovement
 )
 from .forms import (
     UserCreationForm, UserEditForm, CustomerForm, DateRangeForm,
@@ -43,64 +47,47 @@ from .forms import (
     DiscountForm
 )
 from .utils import paginate_with_query_params, add_object, edit_object, delete_object, list_objects, log_activity, make_aware_datetime, format_value
-from .decorators import superuser_required_403
+from .decorators import superuser_required_403, idempotent
+from .services import record_stock_movements, low_stock_products, expiring_inventory, commit_sale, commit_sales, commit_purchase, delete_purchase, delete_sale, resolve_sale_prices, next_document_numbers, is_document_number, InsufficientStockError
+from .scans import ScanError, validate_purchase_document, build_purchase, validate_sale_document, resolve_scan_customers, build_sale, iter_scan_files, import_scans, import_streamed_scan
+from .counters import get_expiring_count, get_low_stock_count, get_cached_inventory_prices
 
 # Homepage
 def homepage(request):
     tab = request.GET.get('tab', 'expiring')
     today = date.today()
-    cutoff_date = today + timedelta(days=30)
 
-    # Shared context
+    # Shared context. Badge counts are loaded separately from dashboard_counts.
     context = {
         'today': today,
         'active_tab': tab,
     }
 
-    # Get expiring products count
-    expiring_qs = Inventory.objects.filter(
-        expiry_date__lte=cutoff_date,
-        quantity__gt=0
-    )
-    context['expiring_count'] = expiring_qs.count()
-
-    # Get low stock products count
-    product_quantities = (
-        Inventory.objects
-        .values('product')
-        .annotate(total_quantity=Sum('quantity'))
-    )
-    quantity_map = {entry['product']: entry['total_quantity'] for entry in product_quantities}
-
-    low_stock_products = []
-    for product in Product.objects.select_related('category'):
-        total_qty = quantity_map.get(product.id, 0)
-        if total_qty < product.category.low_stock_threshold:
-            low_stock_products.append({
-                'product': product,
-                'total_quantity': total_qty,
-            })
-    context['low_stock_count'] = len(low_stock_products)
-
-    # Tab-specific pagination
+    # Only the active tab is queried, and only for the current page
     if tab == 'expiring':
         inventory = (
-            expiring_qs.select_related('product')
-            .order_by('expiry_date')
+            expiring_inventory(today)
+            .select_related('product')
+            .order_by('expiry_date', 'id')
         )
-        for item in inventory:
-            item.days_diff = (item.expiry_date - today).days
         page_obj, query = paginate_with_query_params(request, inventory, page_param='page')
         context['inventory_page_obj'] = page_obj
         context['inventory_query'] = query
 
     elif tab == 'lowstock':
-        page_obj, query = paginate_with_query_params(request, low_stock_products, page_param='lowstockpage')
+        page_obj, query = paginate_with_query_params(request, low_stock_products(), page_param='lowstockpage')
         context['low_stock_page_obj'] = page_obj
         context['low_stock_query'] = query
 
     return render(request, 'index.html', context)
 
+def dashboard_counts(request):
+    # Badge counts for the homepage tabs, fetched asynchronously from the counter cache
+    return JsonResponse({
+        'expiring_count': get_expiring_count(date.today()),
+        'low_stock_count': get_low_stock_count(),
+    })
+
 # Activity Log
 def activity_log_list(request):
     return list_objects(
@@ -264,7 +251,7 @@ def delete_category(request, category_id):
 # Product management
 def product_list(request):
     products_with_stock = Product.objects.annotate(
-        stock=Sum('inventory__quantity')
+        stock=Coalesce('stock_level__on_hand', Value(0))
     )
 
     return list_objects(
@@ -346,11 +333,23 @@ def inventory_list(request):
 
 @require_POST
 def delete_inventory(request, inventory_id):
-    inventory = get_object_or_404(Inventory, id=inventory_id)
-
-    # Instead of deleting, set quantity to 0
-    inventory.quantity = 0
-    inventory.save()
+    get_object_or_404(Inventory, id=inventory_id)
+
+    # Instead of deleting, set quantity to 0; the row is re-read under lock so the movement
+    # records what was really removed, even if a sale or purchase committed in between
+    with transaction.atomic():
+        inventory = Inventory.objects.select_for_update().get(id=inventory_id)
+        removed_quantity = inventory.quantity
+        inventory.quantity = 0
+        inventory.save(update_fields=['quantity', 'updated_at'])
+        record_stock_movements([StockMovement(
+            product_id=inventory.product_id,
+            inventory_item=inventory,
+            quantity=-removed_quantity,
+            reason='adjustment',
+            reference=f"Inventory #{inventory.id}",
+            created_by=request.user if request.user.is_authenticated else None
+        )])
 
     messages.success(request, f"Inventory '{inventory}' marked as zero quantity.")
     log_activity(user=request.user, action="deleted inventory item", additional_info=f"Inventory ID: {inventory.id}, Product: {inventory.product.name}")
@@ -409,6 +408,7 @@ def purchase_transaction_list(request):
         model_url='purchase-transactions'
     )
 
+@idempotent
 def add_purchase_transaction(request):
     PurchasedProductFormSet = modelformset_factory(
         PurchasedProduct, form=PurchasedProductForm, extra=1, can_delete=True
@@ -434,33 +434,21 @@ def add_purchase_transaction(request):
 
         # Validate the form and formset
         if form.is_valid() and formset.is_valid():
-            purchase_transaction = form.save(commit=False)
-            purchase_transaction.total_cost = 0  # Initialize total cost
-            purchase_transaction.created_by = request.user if request.user.is_authenticated else None
-
-            purchase_transaction.save()
-
-            # Save purchased products
-            for product_form in formset:
-                if product_form.cleaned_data and not product_form.cleaned_data.get('DELETE', False):
-                    purchased_product = product_form.save(commit=False)
-                    purchased_product.purchase_transaction = purchase_transaction
-                    purchased_product.purchase_price = product_form.cleaned_data.get('purchase_price', 0) or 0  # Default to 0 if missing
-                    purchased_product.save()
-
-                    purchase_transaction.total_cost += purchased_product.total_price or 0  # Handle None values safely
-
-            purchase_transaction.save()
-
-            for purchased_product in purchase_transaction.purchased_products.all():
-                inventory_item, created = Inventory.objects.get_or_create(
-                    product=purchased_product.product,
-                    expiry_date=purchased_product.expiry_date,
-                    defaults={'quantity': purchased_product.quantity}
-                )
-                if not created:
-                    inventory_item.quantity += purchased_product.quantity
-                    inventory_item.save()
+            with transaction.atomic():
+                purchase_transaction = form.save(commit=False)
+                purchase_transaction.created_by = request.user if request.user.is_authenticated else None
+
+                # Purchased products are bulk inserted and put into stock by one Inventory upsert
+                purchased_products = []
+                for product_form in formset:
+                    if product_form.cleaned_data and not product_form.cleaned_data.get('DELETE', False):
+                        purchased_product = product_form.save(commit=False)
+                        purchased_product.purchase_price = product_form.cleaned_data.get('purchase_price', 0) or 0  # Default to 0 if missing
+                        purchased_products.append(purchased_product)
+                purchase_transaction.total_cost = sum(purchased_product.total_price or 0 for purchased_product in purchased_products)
+
+                # A blank invoice number is generated by commit_purchase
+                commit_purchase(purchase_transaction, purchased_products)
 
             log_activity(
                 user=request.user,
@@ -504,70 +492,34 @@ def get_products_by_manufacturer(request):
     return JsonResponse({'error': 'No manufacturer selected'}, status=400)
 
 @require_POST
+@idempotent
 def scan_purchase_transaction(request):
     scan_form = PurchaseScanForm(request.POST, request.FILES)
     if scan_form.is_valid():
         json_file = scan_form.cleaned_data['json_file']
         try:
-            data = json.load(json_file)
-            required_fields = {"invoice_number", "manufacturer", "purchase_date", "total_cost", "products"}
-            if not required_fields.issubset(data.keys()):
-                messages.error(request, "Missing required fields in JSON.")
-                return redirect("purchase_transaction_list")
-
-            manufacturer = Manufacturer.objects.filter(name=data["manufacturer"]).first()
-            if not manufacturer:
-                messages.error(request, f"Manufacturer '{data['manufacturer']}' not found.")
-                return redirect("purchase_transaction_list")
-
-            if PurchaseTransaction.objects.filter(invoice_number=data["invoice_number"]).exists():
-                messages.error(request, f"Invoice number {data['invoice_number']} already exists.")
-                return redirect("purchase_transaction_list")
-
-            transaction = PurchaseTransaction.objects.create(
-                invoice_number=data["invoice_number"],
-                manufacturer=manufacturer,
-                purchase_date=make_aware_datetime(data["purchase_date"]),
-                total_cost=data["total_cost"],
-                remarks=data.get("remarks", ""),
-                created_by=request.user if request.user.is_authenticated else None
-            )
-
-            for item in data["products"]:
-                product = Product.objects.filter(name=item["product"], manufacturer=manufacturer).first()
-                if not product:
-                    transaction.delete()
-                    messages.error(request, f"Product not found: {item['product']}")
-                    return redirect("purchase_transaction_list")
-
-                PurchasedProduct.objects.create(
-                    purchase_transaction=transaction,
-                    product=product,
-                    batch_number=item.get("batch_number", ""),
-                    quantity=item["quantity"],
-                    purchase_price=item["purchase_price"],
-                    expiry_date=parse_date(item["expiry_date"])
-                )
+            if json_file.size > settings.SCAN_STREAMING_THRESHOLD:
+                # Too big to load whole: the products are streamed and committed in chunks, in one transaction
+                purchase_transaction = import_streamed_scan(json_file, request.user, 'purchase')
+            else:
+                # The whole document is validated and its names resolved before anything is written
+                purchase_transaction, purchased_products = build_purchase(validate_purchase_document(json.load(json_file)), request.user)
 
-            for purchased_product in transaction.purchased_products.all():
-                inventory_item, created = Inventory.objects.get_or_create(
-                    product=purchased_product.product,
-                    expiry_date=purchased_product.expiry_date,
-                    defaults={'quantity': purchased_product.quantity}
-                )
-                if not created:
-                    inventory_item.quantity += purchased_product.quantity
-                    inventory_item.save()
+                with transaction.atomic():
+                    commit_purchase(purchase_transaction, purchased_products)  # Numbers it when the invoice number is blank
 
             log_activity(
                 user=request.user,
                 action="scanned purchase transaction",
-                additional_info=f"Invoice #{transaction.invoice_number}, Manufacturer: {transaction.manufacturer.name}"
+                additional_info=f"Invoice #{purchase_transaction.invoice_number}, Manufacturer: {purchase_transaction.manufacturer.name}"
             )
             
-            messages.success(request, f"Purchase transaction {transaction.invoice_number} scanned successfully.")
+            messages.success(request, f"Purchase transaction {purchase_transaction.invoice_number} scanned successfully.")
             return redirect("purchase_transaction_list")
 
+        except ScanError as e:
+            messages.error(request, str(e))
+            return redirect("purchase_transaction_list")
         except Exception as e:
             messages.error(request, f"Error processing JSON: {str(e)}")
             return redirect("purchase_transaction_list")
@@ -577,41 +529,23 @@ def scan_purchase_transaction(request):
 
 @require_POST
 def delete_purchase_transaction(request, transaction_id):
-    transaction = get_object_or_404(PurchaseTransaction, id=transaction_id)
+    purchase_transaction = get_object_or_404(PurchaseTransaction, id=transaction_id)
 
-    # Check if inventory has enough quantity to allow deletion
-    for purchased_product in transaction.purchased_products.all():
-        try:
-            inventory = Inventory.objects.get(
-                product=purchased_product.product,
-                expiry_date=purchased_product.expiry_date
-            )
-        except Inventory.DoesNotExist:
-            messages.error(request, "Cannot delete: Matching inventory item not found.")
-            return redirect('purchase_transaction_list')
-
-        if inventory.quantity < purchased_product.quantity:
-            messages.error(request, f"Cannot delete: Insufficient inventory for {purchased_product.product.name}.")
-            return redirect('purchase_transaction_list')
-
-    # Roll back the inventory
-    for purchased_product in transaction.purchased_products.all():
-        inventory = Inventory.objects.get(
-            product=purchased_product.product,
-            expiry_date=purchased_product.expiry_date
-        )
-        inventory.quantity -= purchased_product.quantity
-        inventory.save()
-
-    transaction.delete()
+    # Stock is locked, checked and taken back out in one go
+    try:
+        with transaction.atomic():
+            delete_purchase(purchase_transaction, request.user if request.user.is_authenticated else None)
+    except InsufficientStockError as e:
+        messages.error(request, f"Cannot delete: {e}")
+        return redirect('purchase_transaction_list')
 
     log_activity(
         user=request.user,
         action="deleted purchase transaction",
-        additional_info=f"Invoice #{transaction.invoice_number}, Manufacturer: {transaction.manufacturer.name}"
+        additional_info=f"Invoice #{purchase_transaction.invoice_number}, Manufacturer: {purchase_transaction.manufacturer.name}"
     )
 
-    messages.success(request, f"Purchase transaction {transaction.invoice_number} deleted and inventory updated.")
+    messages.success(request, f"Purchase transaction {purchase_transaction.invoice_number} deleted and inventory updated.")
     return redirect('purchase_transaction_list')
 
 # Customer management
@@ -730,6 +664,7 @@ def sale_transaction_list(request):
         model_url='sale-transactions'
     )
 
+@idempotent
 def add_sale_transaction(request):
     SoldProductFormSet = modelformset_factory(
         SoldProduct, form=SoldProductForm, extra=1, can_delete=True
@@ -745,45 +680,24 @@ def add_sale_transaction(request):
                     sale_transaction = form.save(commit=False)
                     sale_transaction.transaction_date = timezone.localtime(timezone.now())
                     sale_transaction.created_by = request.user if request.user.is_authenticated else None
+                    if not sale_transaction.transaction_number:
+                        sale_transaction.transaction_number = next_document_numbers('sale', sale_transaction.transaction_date.year)[0]
                     sale_transaction.price = 0  # sum of all SoldProduct total_price
                     sale_transaction.total = 0  # total after discount
 
                     sale_transaction.save()
 
-                    # Handle sold products
-                    for sold_form in formset:
-                        if sold_form.cleaned_data and not sold_form.cleaned_data.get('DELETE', False):
-                            sold_product = sold_form.save(commit=False)
-                            sold_product.sale_transaction = sale_transaction
-                            product = sold_product.inventory_item.product
-                            sale_date = sale_transaction.transaction_date.date()
-
-                            # Check for valid discount
-                            discount_qs = product.discounts.filter(from_date__lte=sale_date, to_date__gte=sale_date)
-                            if discount_qs.exists():
-                                total_percentage = sum([d.percentage for d in discount_qs])
-                                total_percentage = min(total_percentage, Decimal('100.00'))
-                                discounted_price = product.sale_price * (Decimal('1.00') - total_percentage / Decimal('100.00'))
-                                sold_product.sale_price = round(discounted_price, 2)
-                            else:
-                                sold_product.sale_price = product.sale_price
-
-                            sold_product.save()
-
-                            # Calculate total price
-                            sale_transaction.price += sold_product.total_price or 0
-                            sale_transaction.total = sale_transaction.price - sale_transaction.discount
-
-                            # Subtract quantity from Inventory
-                            # Prevent multiple threads from overselling the same inventory item by making sure only one thread can touch that inventory row at a time.
-                            inventory_qs = Inventory.objects.select_for_update().get(id=sold_product.inventory_item.id)
-
-                            if inventory_qs.quantity < sold_product.quantity:
-                                raise Exception(f"Not enough stock for {inventory_qs.product.name} (only {inventory_qs.quantity} available)")
-
-                            inventory_qs.quantity -= sold_product.quantity
-                            inventory_qs.save()
-
+                    # Handle sold products: locked, validated and written in bulk by commit_sale
+                    lines = [
+                        (
+                            sold_form.cleaned_data['inventory_item'].id if sold_form.cleaned_data.get('inventory_item') else None,
+                            sold_form.cleaned_data['product'].id if sold_form.cleaned_data.get('product') else None,
+                            sold_form.cleaned_data['quantity']
+                        )
+                        for sold_form in formset
+                        if sold_form.cleaned_data and not sold_form.cleaned_data.get('DELETE', False)
+                    ]
+                    commit_sale(sale_transaction, lines, sale_transaction.transaction_date.date())
                     sale_transaction.save()  # update with final price
 
                     log_activity(
@@ -801,7 +715,6 @@ def add_sale_transaction(request):
                     "form": form,
                     "formset": formset,
                     "customers": Customer.objects.all(),
-                    "inventory_items": Inventory.objects.select_related('product', 'product__manufacturer').filter(quantity__gt=0),
                     "errors": form.errors,
                     "formset_errors": formset.errors,
                     "success_url": reverse("sale_transaction_list"),
@@ -811,7 +724,6 @@ def add_sale_transaction(request):
             "form": form,
             "formset": formset,
             "customers": Customer.objects.all(),
-            "inventory_items": Inventory.objects.select_related('product', 'product__manufacturer').filter(quantity__gt=0),
             "errors": form.errors,
             "formset_errors": formset.errors,            
             "success_url": reverse("sale_transaction_list"),
@@ -825,96 +737,123 @@ def add_sale_transaction(request):
         "form": form,
         "formset": formset,
         "customers": Customer.objects.all(),
-        "inventory_items": Inventory.objects.select_related('product', 'product__manufacturer').filter(quantity__gt=0),
         "errors": form.errors,
         "formset_errors": formset.errors,
         "success_url": reverse("sale_transaction_list"),
     })
 
+INVENTORY_SEARCH_LIMIT = 20  # Rows returned by the sale form typeahead when no limit is given
+INVENTORY_SEARCH_MAX_LIMIT = 50
+
+def search_inventory(request):
+    """
+    Typeahead for the sale form: returns the first in-stock inventory rows whose product name
+    starts with `q`, earliest expiry first within a product.
+
+    The prefix match is served by the product_name_prefix_idx index, so the page no longer has
+    to render every in-stock row up front.
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', INVENTORY_SEARCH_LIMIT)), 1), INVENTORY_SEARCH_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    items = Inventory.objects.filter(quantity__gt=0).select_related('product', 'product__manufacturer')
+    if query:
+        items = items.filter(product__name__istartswith=query)
+    items = list(items.order_by('product__name', 'expiry_date', 'id')[:limit])
+
+    prices = resolve_sale_prices({item.product for item in items}, timezone.localdate())  # After active discounts
+    return JsonResponse({
+        'results': [
+            {
+                'id': item.id,
+                'product_id': item.product_id,
+                'product': item.product.name,
+                'manufacturer': item.product.manufacturer.name,
+                'price': prices[item.product_id],
+                'quantity': item.quantity,
+                'expiry_date': item.expiry_date,
+            }
+            for item in items
+        ]
+    })
+
+INVENTORY_PRICES_MAX_IDS = 100  # Inventory items per batched price lookup
+
+def get_inventory_prices(request):
+    """
+    Batched price and availability lookup for the sale form: ?ids=1,2,3 returns the list price,
+    the price after active discounts and the available quantity of every item in one round trip.
+
+    Responses are cached briefly and carry an ETag, so an unchanged cart is answered with 304.
+    """
+    try:
+        inventory_ids = sorted({int(value) for value in request.GET.get('ids', '').split(',') if value.strip()})
+    except ValueError:
+        return JsonResponse({'error': 'ids must be a comma-separated list of integers'}, status=400)
+    if len(inventory_ids) > INVENTORY_PRICES_MAX_IDS:
+        return JsonResponse({'error': f'At most {INVENTORY_PRICES_MAX_IDS} ids per request'}, status=400)
+
+    prices = get_cached_inventory_prices(inventory_ids, timezone.localdate()) if inventory_ids else {}
+    body = json.dumps({
+        'items': {str(inventory_id): row for inventory_id, row in prices.items()},
+        'missing': [inventory_id for inventory_id in inventory_ids if inventory_id not in prices],
+    }, cls=DjangoJSONEncoder)
+
+    etag = quote_etag(hashlib.md5(body.encode()).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=settings.INVENTORY_PRICES_CACHE_TIMEOUT)
+    return response
+
 def get_inventory_price(request, inventory_id):
     try:
-        item = Inventory.objects.get(id=inventory_id)
+        item = Inventory.objects.select_related('product').get(id=inventory_id)
         return JsonResponse({
-            'price': item.product.sale_price,
+            'price': resolve_sale_prices([item.product], timezone.localdate())[item.product_id],  # After active discounts
             'available_quantity': item.quantity
         })
     except Inventory.DoesNotExist:
         return JsonResponse({'error': 'Not found'}, status=404)
 
 @require_POST
+@idempotent
 def scan_sale_transaction(request):
     scan_form = SaleScanForm(request.POST, request.FILES)
     if scan_form.is_valid():
         json_file = scan_form.cleaned_data['json_file']
         try:
-            data = json.load(json_file)
-            required_fields = {"transaction_number", "transaction_date", "price", "discount", "cash_received", "payment_method", "products"}
-            if not required_fields.issubset(data.keys()):
-                messages.error(request, "Missing required fields in JSON.")
-                return redirect("sale_transaction_list")
-
-            # Check if transaction number already exists
-            if SaleTransaction.objects.filter(transaction_number=data["transaction_number"]).exists():
-                messages.error(request, f"Transaction number {data['transaction_number']} already exists.")
-                return redirect("sale_transaction_list")
-
-            # Optional: customer
-            customer = None
-            if data.get("customer"):
-                customer_name = data["customer"].strip()
-                customer, created = Customer.objects.get_or_create(full_name=customer_name)
-                if created and request.user.is_authenticated:
-                    log_activity(
-                        user=request.user,
-                        action="added customer via scan",
-                        additional_info=f"Customer '{customer.full_name}' added during scanned sale transaction"
-                    )
-
-            transaction = SaleTransaction.objects.create(
-                transaction_number=data["transaction_number"],
-                customer=customer,
-                transaction_date=make_aware_datetime(data["transaction_date"]),
-                price=data["price"],
-                discount=data["discount"],
-                total=data["price"] - data["discount"],
-                cash_received=data["cash_received"],
-                payment_method=data["payment_method"],
-                remarks=data.get("remarks", ""),
-                created_by=request.user if request.user.is_authenticated else None
-            )
-
-            for item in data["products"]:
-                try:
-                    inventory = Inventory.objects.get(id=item["inventory_id"])
-                except Inventory.DoesNotExist:
-                    transaction.delete()
-                    messages.error(request, f"Inventory item with ID {item['inventory_id']} not found.")
-                    return redirect("sale_transaction_list")
-
-                if inventory.quantity < item["quantity"]:
-                    transaction.delete()
-                    messages.error(request, f"Not enough stock for {inventory.product.name}.")
-                    return redirect("sale_transaction_list")
-
-                SoldProduct.objects.create(
-                    sale_transaction=transaction,
-                    inventory_item=inventory,
-                    quantity=item["quantity"],
-                    sale_price=item.get("sale_price", inventory.product.sale_price)
-                )
+            if json_file.size > settings.SCAN_STREAMING_THRESHOLD:
+                # Too big to load whole: the products are streamed and committed in chunks, in one transaction
+                sale_transaction = import_streamed_scan(json_file, request.user, 'sale')
+            else:
+                document = validate_sale_document(json.load(json_file))
 
-                inventory.quantity -= item["quantity"]
-                inventory.save()
+                with transaction.atomic():
+                    # Stock is taken with the configured STOCK_DECREMENT_STRATEGY; prices come from the file when given
+                    customers = resolve_scan_customers([document['customer']], request.user)
+                    sale_transaction, = commit_sales([build_sale(document, customers, request.user)])
+                    if not isinstance(sale_transaction, SaleTransaction):
+                        transaction.set_rollback(True)  # Undo the new customer, if any
+                        messages.error(request, sale_transaction)
+                        return redirect("sale_transaction_list")
 
             log_activity(
                 user=request.user,
                 action="scanned sale transaction",
-                additional_info=f"Transaction #{transaction.transaction_number}"
+                additional_info=f"Transaction #{sale_transaction.transaction_number}"
             )
 
-            messages.success(request, f"Sale transaction {transaction.transaction_number} scanned successfully.")
+            messages.success(request, f"Sale transaction {sale_transaction.transaction_number} scanned successfully.")
             return redirect("sale_transaction_list")
 
+        except ScanError as e:
+            messages.error(request, str(e))
+            return redirect("sale_transaction_list")
         except Exception as e:
             messages.error(request, f"Error processing JSON: {str(e)}")
             return redirect("sale_transaction_list")
@@ -924,31 +863,239 @@ def scan_sale_transaction(request):
         return redirect("sale_transaction_list")
 
 @require_POST
-def delete_sale_transaction(request, transaction_id):
-    transaction = get_object_or_404(SaleTransaction, id=transaction_id)
+@idempotent
+def scan_import(request):
+    """
+    Batch import of scanned documents: any number of purchase and sale JSON files, or ZIP archives of them,
+    uploaded as `files`. Documents are validated up front (in SCAN_IMPORT_WORKERS processes) and committed
+    in bulk; the response reports the outcome of every file.
+    """
+    uploads = request.FILES.getlist('files')
+    if not uploads:
+        return JsonResponse({'error': 'Upload one or more JSON or ZIP files as "files"'}, status=400)
+    try:
+        files = [named_content for upload in uploads for named_content in iter_scan_files(upload)]
+    except zipfile.BadZipFile as e:
+        return JsonResponse({'error': f'Invalid ZIP archive: {e}'}, status=400)
+
+    results = import_scans(files, request.user, workers=settings.SCAN_IMPORT_WORKERS)
+    created = sum(result['status'] == 'created' for result in results)
+    return JsonResponse({'created': created, 'failed': len(results) - created, 'results': results}, status=201 if created else 400)
+
+POS_MAX_SALES_PER_REQUEST = 200  # Upper bound on the sales accepted by one pos_sales request
+
+def parse_pos_sale(data, transaction_date, user):
+    """
+    Builds an unsaved SaleTransaction and its lines from one sale of a pos_sales request.
+
+    :param data: Dict with products and optional transaction_number (generated when missing), customer_id, discount, cash_received, payment_method, remarks
+    :param transaction_date: Aware datetime of the sale
+    :param user: The user recording the sale
+    :return: (sale_transaction, lines, sale_prices) as taken by commit_sales
+    :raises ValueError: If the sale is malformed
+    """
+    products = data["products"]
+    if not isinstance(products, list) or not products:
+        raise ValueError("products must be a non-empty list")
+
+    lines, sale_prices = [], []
+    for item in products:
+        inventory_id, product_id = item.get("inventory_id"), item.get("product_id")
+        quantity = int(item["quantity"])
+        if bool(inventory_id) == bool(product_id):
+            raise ValueError("each product needs exactly one of inventory_id or product_id")
+        if quantity <= 0:
+            raise ValueError("quantity must be positive")
+        lines.append((int(inventory_id) if inventory_id else None, int(product_id) if product_id else None, quantity))
+        sale_prices.append(Decimal(str(item["sale_price"])) if item.get("sale_price") is not None else None)
+
+    payment_method = data.get("payment_method", "Cash")
+    if payment_method not in dict(SaleTransaction._meta.get_field('payment_method').choices):
+        raise ValueError(f"unknown payment_method {payment_method}")
+
+    transaction_number = str(data["transaction_number"]) if data.get("transaction_number") else ''
+    if is_document_number('sale', transaction_number):
+        raise ValueError(f"transaction_number {transaction_number} has the format reserved for automatic numbering; leave it out instead")
+
+    sale_transaction = SaleTransaction(
+        transaction_number=transaction_number,
+        customer_id=int(data["customer_id"]) if data.get("customer_id") else None,
+        transaction_date=transaction_date,
+        discount=Decimal(str(data.get("discount", 0))),
+        cash_received=Decimal(str(data.get("cash_received", 0))),
+        payment_method=payment_method,
+        remarks=data.get("remarks", ""),
+        created_by=user if user.is_authenticated else None
+    )
+    return sale_transaction, lines, sale_prices
 
-    # Check if all sold products still exist in Product table
-    for sold_product in transaction.sold_products.all():
-        product = sold_product.inventory_item.product
-        if not Product.objects.filter(id=product.id).exists():
-            messages.error(request, f"Cannot delete: Product '{product.name}' no longer exists in the system.")
-            return redirect('sale_transaction_list')
+@require_POST
+@idempotent
+def pos_sales(request):
+    """
+    JSON endpoint for point-of-sale clients: creates one sale, or many in a single request.
+
+    The body is one sale object or {"sales": [...]}. All sales are validated and written together by
+    commit_sales (one locking read, bulk inserts and one set-based stock update), with no template
+    rendering and no messages. Each sale succeeds or fails on its own; the response lists the result
+    of every sale in request order.
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    sales_data = payload.get("sales", [payload]) if isinstance(payload, dict) else None
+    if not isinstance(sales_data, list) or not sales_data:
+        return JsonResponse({'error': 'Expected a sale object or {"sales": [...]}'}, status=400)
+    if len(sales_data) > POS_MAX_SALES_PER_REQUEST:
+        return JsonResponse({'error': f'At most {POS_MAX_SALES_PER_REQUEST} sales per request'}, status=400)
+
+    now = timezone.localtime(timezone.now())
+    results = [None] * len(sales_data)
+    parsed = []
+    for index, data in enumerate(sales_data):
+        try:
+            parsed.append((index, parse_pos_sale(data, now, request.user)))
+        except (KeyError, TypeError, ValueError, ArithmeticError, AttributeError) as e:
+            results[index] = {'status': 'error', 'error': f"Invalid sale: {e}"}
+
+    customer_ids = {sale_transaction.customer_id for _, (sale_transaction, _, _) in parsed if sale_transaction.customer_id}
+    if customer_ids:
+        known_customers = set(Customer.objects.filter(id__in=customer_ids).values_list('id', flat=True))
+        for index, (sale_transaction, _, _) in parsed:
+            if sale_transaction.customer_id and sale_transaction.customer_id not in known_customers:
+                results[index] = {'status': 'error', 'error': f"Customer #{sale_transaction.customer_id} not found."}
+        parsed = [(index, sale) for index, sale in parsed if results[index] is None]
 
-    # Roll back the inventory
-    for sold_product in transaction.sold_products.all():
-        inventory = sold_product.inventory_item
-        inventory.quantity += sold_product.quantity
-        inventory.save()
+    try:
+        with transaction.atomic():
+            outcomes = commit_sales([sale for _, sale in parsed])
+            created = [outcome for outcome in outcomes if isinstance(outcome, SaleTransaction)]
+            if request.user.is_authenticated:
+                ActivityLog.objects.bulk_create([
+                    ActivityLog(user=request.user, action="added sale transaction via POS", additional_info=f"Transaction #{sale_transaction.transaction_number}")
+                    for sale_transaction in created
+                ])
+    except (InsufficientStockError, IntegrityError) as e:
+        # Optimistic stock conflict or a transaction number taken concurrently: nothing was written
+        return JsonResponse({'error': str(e)}, status=409)
+
+    for (index, _), outcome in zip(parsed, outcomes):
+        if isinstance(outcome, SaleTransaction):
+            results[index] = {
+                'status': 'created',
+                'id': outcome.id,
+                'transaction_number': outcome.transaction_number,
+                'price': str(outcome.price),
+                'total': str(outcome.total),
+            }
+        else:
+            results[index] = {'status': 'error', 'error': outcome}
+
+    return JsonResponse({'results': results}, status=201 if any(result['status'] == 'created' for result in results) else 400)
+
+POS_SYNC_CHUNK_SIZE = 500  # Offline sales applied per transaction by pos_sync
+POS_SYNC_MAX_LINES = 10000  # Upper bound on the lines of one pos_sync request, whose sales are all held in memory to be sorted
+
+def parse_offline_datetime(value):
+    # Offline sales carry the time they were captured: an ISO datetime, or a date (taken as midnight)
+    captured_at = parse_datetime(str(value))
+    if captured_at is None:
+        if parse_date(str(value)) is None:
+            raise ValueError(f"invalid transaction_date {value}")
+        return make_aware_datetime(str(value))
+    if timezone.is_naive(captured_at):
+        captured_at = timezone.make_aware(captured_at, timezone.get_current_timezone())
+    return captured_at
+
+@require_POST
+@idempotent
+def pos_sync(request):
+    """
+    Sync endpoint for sales queued at the counter while offline.
+
+    The body is NDJSON: one sale per line, as accepted by pos_sales plus its transaction_date. The sales
+    are applied in chronological order, POS_SYNC_CHUNK_SIZE at a time, each chunk in its own transaction
+    through commit_sales (bulk inserts and set-based stock updates). The response reports every line:
+    created, or a conflict (insufficient stock, duplicate transaction number) or error with its reason.
+
+    Every sale is parsed before the first one is applied, since the whole queue is sorted by time, so a
+    request is capped at POS_SYNC_MAX_LINES lines; a larger queue is sent in several requests.
+    """
+    results = []
+    parsed = []
+    for line_number, raw_line in enumerate(request, start=1):
+        if line_number > POS_SYNC_MAX_LINES:
+            return JsonResponse({'error': f'At most {POS_SYNC_MAX_LINES} lines per request'}, status=400)
+        if not raw_line.strip():
+            continue
+        try:
+            data = json.loads(raw_line)
+            sale = parse_pos_sale(data, parse_offline_datetime(data["transaction_date"]), request.user)
+        except (KeyError, TypeError, ValueError, ArithmeticError, AttributeError) as e:
+            results.append({'line': line_number, 'status': 'error', 'error': f"Invalid sale: {e}"})
+            continue
+        parsed.append((line_number, sale))
+
+    if not parsed and not results:
+        return JsonResponse({'error': 'Expected one sale per line (NDJSON)'}, status=400)
+
+    parsed.sort(key=lambda item: item[1][0].transaction_date)  # Stable, so same-time sales keep their queue order
+    customer_ids = {sale_transaction.customer_id for _, (sale_transaction, _, _) in parsed if sale_transaction.customer_id}
+    known_customers = set(Customer.objects.filter(id__in=customer_ids).values_list('id', flat=True)) if customer_ids else set()
+
+    created_count = 0
+    for start in range(0, len(parsed), POS_SYNC_CHUNK_SIZE):
+        chunk = []
+        for line_number, sale in parsed[start:start + POS_SYNC_CHUNK_SIZE]:
+            if sale[0].customer_id and sale[0].customer_id not in known_customers:
+                results.append({'line': line_number, 'transaction_number': sale[0].transaction_number, 'status': 'error', 'error': f"Customer #{sale[0].customer_id} not found."})
+            else:
+                chunk.append((line_number, sale))
+
+        try:
+            with transaction.atomic():
+                outcomes = commit_sales([sale for _, sale in chunk])
+                created = [outcome for outcome in outcomes if isinstance(outcome, SaleTransaction)]
+                if request.user.is_authenticated:
+                    ActivityLog.objects.bulk_create([
+                        ActivityLog(user=request.user, action="synced offline sale transaction", additional_info=f"Transaction #{sale_transaction.transaction_number}")
+                        for sale_transaction in created
+                    ])
+        except (InsufficientStockError, IntegrityError) as e:
+            # Optimistic stock conflict or a transaction number taken concurrently: this chunk was rolled back
+            outcomes = [f"Chunk rolled back: {e}"] * len(chunk)
+
+        for (line_number, (sale_transaction, _, _)), outcome in zip(chunk, outcomes):
+            if isinstance(outcome, SaleTransaction):
+                created_count += 1
+                results.append({'line': line_number, 'transaction_number': outcome.transaction_number, 'status': 'created', 'id': outcome.id})
+            else:
+                results.append({'line': line_number, 'transaction_number': sale_transaction.transaction_number, 'status': 'conflict', 'error': outcome})
+
+    results.sort(key=lambda result: result['line'])
+    return JsonResponse({
+        'created': created_count,
+        'failed': len(results) - created_count,
+        'results': results,
+    })
+
+@require_POST
+def delete_sale_transaction(request, transaction_id):
+    sale_transaction = get_object_or_404(SaleTransaction, id=transaction_id)
 
-    transaction.delete()
+    # Inventory rows are protected from deletion while sold products reference them, so the stock can always be put back
+    with transaction.atomic():
+        delete_sale(sale_transaction, request.user if request.user.is_authenticated else None)
 
     log_activity(
         user=request.user,
         action="deleted sale transaction",
-        additional_info=f"Transaction #{transaction.transaction_number}"
+        additional_info=f"Transaction #{sale_transaction.transaction_number}"
     )
 
-    messages.success(request, f"Sale transaction {transaction.transaction_number} deleted and inventory updated.")
+    messages.success(request, f"Sale transaction {sale_transaction.transaction_number} deleted and inventory updated.")
     return redirect('sale_transaction_list')
 
 def report(request):
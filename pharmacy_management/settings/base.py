@@ -17,6 +17,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'django.contrib.postgres',
     'django_extensions',
     'home',
     'corsheaders',
@@ -114,6 +115,48 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The homepage counters use their own alias so that it can be pointed at a shared backend
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard-counters',
+    },
+}
+
+DASHBOARD_CACHE_ALIAS = 'dashboard'
+DASHBOARD_COUNTERS_TIMEOUT = 24 * 60 * 60  # Safety net only, the counters are invalidated on writes
+INVENTORY_PRICES_CACHE_TIMEOUT = 30  # Seconds the sale form's batched price lookups are cached (discount edits show up after this)
+
+# How sales take stock out of Inventory (see home.services.decrement_stock):
+# 'pessimistic' locks the rows with SELECT ... FOR UPDATE before checking the quantities,
+# 'optimistic' reads without locking and relies on a guarded UPDATE ... WHERE quantity >= n,
+# refreshing ProductStock after commit instead of locking it for the whole sale
+STOCK_DECREMENT_STRATEGY = 'pessimistic'
+
+# Worker processes validating the documents of a batch scan upload (home.views.scan_import).
+# 1 keeps parsing in the web worker; the import_scans command defaults to one per core instead.
+SCAN_IMPORT_WORKERS = 1
+
+# Scanned documents bigger than this (in bytes) are parsed incrementally and committed in chunks
+# (see home.scans.import_streamed_scan) instead of being loaded whole with json.load.
+# Matches Django's FILE_UPLOAD_MAX_MEMORY_SIZE, above which uploads are spooled to a temporary file.
+SCAN_STREAMING_THRESHOLD = 2621440
+
+# Prefixes of the sale and purchase numbers generated when the number is left blank
+# (see home.services.next_document_numbers): <prefix>-<year>-<000001>, restarting every year
+DOCUMENT_NUMBER_PREFIXES = {'sale': 'S', 'purchase': 'P'}
+
+# Idempotency keys of submitted sales and purchases are kept this long (see purge_idempotency_keys)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# A key still marked in progress after this many seconds is presumed to belong to a crashed worker,
+# and a retry of the request takes it over (see home.decorators.idempotent)
+IDEMPOTENCY_KEY_LEASE = 60
+
 LOGIN_REDIRECT_URL = 'homepage'  # Redirect to the homepage or any other URL
 LOGOUT_REDIRECT_URL = 'homepage'  # Redirect after logout
 
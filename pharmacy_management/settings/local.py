@@ -19,3 +19,17 @@ DATABASES = {
         'PORT': config('DB_PORT'),
     }
 }
+
+STOCK_DECREMENT_STRATEGY = config('STOCK_DECREMENT_STRATEGY', default=STOCK_DECREMENT_STRATEGY)
+DOCUMENT_NUMBER_PREFIXES = {
+    'sale': config('SALE_NUMBER_PREFIX', default=DOCUMENT_NUMBER_PREFIXES['sale']),
+    'purchase': config('PURCHASE_NUMBER_PREFIX', default=DOCUMENT_NUMBER_PREFIXES['purchase']),
+}
+
+# Optional file-based dashboard cache, shared by all local worker processes
+DASHBOARD_CACHE_DIR = config('DASHBOARD_CACHE_DIR', default='')
+if DASHBOARD_CACHE_DIR:
+    CACHES['dashboard'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': DASHBOARD_CACHE_DIR,
+    }
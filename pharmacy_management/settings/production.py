@@ -33,6 +33,18 @@ STATICFILES_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
 STATIC_ROOT = os.path.join(BASE_DIR, 'pharmacy_management', 'staticfiles')
 
 
+# Gunicorn runs several worker processes, so the dashboard counters must live in a shared cache
+CACHES['dashboard'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': config('DASHBOARD_CACHE_DIR', default='/var/tmp/pharmanet/dashboard'),
+}
+
+STOCK_DECREMENT_STRATEGY = config('STOCK_DECREMENT_STRATEGY', default=STOCK_DECREMENT_STRATEGY)
+DOCUMENT_NUMBER_PREFIXES = {
+    'sale': config('SALE_NUMBER_PREFIX', default=DOCUMENT_NUMBER_PREFIXES['sale']),
+    'purchase': config('PURCHASE_NUMBER_PREFIX', default=DOCUMENT_NUMBER_PREFIXES['purchase']),
+}
+
 SECURE_HSTS_SECONDS = 31536000
 SECURE_HSTS_INCLUDE_SUBDOMAINS = True
 SECURE_HSTS_PRELOAD = True